@@ -1,15 +1,25 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, g, make_response
 from flask_cors import CORS
 import os
+import hmac
+import functools
+import threading
+import time
 from dotenv import load_dotenv
-import json
 from datetime import datetime
 
-# Import route modules
-from routes import movement, vision, scoring, report, orchestrate, agents
-
+# Load environment before route modules read it
 load_dotenv()
 
+# Import route modules
+from routes import vision, orchestrate, agents, analytics, patrol, replay, sync
+from utils.tracing import metrics, tracer, http_requests, http_latency, http_in_flight
+from utils.reserves import ReserveRegistry, UnknownReserveError
+from utils.stage_cache import content_hash
+from utils.backends import resolve_agent_mode
+from utils.admission import admission, AdmissionRejected
+from utils import trajectory
+
 app = Flask(__name__)
 
 # CORS configuration - allow frontend origins
@@ -22,16 +32,126 @@ CORS(app, origins=allowed_origins, supports_credentials=True)
 
 # Configuration
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file upload
+app.config['SERVER_TIMING'] = os.getenv('ENABLE_SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes')
 
-# Load data from local data folder
+# Load data from local data folder (hot-reloadable, see utils/datasets.py).
+# data/ is the default reserve; data/reserves/<id>/ holds any others.
 import pathlib
 DATA_DIR = pathlib.Path(__file__).parent / 'data'
 
-with open(DATA_DIR / 'wildguard_simulated_tracks.json', 'r') as f:
-    WILDLIFE_DATA = json.load(f)
+RESERVES = ReserveRegistry(DATA_DIR)
+
+def attach_reserve(reserve):
+    """Keep a reserve's anomaly model, analytics rollups and sync log in step with its dataset versions"""
+    # Learn last: the other listeners score the new version with the model it
+    # has not seen yet (prequential, like AnimalStream.run), then it is learned
+    reserve.datasets.on_swap(lambda old, new: analytics.ingest_dataset(reserve, new))
+    reserve.datasets.on_swap(lambda old, new: sync.record_dataset(reserve, new))
+    reserve.datasets.on_swap(lambda old, new: reserve.learn(new.wildlife_data))
+
+for _reserve in RESERVES.all():
+    attach_reserve(_reserve)
+
+_reserves_started = False
+_start_lock = threading.Lock()
+
+@app.before_request
+def start_reserves():
+    """
+    Load every reserve's datasets (the swap listeners then train the models
+    and fill rollups and sync logs) and start the file watchers.
+
+    Runs once, on the first request, so importing the app stays cheap.
+    """
+    global _reserves_started
+    if _reserves_started:
+        return
+    with _start_lock:
+        if not _reserves_started:
+            for reserve in RESERVES.all():
+                reserve.datasets.reload()
+            RESERVES.start_watching()
+            _reserves_started = True
+
+def current_reserve():
+    """Reserve selected by the ?reserve= query parameter (default reserve if absent)"""
+    return RESERVES.get(request.args.get('reserve'))
+
+def not_modified(etag):
+    """Whether the client's cached copy (If-None-Match) matches this ETag"""
+    return etag in request.if_none_match
 
-with open(DATA_DIR / 'hotspots.json', 'r') as f:
-    HOTSPOTS = json.load(f)
+def admin_authorized():
+    """Admin endpoints require X-Admin-Token to match ADMIN_TOKEN (disabled when unset)"""
+    expected = os.getenv('ADMIN_TOKEN')
+    provided = request.headers.get('X-Admin-Token', '')
+    return bool(expected) and hmac.compare_digest(provided, expected)
+
+# ==================== ADMISSION CONTROL ====================
+def client_id():
+    """Rate-limit identity: X-Client-Id when a dashboard sends one, else the client address"""
+    return request.headers.get('X-Client-Id') or (request.access_route[0] if request.access_route else 'unknown')
+
+def admission_controlled(cls):
+    """
+    Admit the request under admission class cls (see utils.admission).
+
+    The slot is held until the response is closed, so streamed responses
+    keep it for the whole stream.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                ticket = admission.acquire(cls, client_id())
+            except AdmissionRejected as e:
+                return jsonify({
+                    'error': 'Too many requests' if e.status == 429 else 'Server busy',
+                    'reason': e.reason,
+                    'retry_after': e.retry_after
+                }), e.status, {'Retry-After': str(e.retry_after)}
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                admission.release(ticket)
+                raise
+            response.call_on_close(lambda: admission.release(ticket))
+            return response
+        return wrapper
+    return decorator
+
+# ==================== INSTRUMENTATION ====================
+@app.before_request
+def start_request_trace():
+    g.request_start = time.perf_counter()
+    g.endpoint_label = request.url_rule.rule if request.url_rule else 'unmatched'
+    http_in_flight.inc(endpoint=g.endpoint_label)
+    tracer.start_request()
+
+@app.after_request
+def finish_request_trace(response):
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    endpoint = g.endpoint_label
+    spans = tracer.finish_request()
+    http_latency.observe(elapsed, endpoint=endpoint, method=request.method)
+    http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    if app.config['SERVER_TIMING']:
+        response.headers['Server-Timing'] = tracer.server_timing(spans, total=elapsed)
+    return response
+
+@app.teardown_request
+def release_request_trace(exc):
+    endpoint = g.pop('endpoint_label', None)
+    if endpoint is not None:
+        http_in_flight.dec(endpoint=endpoint)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Expose latency histograms, counters and gauges in Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # ==================== HEALTH CHECK ====================
 @app.route('/api/health', methods=['GET'])
@@ -39,32 +159,138 @@ def health():
     return jsonify({
         'status': 'WildGuard AI Backend Running',
         'timestamp': datetime.utcnow().isoformat(),
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'data_version': RESERVES.get().datasets.version
     }), 200
 
 # ==================== DATA ENDPOINTS ====================
+def simplification_params():
+    """
+    Map resolution requested via ?zoom=, ?tolerance= (metres), ?bbox= and ?method=.
+    Returns None when the client wants the raw tracks.
+    """
+    zoom = request.args.get('zoom', type=float)
+    tolerance = request.args.get('tolerance', type=float)
+    bbox = request.args.get('bbox')
+    if zoom is None and tolerance is None and bbox is None:
+        return None
+    if bbox is not None:
+        bbox = [float(v) for v in bbox.split(',')]
+        if len(bbox) != 4:
+            raise ValueError('bbox must be min_lon,min_lat,max_lon,max_lat')
+    if tolerance is None:
+        latitude = (bbox[1] + bbox[3]) / 2 if bbox else 0.0
+        tolerance = trajectory.tolerance_for_zoom(zoom, latitude) if zoom is not None else 0.0
+    method = request.args.get('method', 'dp')
+    if method not in ('dp', 'visvalingam'):
+        raise ValueError('method must be dp or visvalingam')
+    return {'tolerance': round(tolerance, 3), 'method': method, 'bbox': bbox}
+
 @app.route('/api/data', methods=['GET'])
 def get_data():
-    """Return all wildlife tracking data"""
-    return jsonify(WILDLIFE_DATA), 200
+    """Return wildlife tracking data, simplified for the map view when zoom/bbox are given"""
+    try:
+        reserve = current_reserve()
+        dataset = reserve.datasets.current()
+        params = simplification_params()
+        if params is None:
+            etag = dataset.etag
+        else:
+            etag = f'"{dataset.version}-{content_hash(params)[:12]}"'
+        if not_modified(etag):
+            return '', 304, {'ETag': etag}
+        if params is None:
+            return jsonify(dataset.wildlife_data.to_list()), 200, {'ETag': etag}
+        
+        simplified = orchestrate.simplify_stage(
+            dataset.wildlife_data,
+            dataset.hotspots,
+            params['tolerance'],
+            params['method'],
+            params['bbox'],
+            dataset.version,
+            reserve.cache,
+            reserve.model()
+        )
+        return jsonify(simplified), 200, {'ETag': etag}
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/data/archive', methods=['GET'])
+def get_data_archive():
+    """Return all fixes in the compact lossless archive format (see utils/trajectory.py)"""
+    dataset = current_reserve().datasets.current()
+    if not_modified(dataset.etag):
+        return '', 304, {'ETag': dataset.etag}
+    blob = trajectory.encode_fixes(dataset.wildlife_data)
+    return Response(blob, mimetype='application/octet-stream', headers={'ETag': dataset.etag})
 
 @app.route('/api/hotspots', methods=['GET'])
 def get_hotspots():
     """Return all poaching hotspots"""
-    return jsonify(HOTSPOTS), 200
+    dataset = current_reserve().datasets.current()
+    if not_modified(dataset.etag):
+        return '', 304, {'ETag': dataset.etag}
+    return jsonify(dataset.hotspots), 200, {'ETag': dataset.etag}
+
+@app.route('/api/data/version', methods=['GET'])
+def get_data_version():
+    """Return the active dataset version"""
+    reserve = current_reserve()
+    dataset = reserve.datasets.current()
+    return jsonify({
+        'reserve': reserve.id,
+        'version': dataset.version,
+        'loaded_at': dataset.loaded_at,
+        'fixes': len(dataset.wildlife_data),
+        'animals': len(dataset.tracks_by_animal),
+        'hotspots': len(dataset.hotspots_by_id)
+    }), 200, {'ETag': dataset.etag}
+
+@app.route('/api/reserves', methods=['GET'])
+def get_reserves():
+    """List monitored reserves"""
+    return jsonify({'reserves': [reserve.describe() for reserve in RESERVES.all()]}), 200
+
+@app.route('/api/admin/reload', methods=['POST'])
+def reload_data():
+    """Reload a reserve's hotspot and track files (admin only); ?wait=true blocks until live"""
+    if not admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    added = RESERVES.discover()
+    for reserve_id in added:
+        attach_reserve(RESERVES.get(reserve_id))
+        RESERVES.get(reserve_id).datasets.start_watching()
+    datasets = current_reserve().datasets
+    if request.args.get('wait', 'false').lower() in ('1', 'true', 'yes'):
+        try:
+            changed = datasets.reload()
+        except Exception as e:
+            return jsonify({'error': f'Reload failed: {str(e)}', 'version': datasets.version}), 400
+        return jsonify({'changed': changed, 'version': datasets.version, 'reserves_added': added}), 200
+    datasets.reload_async()
+    return jsonify({'status': 'reloading', 'version': datasets.version, 'reserves_added': added}), 202
 
 # ==================== ANALYSIS ENDPOINTS ====================
 @app.route('/api/movement', methods=['POST'])
 def analyze_movement():
     """Analyze movement anomalies"""
+    reserve = current_reserve()
     try:
         data = request.get_json()
-        wildlife_data = data.get('data', WILDLIFE_DATA)
+        dataset = reserve.datasets.current()
         
-        alerts = movement.detect_anomalies(wildlife_data, HOTSPOTS)
+        # Submitted data is only scored; the model learns from loaded datasets and ingest
+        if 'data' in data:
+            args = (data['data'], dataset.hotspots, None, reserve.cache, reserve.model())
+        else:
+            args = (dataset.wildlife_data, dataset.hotspots, dataset.version, reserve.cache, reserve.model())
+        alerts = orchestrate.movement_stage(*args)
+        group_alerts = orchestrate.group_stage(*args)
         
         return jsonify({
             'movement_alerts': alerts,
+            'group_alerts': group_alerts,
             'timestamp': datetime.utcnow().isoformat(),
             'total_alerts': len(alerts)
         }), 200
@@ -72,6 +298,7 @@ def analyze_movement():
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/vision', methods=['POST'])
+@admission_controlled('vision')
 def analyze_vision():
     """Analyze uploaded images for poaching signs"""
     try:
@@ -95,33 +322,101 @@ def analyze_vision():
 @app.route('/api/score', methods=['POST'])
 def compute_risk_score():
     """Compute overall risk score"""
+    reserve = current_reserve()
     try:
         data = request.get_json()
         alerts = data.get('alerts', [])
         vision_findings = data.get('vision_findings', [])
         
-        risk_data = scoring.compute_score(
-            movement_alerts=alerts,
-            vision_findings=vision_findings,
-            hotspots=HOTSPOTS
-        )
+        dataset = reserve.datasets.current()
+        risk_data = orchestrate.scoring_stage(alerts, vision_findings, dataset.hotspots, dataset.version, reserve.cache)
         
         return jsonify(risk_data), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/risk-surface', methods=['POST'])
+def compute_risk_surface():
+    """Per-cell and per-hotspot risk surface, optionally with what-if scenarios"""
+    reserve = current_reserve()
+    try:
+        data = request.get_json(silent=True) or {}
+        dataset = reserve.datasets.current()
+        if 'alerts' in data:
+            alerts = data['alerts']
+        else:
+            alerts = orchestrate.movement_stage(dataset.wildlife_data, dataset.hotspots, dataset.version,
+                                                reserve.cache, reserve.model())
+        
+        surface = orchestrate.surface_stage(
+            alerts,
+            data.get('vision_findings', []),
+            dataset.hotspots,
+            layers=data.get('layers'),
+            scenarios=data.get('scenarios'),
+            cell_km=data.get('cell_km'),
+            data_version=dataset.version,
+            cache=reserve.cache
+        )
+        
+        return jsonify(dict(surface, timestamp=datetime.utcnow().isoformat())), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/patrols', methods=['POST'])
+def plan_patrols():
+    """Plan prioritized patrol routes for ranger teams within a time budget"""
+    reserve = current_reserve()
+    try:
+        data = request.get_json(silent=True) or {}
+        dataset = reserve.datasets.current()
+        args = (dataset.wildlife_data, dataset.hotspots, dataset.version, reserve.cache, reserve.model())
+        if 'alerts' in data:
+            alerts, group_alerts = data['alerts'], data.get('group_alerts', [])
+        else:
+            alerts, group_alerts = orchestrate.movement_stage(*args), orchestrate.group_stage(*args)
+        
+        options = {
+            key: data[key]
+            for key in ('budget_minutes', 'speed_kmh', 'service_minutes', 'return_to_start', 'time_limit')
+            if key in data
+        }
+        plan = orchestrate.patrol_stage(
+            alerts,
+            dataset.hotspots,
+            group_alerts,
+            data.get('risk_cells'),
+            teams=data.get('teams') or reserve.teams or None,
+            options=options,
+            data_version=dataset.version,
+            cache=reserve.cache
+        )
+        
+        return jsonify(dict(plan, summary=patrol.summarize_plan(plan), timestamp=datetime.utcnow().isoformat())), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/api/report', methods=['POST'])
 def generate_report():
-    """Generate daily ranger briefing"""
+    """Generate daily ranger briefing (format: text, markdown, json or sms)"""
+    reserve = current_reserve()
     try:
         data = request.get_json()
         alerts = data.get('alerts', [])
         risk_score = data.get('riskScore', 0)
+        fmt = request.args.get('format') or data.get('format', 'text')
+        
+        dataset = reserve.datasets.current()
+        context = reserve.context(dataset)
+        plan = orchestrate.patrol_stage(alerts, dataset.hotspots, teams=context['patrol_teams'] or None,
+                                        data_version=dataset.version, cache=reserve.cache)
+        context['patrol_plan'] = patrol.summarize_plan(plan)
         
-        report_text = report.generate_briefing(alerts, risk_score)
+        briefing = orchestrate.report_stage(alerts, risk_score, context, reserve.cache, fmt)
         
         return jsonify({
-            'ranger_report': report_text,
+            'ranger_report': briefing,
+            'format': fmt,
             'timestamp': datetime.utcnow().isoformat()
         }), 200
     except Exception as e:
@@ -129,33 +424,170 @@ def generate_report():
 
 # ==================== ORCHESTRATION ====================
 @app.route('/api/orchestrate', methods=['POST'])
+@admission_controlled('llm')
 def run_full_pipeline():
     """Run complete analysis pipeline"""
+    reserve = current_reserve()
     try:
         data = request.get_json()
+        dataset = reserve.datasets.current()
         
         results = orchestrate.run_pipeline(
-            wildlife_data=data.get('data', WILDLIFE_DATA),
+            wildlife_data=data.get('data', dataset.wildlife_data),
             images=data.get('images', []),
-            hotspots=HOTSPOTS
+            hotspots=dataset.hotspots,
+            data_version=None if 'data' in data else dataset.version,
+            context=reserve.context(dataset),
+            cache=reserve.cache,
+            agent_mode=resolve_agent_mode(data.get('agent_mode')),
+            model=reserve.model()
         )
+        analytics.record_pipeline(reserve, results)
+        sync.record_briefing(reserve, results)
         
         return jsonify(results), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/orchestrate/batch', methods=['POST'])
+@admission_controlled('llm')
+def run_all_pipelines():
+    """Run every reserve's pipeline in parallel and return a cross-reserve summary"""
+    try:
+        data = request.get_json(silent=True) or {}
+        reserve_ids = data.get('reserves')
+        reserves = [RESERVES.get(rid) for rid in reserve_ids] if reserve_ids else RESERVES.all()
+        
+        results = orchestrate.run_all_reserves(reserves, timeout=data.get('timeout'), agent_mode=data.get('agent_mode'))
+        for reserve in reserves:
+            if reserve.id in results['cached_reserves']:
+                continue  # recorded by the batch that computed it
+            analytics.record_pipeline(reserve, results['results'].get(reserve.id, {}))
+            sync.record_briefing(reserve, results['results'].get(reserve.id, {}))
+        
+        return jsonify(results), 200
+    except UnknownReserveError as e:
+        return jsonify({'error': f'Unknown reserve: {e.args[0]}'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/backtest', methods=['POST'])
+@admission_controlled('backtest')
+def run_backtest():
+    """Replay a reserve's tracks over a threshold grid and score against labelled incidents (admin only)"""
+    if not admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    reserve = current_reserve()
+    try:
+        data = request.get_json()
+        incidents = data.get('incidents')
+        if not incidents:
+            return jsonify({'error': 'incidents (labelled incident list) required'}), 400
+        
+        dataset = reserve.datasets.current()
+        configs = replay.threshold_grid(data.get('grid', {}))
+        results = replay.run_backtest(dataset.wildlife_data, dataset.hotspots, incidents, configs, data.get('workers'))
+        
+        return jsonify(dict(results, reserve=reserve.id, timestamp=datetime.utcnow().isoformat())), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+# ==================== ANALYTICS ====================
+@app.route('/api/analytics', methods=['GET'])
+def get_analytics():
+    """Alert, distance and risk rollups (?resolution=hour|day, ?since=ISO timestamp)"""
+    reserve = current_reserve()
+    try:
+        return jsonify(analytics.get_analytics(
+            reserve,
+            resolution=request.args.get('resolution', 'hour'),
+            since=request.args.get('since')
+        )), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/ingest', methods=['POST'])
+@admission_controlled('ingest')
+def ingest_observations():
+    """Ingest new collar fixes into the analytics rollups and the device sync log"""
+    reserve = current_reserve()
+    try:
+        data = request.get_json()
+        observations = data.get('observations', [])
+        if not isinstance(observations, list):
+            return jsonify({'error': 'observations must be a list of fixes'}), 400
+        
+        ingested = sync.ingest_fixes(reserve, observations)
+        
+        return jsonify({
+            'ingested': ingested,
+            'reserve': reserve.id,
+            'timestamp': datetime.utcnow().isoformat()
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+# ==================== DEVICE SYNC ====================
+def sync_response(delta):
+    """Delta as JSON, or in the compact binary encoding for ?format=binary"""
+    if request.args.get('format') == 'binary' or request.accept_mimetypes.best == 'application/octet-stream':
+        return Response(sync.encode_delta(delta), mimetype='application/octet-stream')
+    return jsonify(delta)
+
+@app.route('/api/sync', methods=['GET'])
+def sync_changes():
+    """Fixes, alerts, hotspots and briefings changed since ?token="""
+    reserve = current_reserve()
+    try:
+        limit = request.args.get('limit', type=int)
+        return sync_response(sync.get_changes(reserve, request.args.get('token'), limit)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/sync', methods=['POST'])
+@admission_controlled('ingest')
+def sync_upload():
+    """Upload queued offline observations, then receive the delta since the device's token"""
+    reserve = current_reserve()
+    try:
+        data = sync.decode_body(request.get_data(), request.content_encoding)
+        uploaded = sync.upload_observations(reserve, data.get('device_id'), data.get('observations', []))
+        delta = sync.get_changes(reserve, data.get('token'), data.get('limit'))
+        delta['uploaded'] = uploaded
+        return sync_response(delta), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
 # ==================== AGENT ENDPOINTS ====================
 @app.route('/api/agents/analyze', methods=['POST'])
+@admission_controlled('llm')
 def analyze_with_agents():
     """Run multi-agent analysis"""
     return agents.analyze_with_agents()
 
+@app.route('/api/agents/analyze/stream', methods=['POST'])
+@admission_controlled('llm')
+def stream_agent_analysis():
+    """Stream multi-agent analysis as Server-Sent Events"""
+    return agents.stream_with_agents()
+
 @app.route('/api/agents/status', methods=['GET'])
 def get_agent_status():
     """Check agent system status"""
     return agents.get_agent_status()
 
+@app.route('/api/agents/backend', methods=['POST'])
+def set_agent_backend():
+    """Swap the agent backend at runtime (admin only)"""
+    if not admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    return agents.set_agent_backend()
+
 # ==================== ERROR HANDLERS ====================
+@app.errorhandler(UnknownReserveError)
+def unknown_reserve(error):
+    return jsonify({'error': f'Unknown reserve: {error.args[0]}'}), 404
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Endpoint not found'}), 404
@@ -166,4 +598,5 @@ def server_error(error):
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
+    start_reserves()
     app.run(host='0.0.0.0', debug=False, port=port)
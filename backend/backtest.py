@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Threshold backtesting for the WildGuard AI movement detector.
+
+Replays a reserve's archived tracks through the detector for every
+combination in a threshold grid (in parallel) and ranks the configurations
+by precision/recall against labelled incidents.
+
+Usage:
+    python backtest.py incidents.json [grid.json] [--reserve ID] [--workers N] [--max-configs N]
+
+grid.json maps threshold names (see movement.DEFAULT_THRESHOLDS) to lists
+of values; without it a small default grid is searched.
+"""
+
+import argparse
+import json
+import pathlib
+
+from routes import replay
+from utils.reserves import ReserveRegistry
+
+DEFAULT_GRID = {
+    'speed_drop_ratio': [0.1, 0.2, 0.3],
+    'immobile_speed_kmh': [0.05, 0.1, 0.2],
+    'hotspot_radius_deg': [0.005, 0.01, 0.02]
+}
+
+def main():
+    """Run the grid search and print a ranking"""
+    parser = argparse.ArgumentParser(description='Backtest movement detection thresholds')
+    parser.add_argument('incidents', help='JSON list of labelled incidents')
+    parser.add_argument('grid', nargs='?', help='JSON object of threshold -> candidate values')
+    parser.add_argument('--reserve', default=None, help='Reserve id (default reserve if omitted)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--top', type=int, default=10, help='Configurations to print')
+    parser.add_argument('--max-configs', type=int, default=None,
+                        help='Largest grid to replay (default: BACKTEST_MAX_CONFIGS)')
+    args = parser.parse_args()
+
+    with open(args.incidents, 'r') as f:
+        incidents = json.load(f)
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid, 'r') as f:
+            grid = json.load(f)
+
+    reserve = ReserveRegistry(pathlib.Path(__file__).parent / 'data').get(args.reserve)
+    dataset = reserve.datasets.current()
+    configs = replay.threshold_grid(grid, args.max_configs)
+
+    print("🧪 WildGuard AI - Threshold Backtest")
+    print("=" * 50)
+    print(f"Reserve: {reserve.name} ({len(dataset.wildlife_data)} fixes, {len(incidents)} incidents)")
+    print(f"Configurations: {len(configs)}\n")
+
+    report = replay.run_backtest(dataset.wildlife_data, dataset.hotspots, incidents, configs, args.workers)
+
+    def row(result):
+        return (f"P={result['precision']:.2f} R={result['recall']:.2f} F1={result['f1']:.2f} "
+                f"alerts={result['alerts']} ({result['alerts_per_animal_day']}/animal-day)")
+
+    print(f"📏 Current defaults: {row(report['baseline'])}\n")
+    for rank, result in enumerate(report['results'][:args.top], 1):
+        print(f"{rank:>2}. {row(result)}  {json.dumps(result['thresholds'])}")
+    print(f"\n⏱️  {report['configurations']} configurations in {report['elapsed_seconds']}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for the WildGuard AI backend.
+
+Compares a cold `import app` (agent backend deferred) with a cold import that
+also initializes the agent backend, which is what every process paid at
+startup before the backend registry made it lazy.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+RUNS = int(os.getenv('BENCH_RUNS', 5))
+
+SCENARIOS = {
+    'import app (lazy backend)': 'import app',
+    'import app + backend init (previous eager startup)': (
+        'import app\n'
+        'from utils.backends import agent_backends\n'
+        'from utils.agents import get_client\n'
+        'agent_backends.get()\n'
+        'get_client()'
+    ),
+}
+
+def time_scenario(code):
+    """Run code in a fresh interpreter and return its wall time in ms"""
+    timer = (
+        'import time\n'
+        '_start = time.perf_counter()\n'
+        f'{code}\n'
+        'print((time.perf_counter() - _start) * 1000)'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', timer],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+def main():
+    """Run all startup scenarios"""
+    print("🚀 WildGuard AI - Startup Benchmark")
+    print("=" * 50)
+    print(f"Runs per scenario: {RUNS}")
+    print(f"GROQ_API_KEY set: {bool(os.getenv('GROQ_API_KEY'))}\n")
+    
+    medians = {}
+    for name, code in SCENARIOS.items():
+        try:
+            samples = [time_scenario(code) for _ in range(RUNS)]
+        except subprocess.CalledProcessError as e:
+            print(f"❌ {name}: failed\n{e.stderr}")
+            continue
+        medians[name] = statistics.median(samples)
+        print(f"⏱️  {name}: median {medians[name]:.1f} ms (min {min(samples):.1f} ms)")
+    
+    if len(medians) == 2:
+        lazy, eager = medians.values()
+        print(f"\n📉 Startup saved by lazy backend: {eager - lazy:.1f} ms ({(1 - lazy / eager) * 100:.0f}%)")
+
+if __name__ == "__main__":
+    main()
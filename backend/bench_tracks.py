@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Memory and access benchmark for collar fix storage.
+
+Compares the list-of-dicts layout the loader used to keep in memory with
+utils.tracks.TrackStore (per-animal array columns) on a synthetic reserve,
+measuring resident size, a full speed scan, per-animal grouping and
+movement.find_anomalies (with fixed rule confidences and scored by an
+anomaly model learned from the same fixes).
+"""
+
+import gc
+import os
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from routes import movement
+from utils.online_scorer import OnlineScorer
+from utils.tracks import TrackStore, group_by_animal, column
+
+ANIMALS = int(os.getenv('BENCH_ANIMALS', 50))
+FIXES_PER_ANIMAL = int(os.getenv('BENCH_FIXES', 2000))
+RUNS = int(os.getenv('BENCH_RUNS', 3))
+
+HOTSPOTS = {'hotspots': [
+    {'id': 'HS001', 'latitude': -24.05, 'longitude': 31.55},
+    {'id': 'HS002', 'latitude': -23.95, 'longitude': 31.45}
+]}
+
+def synthetic_fixes():
+    """One collar fix every 15 minutes per animal, as the loader would parse it"""
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    records = []
+    for a in range(ANIMALS):
+        lat, lon = -24.0 + rng.uniform(-0.2, 0.2), 31.5 + rng.uniform(-0.2, 0.2)
+        for i in range(FIXES_PER_ANIMAL):
+            lat += rng.uniform(-0.002, 0.002)
+            lon += rng.uniform(-0.002, 0.002)
+            records.append({
+                'rhino_id': f'RH{a:03d}',
+                'timestamp_utc': (start + timedelta(minutes=15 * i)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'latitude': round(lat, 6),
+                'longitude': round(lon, 6),
+                'speed_kmh': round(rng.uniform(0.0, 3.0), 2),
+                'heading': rng.randrange(360)
+            })
+    return records
+
+def measure_memory(build):
+    """Bytes retained by build()"""
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, size
+
+def best_ms(fn):
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return min(samples)
+
+def scan_speeds(data):
+    return sum(record['speed_kmh'] for record in data)
+
+def scan_columns(data):
+    return sum(sum(column(track, 'speed_kmh', 0)) for track in group_by_animal(data).values())
+
+def main():
+    """Run all storage scenarios"""
+    print("🦏 WildGuard AI - Track Storage Benchmark")
+    print("=" * 50)
+    print(f"{ANIMALS} animals x {FIXES_PER_ANIMAL} fixes, best of {RUNS} runs\n")
+
+    # Both layouts are built from the same JSON text so string sharing is comparable
+    import json
+    raw = json.dumps(synthetic_fixes())
+    records, list_bytes = measure_memory(lambda: json.loads(raw))
+    store, store_bytes = measure_memory(lambda: TrackStore(json.loads(raw)))
+    assert store.to_list() == records
+
+    print(f"💾 list of dicts: {list_bytes / 1e6:.1f} MB ({list_bytes / len(records):.0f} B/fix)")
+    print(f"💾 TrackStore:    {store_bytes / 1e6:.1f} MB ({store_bytes / len(store):.0f} B/fix)")
+    print(f"📉 Memory saved: {(1 - store_bytes / list_bytes) * 100:.0f}%\n")
+
+    scorer = OnlineScorer()
+    scorer.learn_records(records)
+    model = scorer.snapshot()
+
+    scenarios = [
+        ('scan speed_kmh (dict access)', lambda d: scan_speeds(d)),
+        ('scan speed_kmh (column access)', lambda d: scan_columns(d)),
+        ('group by animal', lambda d: group_by_animal(d)),
+        ('movement.find_anomalies', lambda d: movement.find_anomalies(d, HOTSPOTS)),
+        ('movement.find_anomalies (anomaly model)', lambda d: movement.find_anomalies(d, HOTSPOTS, model=model)),
+    ]
+    for name, fn in scenarios:
+        before = best_ms(lambda: fn(records))
+        after = best_ms(lambda: fn(store))
+        print(f"⏱️  {name}: list {before:.1f} ms, TrackStore {after:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,49 @@
-from flask import jsonify, request
+from flask import jsonify, request, Response, stream_with_context
 from datetime import datetime
 
-# Try to import agents, fallback to simple agents if not available
-try:
-    from utils.agents import wildguard_agents
-    AGENTS_AVAILABLE = True
-    AGENT_TYPE = "groq"
-except ImportError:
-    try:
-        from utils.simple_agents import simple_wildguard_agents as wildguard_agents
-        AGENTS_AVAILABLE = True
-        AGENT_TYPE = "simulated"
-    except ImportError:
-        AGENTS_AVAILABLE = False
-        wildguard_agents = None
-        AGENT_TYPE = "none"
+from utils.streaming import format_sse
+from utils.backends import agent_backends, resolve_agent_mode
+from .orchestrate import agents_stage, patrol_stage
+from .patrol import summarize_plan
+
+
+def _agent_inputs(data):
+    """Extract orchestration arguments from a request body (planning routes when none are given)"""
+    hotspots = data.get('hotspots', {'hotspots': []})
+    movement_alerts = data.get('movement_alerts', [])
+    patrol_plan = data.get('patrol_plan')
+    if patrol_plan is None:
+        patrol_plan = summarize_plan(patrol_stage(movement_alerts, hotspots))
+    return {
+        'wildlife_data': data.get('wildlife_data', []),
+        'hotspots': hotspots,
+        'movement_alerts': movement_alerts,
+        'vision_findings': data.get('vision_findings', []),
+        'risk_score': data.get('risk_score', 0),
+        'patrol_plan': patrol_plan,
+        'agent_mode': resolve_agent_mode(data.get('agent_mode'))
+    }
 
 def analyze_with_agents():
     """Run multi-agent analysis pipeline"""
-    if not AGENTS_AVAILABLE:
+    wildguard_agents, agent_type = agent_backends.current()
+    if not wildguard_agents:
         return jsonify({
             'status': 'unavailable',
-            'message': f'AI agents not available (mode: {AGENT_TYPE})',
+            'message': f'AI agents not available (mode: {agent_type})',
             'timestamp': datetime.utcnow().isoformat()
         }), 503
     
     try:
         data = request.get_json()
         
-        wildlife_data = data.get('wildlife_data', [])
-        hotspots = data.get('hotspots', {'hotspots': []})
-        movement_alerts = data.get('movement_alerts', [])
-        vision_findings = data.get('vision_findings', [])
-        risk_score = data.get('risk_score', 0)
-        
-        # Run multi-agent orchestration
-        agent_results = wildguard_agents.orchestrate_agents(
-            wildlife_data=wildlife_data,
-            hotspots=hotspots,
-            movement_alerts=movement_alerts,
-            vision_findings=vision_findings,
-            risk_score=risk_score
-        )
+        # Run multi-agent orchestration (shared with /api/orchestrate via the stage cache)
+        agent_results = agents_stage(wildguard_agents, **_agent_inputs(data))
         
         return jsonify({
             'status': 'success',
             'agent_results': agent_results,
-            'agent_type': AGENT_TYPE,
+            'agent_type': agent_type,
             'timestamp': datetime.utcnow().isoformat()
         }), 200
         
@@ -57,12 +54,55 @@ def analyze_with_agents():
             'timestamp': datetime.utcnow().isoformat()
         }), 400
 
+def stream_with_agents():
+    """
+    Stream multi-agent analysis as Server-Sent Events.
+
+    Events: agent_start, token (text deltas), section (one finished agent),
+    complete (same payload as /api/agents/analyze) and error.
+    """
+    wildguard_agents, agent_type = agent_backends.current()
+    if not wildguard_agents:
+        return jsonify({
+            'status': 'unavailable',
+            'message': f'AI agents not available (mode: {agent_type})',
+            'timestamp': datetime.utcnow().isoformat()
+        }), 503
+    
+    try:
+        inputs = _agent_inputs(request.get_json())
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'error': str(e),
+            'timestamp': datetime.utcnow().isoformat()
+        }), 400
+    
+    def generate():
+        yield format_sse('start', {'agent_type': agent_type, 'timestamp': datetime.utcnow().isoformat()})
+        for event, payload in wildguard_agents.stream_agents(**inputs):
+            if event == 'complete':
+                payload = {
+                    'status': 'success',
+                    'agent_results': payload,
+                    'agent_type': agent_type,
+                    'timestamp': datetime.utcnow().isoformat()
+                }
+            yield format_sse(event, payload)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 def get_agent_status():
     """Check agent system status"""
-    if not AGENTS_AVAILABLE:
+    wildguard_agents, agent_type = agent_backends.current()
+    if not wildguard_agents:
         return jsonify({
             'status': 'unavailable',
-            'message': f'AI agents not available (mode: {AGENT_TYPE})',
+            'message': f'AI agents not available (mode: {agent_type})',
             'setup_instructions': [
                 'pip install openai',
                 'Add GROQ_API_KEY=gsk_your-key-here to .env file',
@@ -77,7 +117,7 @@ def get_agent_status():
         
         return jsonify({
             'status': 'operational',
-            'agent_type': AGENT_TYPE,
+            'agent_type': agent_type,
             'model': wildguard_agents.model,
             'agents': ['planner', 'movement_analyst', 'vision_analyst', 'risk_scorer', 'report_generator'],
             'test_response_length': len(test_response),
@@ -89,4 +129,24 @@ def get_agent_status():
             'status': 'error',
             'error': str(e),
             'timestamp': datetime.utcnow().isoformat()
-        }), 500
\ No newline at end of file
+        }), 500
+
+def set_agent_backend():
+    """Swap the agent backend at runtime (groq, simulated or auto)"""
+    try:
+        data = request.get_json()
+        agent_backends.set_backend(data.get('backend', 'auto'))
+        agent_type = agent_backends.current()[1]
+        
+        return jsonify({
+            'status': 'success',
+            'agent_type': agent_type,
+            'timestamp': datetime.utcnow().isoformat()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'error': str(e),
+            'timestamp': datetime.utcnow().isoformat()
+        }), 400
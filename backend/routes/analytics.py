@@ -0,0 +1,54 @@
+from utils.geo import nearest_hotspot
+from . import movement
+from .orchestrate import anomalies_stage, baselines_stage
+
+
+def hotspot_locator(hotspots, radius_deg=None):
+    """Return alert -> name of the nearest hotspot within the movement hotspot radius (or None)"""
+    hotspot_list = hotspots.get('hotspots', [])
+    radius_deg = radius_deg or movement.DEFAULT_THRESHOLDS['hotspot_radius_deg']
+
+    def locate(alert):
+        hotspot = nearest_hotspot(alert.get('latitude'), alert.get('longitude'), hotspot_list, radius_deg)
+        return hotspot.get('name', hotspot.get('id')) if hotspot is not None else None
+    return locate
+
+def ingest_dataset(reserve, dataset):
+    """Fold a newly loaded dataset version into the reserve's rollups"""
+    alerts = anomalies_stage(dataset.wildlife_data, dataset.hotspots, dataset.version, reserve.cache, reserve.model())
+    return {
+        'fixes': reserve.rollups.add_fixes(dataset.wildlife_data),
+        'alerts': reserve.rollups.add_alerts(alerts, hotspot_locator(dataset.hotspots))
+    }
+
+def classify_observations(reserve, observations):
+    """
+    Anomalies in new collar fixes, judged against each animal's baseline in
+    the current dataset and scored (before they are learned) by the
+    reserve's anomaly model
+    """
+    dataset = reserve.datasets.current()
+    baselines = baselines_stage(dataset.wildlife_data, dataset.version, reserve.cache)
+    return movement.find_anomalies(observations, dataset.hotspots, model=reserve.model(), baselines=baselines)
+
+def ingest_observations(reserve, observations, alerts=None):
+    """Fold a batch of new collar fixes (and the anomalies found in it) into the rollups"""
+    hotspots = reserve.datasets.current().hotspots
+    if alerts is None:
+        alerts = classify_observations(reserve, observations)
+    return {
+        'fixes': reserve.rollups.add_fixes(observations),
+        'alerts': reserve.rollups.add_alerts(alerts, hotspot_locator(hotspots))
+    }
+
+def record_pipeline(reserve, results):
+    """Append a pipeline run's risk score to the risk history"""
+    risk = results.get('risk_assessment')
+    if risk:
+        reserve.rollups.add_risk(risk['risk_score'], risk.get('threat_level'))
+
+def get_analytics(reserve, resolution='hour', since=None):
+    """Pre-aggregated analytics for the dashboard charts"""
+    snapshot = reserve.rollups.snapshot(resolution, since)
+    snapshot['reserve'] = reserve.id
+    return snapshot
@@ -1,32 +1,127 @@
 import math
-from datetime import datetime, timedelta
 
-def detect_anomalies(wildlife_data, hotspots):
+from utils.tracing import tracer
+from utils.tracks import group_by_animal, column
+from utils.geo import HOTSPOT_RADIUS_DEG, KM_PER_DEGREE
+from utils.online_scorer import track_epochs
+from utils.timestamps import parse_timestamp
+
+# Per-fix detection thresholds (tune with backtest.py)
+DEFAULT_THRESHOLDS = {
+    'speed_drop_ratio': 0.2,         # sudden stop below this fraction of baseline speed
+    'immobile_speed_kmh': 0.1,       # at or below this speed an animal counts as stationary
+    'hotspot_radius_deg': HOTSPOT_RADIUS_DEG,  # ~1km
+    # Confidence per rule (until the anomaly model has seen enough of an animal)
+    'confidence_speed_drop': 0.85,
+    'confidence_near_hotspot': 0.92,
+    'confidence_immobility': 0.88
+}
+
+def resolve_thresholds(thresholds=None):
+    """DEFAULT_THRESHOLDS overridden by any keys in thresholds"""
+    if not thresholds:
+        return DEFAULT_THRESHOLDS
+    unknown = set(thresholds) - set(DEFAULT_THRESHOLDS)
+    if unknown:
+        raise ValueError(f'Unknown thresholds: {", ".join(sorted(unknown))}')
+    return dict(DEFAULT_THRESHOLDS, **thresholds)
+
+def fix_reasons(speed, lat, lon, prev_speed, baseline, hotspot_coords, thresholds):
+    """
+    Check one fix, given as plain values, against the anomaly rules.
+    
+    prev_speed is the animal's previous speed (None for its first fix).
+    Returns (reasons, rule confidence); reasons is empty when the fix looks normal.
+    """
+    reasons = []
+    confidence = 0.0
+    
+    # Check for sudden stop
+    if speed < baseline * thresholds['speed_drop_ratio']:
+        reasons.append('sudden_speed_drop')
+        confidence = thresholds['confidence_speed_drop']
+    
+    # Check proximity to hotspots
+    radius = thresholds['hotspot_radius_deg']
+    for h_lat, h_lon in hotspot_coords:
+        if math.sqrt((lat - h_lat)**2 + (lon - h_lon)**2) < radius:
+            reasons.append('near_hotspot')
+            confidence = max(confidence, thresholds['confidence_near_hotspot'])
+    
+    # Check for prolonged immobility
+    immobile = thresholds['immobile_speed_kmh']
+    if prev_speed is not None and speed < immobile and prev_speed < immobile:
+        reasons.append('prolonged_immobility')
+        confidence = max(confidence, thresholds['confidence_immobility'])
+    
+    return reasons, confidence
+
+def _alert(rid, timestamp, lat, lon, speed, reasons, confidence):
+    return {
+        'rhino_id': rid,
+        'timestamp': timestamp,
+        'latitude': lat,
+        'longitude': lon,
+        'observed_metric': f'speed_kmh={speed}',
+        'reason': reasons,
+        'confidence': round(confidence, 2)
+    }
+
+def classify_fix(track, prev_speed, baseline, hotspot_coords, thresholds):
+    """
+    Check one fix (dict or FixView) against the anomaly rules.
+    
+    Returns the alert dict, or None when the fix looks normal.
+    """
+    speed = track.get('speed_kmh', 0)
+    lat = track.get('latitude')
+    lon = track.get('longitude')
+    reasons, confidence = fix_reasons(speed, lat, lon, prev_speed, baseline, hotspot_coords, thresholds)
+    if not reasons:
+        return None
+    return _alert(track.get('rhino_id'), track.get('timestamp_utc'), lat, lon, speed, reasons, confidence)
+
+# Coordinated (multi-animal) disturbance detection
+GROUP_RADIUS_KM = 1.0
+GROUP_WINDOW_MINUTES = 30
+GROUP_MIN_ANIMALS = 2
+MAX_ALERTS = 10
+
+def animal_baselines(wildlife_data, thresholds=None):
+    """rhino_id -> mean moving speed, the reference for sudden stops"""
+    thresholds = resolve_thresholds(thresholds)
+    baselines = {}
+    for rid, tracks in group_by_animal(wildlife_data).items():
+        speeds = column(tracks, 'speed_kmh', 0)
+        valid_speeds = [s for s in speeds if s > thresholds['immobile_speed_kmh']]
+        baselines[rid] = sum(valid_speeds) / len(valid_speeds) if valid_speeds else 1.0
+    return baselines
+
+@tracer.traced('movement.find_anomalies')
+def find_anomalies(wildlife_data, hotspots, thresholds=None, model=None, baselines=None):
     """
-    Detect movement anomalies indicating potential poaching.
+    Detect every movement anomaly indicating potential poaching.
     
     Anomalies:
     - Sudden speed drops (< 20% baseline)
     - No movement for > 2 hours
     - Clustering near hotspots
     - Erratic direction changes
+    
+    thresholds overrides DEFAULT_THRESHOLDS. baselines (rhino_id -> speed)
+    replaces the per-batch baseline, e.g. to judge a small batch of new
+    fixes against each animal's history. model (a reserve's
+    utils.online_scorer.ModelSnapshot) replaces the fixed rule confidences
+    with calibrated ones; scoring never changes it.
     """
+    thresholds = resolve_thresholds(thresholds)
     alerts = []
     
-    # Group by rhino
-    rhino_tracks = {}
-    for record in wildlife_data:
-        rid = record.get('rhino_id')
-        if rid not in rhino_tracks:
-            rhino_tracks[rid] = []
-        rhino_tracks[rid].append(record)
+    # Group by rhino (prebuilt for a TrackStore)
+    rhino_tracks = group_by_animal(wildlife_data)
     
-    # Compute baseline per rhino
-    baselines = {}
-    for rid, tracks in rhino_tracks.items():
-        speeds = [t.get('speed_kmh', 0) for t in tracks]
-        valid_speeds = [s for s in speeds if s > 0.1]
-        baselines[rid] = sum(valid_speeds) / len(valid_speeds) if valid_speeds else 1.0
+    # Compute baseline per rhino (known baselines win over this batch's)
+    baselines = dict(animal_baselines(wildlife_data, thresholds), **(baselines or {}))
     
     # Detect anomalies
     hotspot_coords = [(h['latitude'], h['longitude']) for h in hotspots.get('hotspots', [])]
@@ -34,48 +129,126 @@ def detect_anomalies(wildlife_data, hotspots):
     for rid, tracks in rhino_tracks.items():
         baseline = baselines.get(rid, 1.0)
         
-        for i, track in enumerate(tracks):
-            speed = track.get('speed_kmh', 0)
-            lat = track.get('latitude')
-            lon = track.get('longitude')
-            timestamp = track.get('timestamp_utc')
-            
-            anomaly_detected = False
-            reasons = []
-            confidence = 0.0
-            
-            # Check for sudden stop
-            if speed < baseline * 0.2:
-                anomaly_detected = True
-                reasons.append('sudden_speed_drop')
-                confidence = 0.85
-            
-            # Check proximity to hotspots
-            for h_lat, h_lon in hotspot_coords:
-                dist = math.sqrt((lat - h_lat)**2 + (lon - h_lon)**2)
-                if dist < 0.01:  # ~1km
-                    anomaly_detected = True
-                    reasons.append('near_hotspot')
-                    confidence = max(confidence, 0.92)
-            
-            # Check for prolonged immobility
-            if i > 0 and speed < 0.1:
-                prev_speed = tracks[i-1].get('speed_kmh', 0)
-                if prev_speed < 0.1:
-                    anomaly_detected = True
-                    reasons.append('prolonged_immobility')
-                    confidence = max(confidence, 0.88)
-            
-            if anomaly_detected:
-                alerts.append({
-                    'rhino_id': rid,
-                    'timestamp': timestamp,
-                    'latitude': lat,
-                    'longitude': lon,
-                    'observed_metric': f'speed_kmh={speed}',
-                    'reason': reasons,
-                    'confidence': round(confidence, 2)
-                })
-    
-    # Return top 10 most confident alerts
-    return sorted(alerts, key=lambda x: x['confidence'], reverse=True)[:10]
\ No newline at end of file
+        # Read each column once; only hits touch the individual fixes
+        speeds = column(tracks, 'speed_kmh', 0)
+        lats = column(tracks, 'latitude')
+        lons = column(tracks, 'longitude')
+        hits = {}
+        prev_speed = None
+        for i, (speed, lat, lon) in enumerate(zip(speeds, lats, lons)):
+            reasons, confidence = fix_reasons(speed, lat, lon, prev_speed, baseline, hotspot_coords, thresholds)
+            prev_speed = speed
+            if reasons:
+                alert = _alert(rid, tracks[i].get('timestamp_utc'), lat, lon, speed, reasons, confidence)
+                alerts.append(alert)
+                hits[i] = alert
+        
+        # Replace the fixed rule confidences with the anomaly model's
+        if model is not None and hits:
+            confidences = model.score(rid, lats, lons, track_epochs(tracks), speeds,
+                                      {i: alert['reason'] for i, alert in hits.items()}, thresholds)
+            for i, alert in hits.items():
+                alert['confidence'] = confidences[i]
+    
+    return alerts
+
+def top_alerts(alerts, limit=MAX_ALERTS):
+    """Most confident alerts first"""
+    return sorted(alerts, key=lambda x: x['confidence'], reverse=True)[:limit]
+
+@tracer.traced('movement.detect_anomalies')
+def detect_anomalies(wildlife_data, hotspots, model=None):
+    """Return the top 10 most confident movement anomalies"""
+    return top_alerts(find_anomalies(wildlife_data, hotspots, model=model))
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+@tracer.traced('movement.detect_group_anomalies')
+def detect_group_anomalies(alerts, radius_km=GROUP_RADIUS_KM, window_minutes=GROUP_WINDOW_MINUTES,
+                           min_animals=GROUP_MIN_ANIMALS):
+    """
+    Find clusters of simultaneous anomalies across different animals.
+    
+    Anomalies are hashed into (time bucket, grid cell) keys sized to the
+    window and radius, so each one is only compared with anomalies in the 27
+    neighbouring keys instead of every other anomaly. Linked anomalies
+    (different animals, within radius_km and window_minutes) are merged with
+    union-find; every cluster spanning at least min_animals animals becomes
+    one group alert.
+    """
+    points = []
+    for alert in alerts:
+        try:
+            points.append((alert, parse_timestamp(alert['timestamp'])))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            continue
+    if len(points) < min_animals:
+        return []
+    
+    # Local equirectangular projection around the mean latitude (km)
+    ref_lat = sum(alert['latitude'] for alert, _ in points) / len(points)
+    km_per_lon = KM_PER_DEGREE * math.cos(math.radians(ref_lat))
+    window = window_minutes * 60
+    coords = []
+    grid = {}
+    for idx, (alert, t) in enumerate(points):
+        x, y = alert['longitude'] * km_per_lon, alert['latitude'] * KM_PER_DEGREE
+        key = (int(t // window), int(x // radius_km), int(y // radius_km))
+        coords.append((x, y, t, key))
+        grid.setdefault(key, []).append(idx)
+    
+    parent = list(range(len(points)))
+    for i, (x, y, t, (tb, cx, cy)) in enumerate(coords):
+        rid = points[i][0]['rhino_id']
+        for dt in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for j in grid.get((tb + dt, cx + dx, cy + dy), ()):
+                        if j <= i or points[j][0]['rhino_id'] == rid:
+                            continue
+                        xj, yj, tj, _ = coords[j]
+                        if abs(t - tj) <= window and math.hypot(x - xj, y - yj) <= radius_km:
+                            ri, rj = _find(parent, i), _find(parent, j)
+                            if ri != rj:
+                                parent[rj] = ri
+    
+    clusters = {}
+    for i in range(len(points)):
+        clusters.setdefault(_find(parent, i), []).append(i)
+    
+    groups = []
+    for members in clusters.values():
+        animals = {}
+        for i in members:
+            alert = points[i][0]
+            animals[alert['rhino_id']] = max(animals.get(alert['rhino_id'], 0.0), alert['confidence'])
+        if len(animals) < min_animals:
+            continue
+        # Independent evidence from several animals compounds
+        miss = 1.0
+        for confidence in animals.values():
+            miss *= 1.0 - confidence
+        first = min(members, key=lambda i: points[i][1])
+        last = max(members, key=lambda i: points[i][1])
+        reasons = set()
+        for i in members:
+            reason = points[i][0]['reason']
+            reasons.update(reason if isinstance(reason, list) else [reason])
+        groups.append({
+            'type': 'coordinated_disturbance',
+            'animals': sorted(animals),
+            'animal_count': len(animals),
+            'alert_count': len(members),
+            'latitude': round(sum(points[i][0]['latitude'] for i in members) / len(members), 6),
+            'longitude': round(sum(points[i][0]['longitude'] for i in members) / len(members), 6),
+            'start': points[first][0]['timestamp'],
+            'end': points[last][0]['timestamp'],
+            'reason': sorted(reasons),
+            'confidence': round(min(1.0 - miss, 0.99), 2)
+        })
+    
+    return sorted(groups, key=lambda g: (g['animal_count'], g['confidence']), reverse=True)
\ No newline at end of file
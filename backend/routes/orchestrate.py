@@ -1,66 +1,421 @@
-from . import movement, scoring, report
-
-# Try to import agents, fallback to simple agents if not available
-try:
-    from utils.agents import wildguard_agents
-    AGENTS_AVAILABLE = True
-    AGENT_TYPE = "groq"
-except ImportError:
-    try:
-        from utils.simple_agents import simple_wildguard_agents as wildguard_agents
-        AGENTS_AVAILABLE = True
-        AGENT_TYPE = "simulated"
-    except ImportError:
-        AGENTS_AVAILABLE = False
-        wildguard_agents = None
-        AGENT_TYPE = "none"
-
-def run_pipeline(wildlife_data, images, hotspots):
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime
+
+from . import movement, scoring, report, patrol
+from utils.tracing import tracer
+from utils.backends import agent_backends, resolve_agent_mode
+from utils.stage_cache import stage_cache, content_hash
+from utils import trajectory
+
+# ==================== CACHED STAGES ====================
+# Shared by the individual endpoints and run_pipeline so a dashboard refresh
+# (movement -> score -> report -> orchestrate) does each piece of work once.
+
+def _version_or_hash(value, version):
+    """Use the dataset version when the caller has one, else hash the content"""
+    return version if version is not None else content_hash(value)
+
+def _model_version(model):
+    return model.version if model is not None else None
+
+def anomalies_stage(wildlife_data, hotspots, data_version=None, cache=stage_cache, model=None):
+    """Cached movement.find_anomalies (every anomaly, before the top-N cut) scored by model"""
+    return cache.get_or_compute(
+        'anomalies',
+        [_version_or_hash(wildlife_data, data_version), _version_or_hash(hotspots, data_version),
+         _model_version(model)],
+        lambda: movement.find_anomalies(wildlife_data, hotspots, model=model)
+    )
+
+def baselines_stage(wildlife_data, data_version=None, cache=stage_cache):
+    """Cached movement.animal_baselines"""
+    return cache.get_or_compute(
+        'baselines',
+        [_version_or_hash(wildlife_data, data_version)],
+        lambda: movement.animal_baselines(wildlife_data)
+    )
+
+def movement_stage(wildlife_data, hotspots, data_version=None, cache=stage_cache, model=None):
+    """Cached top movement alerts"""
+    return cache.get_or_compute(
+        'movement',
+        [_version_or_hash(wildlife_data, data_version), _version_or_hash(hotspots, data_version),
+         _model_version(model)],
+        lambda: movement.top_alerts(anomalies_stage(wildlife_data, hotspots, data_version, cache, model))
+    )
+
+def group_stage(wildlife_data, hotspots, data_version=None, cache=stage_cache, model=None):
+    """Cached coordinated multi-animal alerts, joined over all raw anomalies"""
+    return cache.get_or_compute(
+        'groups',
+        [_version_or_hash(wildlife_data, data_version), _version_or_hash(hotspots, data_version),
+         _model_version(model)],
+        lambda: movement.detect_group_anomalies(anomalies_stage(wildlife_data, hotspots, data_version, cache,
+                                                                model))
+    )
+
+def scoring_stage(movement_alerts, vision_findings, hotspots, data_version=None, cache=stage_cache):
+    """Cached scoring.compute_score, built on the (cached) default risk surface"""
+    return cache.get_or_compute(
+        'scoring',
+        [movement_alerts, vision_findings, _version_or_hash(hotspots, data_version)],
+        lambda: scoring.compute_score(
+            movement_alerts=movement_alerts,
+            vision_findings=vision_findings,
+            hotspots=hotspots,
+            surface=surface_stage(movement_alerts, vision_findings, hotspots, include_cells=False,
+                                  data_version=data_version, cache=cache)
+        )
+    )
+
+def surface_stage(movement_alerts, vision_findings, hotspots, layers=None, scenarios=None, cell_km=None,
+                  include_cells=True, data_version=None, cache=stage_cache):
+    """Cached scoring.compute_risk_surface"""
+    return cache.get_or_compute(
+        'surface',
+        [movement_alerts, vision_findings, _version_or_hash(hotspots, data_version), layers, scenarios,
+         cell_km, include_cells],
+        lambda: scoring.compute_risk_surface(
+            movement_alerts, vision_findings, hotspots,
+            layers=layers, scenarios=scenarios, cell_km=cell_km, include_cells=include_cells
+        )
+    )
+
+def patrol_stage(movement_alerts, hotspots, group_alerts=None, risk_cells=None, teams=None, options=None,
+                 data_version=None, cache=stage_cache):
+    """Cached patrol plan over alert, group alert, hotspot and risk-cell waypoints"""
+    options = options or {}
+    return cache.get_or_compute(
+        'patrol',
+        [movement_alerts, _version_or_hash(hotspots, data_version), group_alerts, risk_cells, teams, options],
+        lambda: patrol.plan_patrols(
+            patrol.candidate_waypoints(movement_alerts, hotspots, group_alerts, risk_cells),
+            teams=teams,
+            **options
+        )
+    )
+
+def report_stage(movement_alerts, risk_score, context=None, cache=stage_cache, fmt='text', generated_at=None):
+    """report.generate_briefing with every section cached by its own inputs"""
+    def render(name, inputs):
+        return cache.get_or_compute(
+            f'report.{name}',
+            [fmt, inputs],
+            lambda: report.render_section(name, inputs, fmt)
+        )
+    return report.generate_briefing(movement_alerts, risk_score, context, fmt, generated_at, render)
+
+def agents_stage(wildguard_agents, wildlife_data, hotspots, movement_alerts, vision_findings, risk_score,
+                 patrol_plan=None, data_version=None, cache=stage_cache, agent_mode=None):
+    """Cached multi-agent orchestration (failed runs are not cached)"""
+    agent_mode = resolve_agent_mode(agent_mode)
+    return cache.get_or_compute(
+        'agents',
+        [
+            type(wildguard_agents).__name__,
+            agent_mode,
+            _version_or_hash(wildlife_data, data_version),
+            _version_or_hash(hotspots, data_version),
+            movement_alerts,
+            vision_findings,
+            risk_score,
+            patrol_plan
+        ],
+        lambda: wildguard_agents.orchestrate_agents(
+            wildlife_data=wildlife_data,
+            hotspots=hotspots,
+            movement_alerts=movement_alerts,
+            vision_findings=vision_findings,
+            risk_score=risk_score,
+            patrol_plan=patrol_plan,
+            agent_mode=agent_mode
+        ),
+        cacheable=lambda result: 'error' not in result
+    )
+
+def simplify_stage(wildlife_data, hotspots, tolerance, method='dp', bbox=None, data_version=None, cache=stage_cache,
+                   model=None):
+    """
+    Cached map-resolution tracks; fixes behind movement anomalies are always
+    kept (which fixes are anomalies does not depend on model, only their
+    confidence, so it is left out of the key)
+    """
+    def compute():
+        alerts = anomalies_stage(wildlife_data, hotspots, data_version, cache, model)
+        anomalies = {(alert['rhino_id'], alert['timestamp']) for alert in alerts}
+        with tracer.span('trajectory.simplify'):
+            return trajectory.simplify_tracks(wildlife_data, tolerance, method, anomalies, bbox)
+    return cache.get_or_compute(
+        'simplify',
+        [_version_or_hash(wildlife_data, data_version), tolerance, method, bbox],
+        compute
+    )
+
+@tracer.traced('pipeline.run')
+def run_pipeline(wildlife_data, images, hotspots, data_version=None, context=None, cache=stage_cache,
+                 agent_mode=None, model=None):
     """
     Run complete WildGuard AI analysis pipeline with agent integration.
+    
+    data_version identifies wildlife_data and hotspots when they come from the
+    dataset manager, so stage cache keys need not hash the full data.
+    context, cache and model (the anomaly model snapshot) come from the
+    reserve being analysed. agent_mode overrides AGENT_MODE (multi_call or
+    consolidated).
     """
     
     # Step 1: Movement Analysis
-    movement_alerts = movement.detect_anomalies(wildlife_data, hotspots)
+    movement_alerts = movement_stage(wildlife_data, hotspots, data_version, cache, model)
+    group_alerts = group_stage(wildlife_data, hotspots, data_version, cache, model)
     
     # Step 2: Vision Analysis (if images provided)
     vision_findings = []
     # TODO: Process images if provided
     
     # Step 3: Compute Risk Score
-    risk_data = scoring.compute_score(
-        movement_alerts=movement_alerts,
-        vision_findings=vision_findings,
-        hotspots=hotspots
-    )
+    risk_surface = surface_stage(movement_alerts, vision_findings, hotspots, include_cells=False,
+                                 data_version=data_version, cache=cache)
+    risk_data = scoring_stage(movement_alerts, vision_findings, hotspots, data_version, cache)
     
-    # Step 4: Generate Report
-    ranger_report = report.generate_briefing(
-        movement_alerts,
-        risk_data['risk_score']
+    # Step 4: Plan patrols and generate report
+    patrol_plan = patrol_stage(
+        movement_alerts, hotspots, group_alerts, risk_surface['top_cells'],
+        teams=(context or {}).get('patrol_teams') or None,
+        data_version=data_version, cache=cache
     )
+    plan_summary = patrol.summarize_plan(patrol_plan)
+    ranger_report = report_stage(movement_alerts, risk_data['risk_score'],
+                                 dict(context or {}, patrol_plan=plan_summary), cache)
     
     # Step 5: Multi-Agent Analysis (if available)
     agent_analysis = None
-    if AGENTS_AVAILABLE and wildguard_agents:
+    wildguard_agents, agent_type = agent_backends.current()
+    if wildguard_agents:
         try:
-            agent_analysis = wildguard_agents.orchestrate_agents(
-                wildlife_data=wildlife_data,
-                hotspots=hotspots,
-                movement_alerts=movement_alerts,
-                vision_findings=vision_findings,
-                risk_score=risk_data['risk_score']
-            )
+            with tracer.span('pipeline.agents'):
+                agent_analysis = agents_stage(
+                    wildguard_agents,
+                    wildlife_data,
+                    hotspots,
+                    movement_alerts,
+                    vision_findings,
+                    risk_data['risk_score'],
+                    plan_summary,
+                    data_version,
+                    cache,
+                    agent_mode
+                )
         except Exception as e:
             agent_analysis = {'error': f'Agent analysis failed: {str(e)}'}
     else:
-        agent_analysis = {'status': 'unavailable', 'message': f'AI agents not available (mode: {AGENT_TYPE})'}
+        agent_analysis = {'status': 'unavailable', 'message': f'AI agents not available (mode: {agent_type})'}
     
     return {
         'movement_alerts': movement_alerts,
+        'group_alerts': group_alerts,
         'vision_findings': vision_findings,
         'risk_assessment': risk_data,
+        'risk_surface': risk_surface,
+        'patrol_plan': patrol_plan,
         'ranger_report': ranger_report,
         'agent_analysis': agent_analysis,
         'pipeline_status': 'complete'
-    }
\ No newline at end of file
+    }
+
+# ==================== MULTI-RESERVE BATCH ====================
+def process_context():
+    """
+    Start method for worker pools: the server runs dataset watchers, SSE
+    streams and request threads, and forking a multi-threaded process can
+    copy locks held by other threads, so workers start from a clean
+    interpreter instead.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+class _WorkerPool:
+    """One generation of the shared batch pool and the number of batches using it"""
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.users = 0
+        self.hung = False
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Reserves loaded by this worker process, kept so their stage caches survive between batches
+_worker_reserves = {}
+
+def _acquire_pool():
+    """
+    Shared worker pool for one batch; processes where available, threads
+    otherwise. A pool with a hung pipeline is retired: later batches get a
+    new generation while the batches still using the old one finish.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.hung:
+            workers = int(os.getenv('RESERVE_WORKERS', min(4, os.cpu_count() or 1)))
+            try:
+                executor = ProcessPoolExecutor(max_workers=workers, mp_context=process_context())
+            except (OSError, NotImplementedError, ValueError):
+                # e.g. serverless runtimes without /dev/shm
+                executor = ThreadPoolExecutor(max_workers=workers)
+            _pool = _WorkerPool(executor)
+        _pool.users += 1
+        return _pool
+
+def _release_pool(pool, hung=False):
+    """
+    Finish a batch's use of pool. A hung pipeline cannot be cancelled, so
+    once no batch uses its pool any more the worker processes are
+    terminated (threads are left to finish on their own).
+    """
+    global _pool
+    with _pool_lock:
+        pool.users -= 1
+        pool.hung = pool.hung or hung
+        if not pool.hung or pool.users > 0:
+            return
+        if _pool is pool:
+            _pool = None
+    executor = pool.executor
+    executor.shutdown(wait=False, cancel_futures=True)
+    if isinstance(executor, ProcessPoolExecutor):
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            process.terminate()
+
+def _pipeline_for(reserve, dataset, agent_mode, model):
+    results = run_pipeline(
+        wildlife_data=dataset.wildlife_data,
+        images=[],
+        hotspots=dataset.hotspots,
+        data_version=dataset.version,
+        context=reserve.context(dataset),
+        cache=reserve.cache,
+        agent_mode=agent_mode,
+        model=model
+    )
+    results['reserve'] = reserve.describe(model)
+    return results
+
+def _run_reserve(reserve_id, name, data_dir, data_version, model, agent_mode, deadline):
+    """
+    Worker process entry point: run one reserve's pipeline on data_version,
+    scored with the parent's anomaly model snapshot (workers never load,
+    learn or save models themselves).
+    
+    deadline is wall-clock epoch seconds; work queued behind a slow reserve
+    that can no longer finish in time is skipped.
+    """
+    from utils.reserves import Reserve
+    
+    if time.time() >= deadline:
+        return {'status': 'timeout', 'error': 'Batch deadline passed before the pipeline started'}
+    reserve = _worker_reserves.get(reserve_id)
+    if reserve is None or str(reserve.data_dir) != data_dir:
+        reserve = _worker_reserves[reserve_id] = Reserve(reserve_id, name, data_dir)
+    dataset = reserve.datasets.current()
+    if dataset.version != data_version:
+        reserve.datasets.reload()
+        dataset = reserve.datasets.current()
+        if dataset.version != data_version:
+            raise RuntimeError(f'Dataset changed during the batch ({data_version} -> {dataset.version})')
+    return _pipeline_for(reserve, dataset, agent_mode, model)
+
+def summarize_reserves(results):
+    """Cross-reserve summary, highest risk first"""
+    rows = []
+    for reserve_id, result in results.items():
+        if 'risk_assessment' not in result:
+            rows.append({'reserve_id': reserve_id, 'status': result.get('status', 'error'), 'error': result.get('error')})
+            continue
+        risk = result['risk_assessment']
+        rows.append({
+            'reserve_id': reserve_id,
+            'reserve_name': result['reserve']['name'],
+            'status': 'complete',
+            'risk_score': risk['risk_score'],
+            'threat_level': risk['threat_level'],
+            'movement_alerts': len(result['movement_alerts']),
+            'group_alerts': len(result.get('group_alerts', []))
+        })
+    completed = [row for row in rows if row['status'] == 'complete']
+    return {
+        'reserves': sorted(rows, key=lambda row: -row.get('risk_score', -1)),
+        'reserves_completed': len(completed),
+        'reserves_failed': len(rows) - len(completed),
+        'total_alerts': sum(row['movement_alerts'] for row in completed),
+        'max_risk_score': max((row['risk_score'] for row in completed), default=0),
+        'critical_reserves': [row['reserve_id'] for row in completed if row['threat_level'] == 'CRITICAL']
+    }
+
+def run_all_reserves(reserves, timeout=None, agent_mode=None):
+    """
+    Run every reserve's pipeline in parallel and aggregate the results.
+    
+    Each reserve runs in its own worker, so a slow or failing reserve only
+    affects its own entry; it is reported as timeout/error after the
+    deadline while the others complete normally, and the pool is retired
+    so the hung worker does not hold its slot (its processes are stopped
+    once no other batch still uses them). A reserve whose dataset
+    and anomaly model version was already run (with the same agent_mode)
+    reuses that result from its stage cache and is listed in
+    cached_reserves.
+    """
+    timeout = timeout if timeout is not None else float(os.getenv('RESERVE_BATCH_TIMEOUT', 120))
+    agent_mode = resolve_agent_mode(agent_mode)
+    pool = _acquire_pool()
+    executor = pool.executor
+    hung = False
+    try:
+        deadline = time.monotonic() + timeout
+        results = {}
+        cached_ids = []
+        pending = {}
+        for reserve in reserves:
+            dataset = reserve.datasets.current()
+            model = reserve.model()
+            inputs = [dataset.version, model.version, agent_mode]
+            cached = reserve.cache.get('reserve_pipeline', inputs)
+            if cached is not None:
+                results[reserve.id] = cached
+                cached_ids.append(reserve.id)
+            elif isinstance(executor, ThreadPoolExecutor):
+                # Same process: run on the reserve itself so its stage cache is shared
+                pending[reserve.id] = (reserve, inputs, executor.submit(_pipeline_for, reserve, dataset, agent_mode, model))
+            else:
+                pending[reserve.id] = (reserve, inputs, executor.submit(
+                    _run_reserve, reserve.id, reserve.name, str(reserve.data_dir), dataset.version, model,
+                    agent_mode, time.time() + timeout))
+        
+        for reserve_id, (reserve, inputs, future) in pending.items():
+            remaining = max(0.0, deadline - time.monotonic())
+            try:
+                result = future.result(timeout=remaining)
+            except FutureTimeout:
+                hung = hung or not future.cancel()
+                results[reserve_id] = {'status': 'timeout', 'error': f'Pipeline exceeded {timeout:.0f}s'}
+                continue
+            except Exception as e:
+                results[reserve_id] = {'status': 'error', 'error': str(e)}
+                continue
+            if 'risk_assessment' in result and 'error' not in result.get('agent_analysis', {}):
+                reserve.cache.put('reserve_pipeline', inputs, result)
+            results[reserve_id] = result
+    finally:
+        _release_pool(pool, hung)
+    
+    results = {reserve.id: results[reserve.id] for reserve in reserves}
+    return {
+        'results': results,
+        'summary': summarize_reserves(results),
+        'cached_reserves': cached_ids,
+        'timestamp': datetime.utcnow().isoformat(),
+        'pipeline_status': 'complete'
+    }
@@ -0,0 +1,293 @@
+import math
+import os
+import time
+from utils.geo import KM_PER_DEGREE, HOTSPOT_HALF_LIFE_DAYS
+from utils.timestamps import epoch_or_none
+from utils.tracing import tracer
+
+# Patrol defaults (foot patrol over the next few hours)
+PATROL_BUDGET_MINUTES = float(os.getenv('PATROL_BUDGET_MINUTES', 240))
+PATROL_SPEED_KMH = float(os.getenv('PATROL_SPEED_KMH', 4.0))
+PATROL_SERVICE_MINUTES = float(os.getenv('PATROL_SERVICE_MINUTES', 10))
+PATROL_TIME_LIMIT = float(os.getenv('PATROL_SOLVER_TIME_LIMIT', 0.3))
+MAX_WAYPOINTS = 500
+
+HOTSPOT_PRIORITY = {'CRITICAL': 100, 'HIGH': 75, 'MEDIUM': 50, 'LOW': 25}
+
+def candidate_waypoints(alerts, hotspots, group_alerts=None, risk_cells=None):
+    """
+    Build prioritized waypoints from alerts, group alerts, hotspots and
+    (optionally) the hottest risk-surface cells. Alerts at the same spot
+    are merged so a location is visited once.
+    """
+    waypoints = {}
+
+    def add(key, kind, name, lat, lon, priority):
+        if lat is None or lon is None:
+            return
+        existing = waypoints.get(key)
+        if existing is None:
+            waypoints[key] = {'id': key, 'kind': kind, 'name': name, 'latitude': lat, 'longitude': lon,
+                              'priority': round(priority, 1)}
+        else:
+            existing['priority'] = round(max(existing['priority'], priority) + 0.1 * min(existing['priority'], priority), 1)
+
+    for group in group_alerts or []:
+        add(f"group:{group['latitude']:.4f},{group['longitude']:.4f}", 'group_alert',
+            f"{group['animal_count']} animals ({', '.join(group['animals'][:3])})",
+            group['latitude'], group['longitude'], 100 + 20 * group['animal_count'])
+    for alert in alerts:
+        add(f"alert:{alert.get('latitude', 0):.4f},{alert.get('longitude', 0):.4f}", 'alert',
+            f"{alert.get('rhino_id', 'animal')} alert {str(alert.get('timestamp', ''))[11:16]}".strip(),
+            alert.get('latitude'), alert.get('longitude'),
+            100 * alert.get('confidence', 0.5))
+
+    hotspot_list = hotspots.get('hotspots', [])
+    stamps = [t for t in (epoch_or_none(a.get('timestamp')) for a in alerts) if t is not None]
+    stamps += [t for t in (epoch_or_none(h.get('last_incident')) for h in hotspot_list) if t is not None]
+    now = max(stamps) if stamps else None
+    for hotspot in hotspot_list:
+        last = epoch_or_none(hotspot.get('last_incident'))
+        age_days = (now - last) / 86400 if now is not None and last is not None else 0.0
+        priority = HOTSPOT_PRIORITY.get(hotspot.get('risk_level'), 25) * 0.5 ** (age_days / HOTSPOT_HALF_LIFE_DAYS)
+        add(f"hotspot:{hotspot.get('id')}", 'hotspot', hotspot.get('name', hotspot.get('id')),
+            hotspot.get('latitude'), hotspot.get('longitude'), max(priority, 10))
+
+    for cell in risk_cells or []:
+        add(f"cell:{cell['row']},{cell['col']}", 'risk_cell', f"Grid cell {cell['row']}-{cell['col']}",
+            cell['latitude'], cell['longitude'], cell['risk'] * 0.5)
+
+    ranked = sorted(waypoints.values(), key=lambda w: w['priority'], reverse=True)
+    return ranked[:MAX_WAYPOINTS]
+
+def default_teams(waypoints, count=1):
+    """Without configured teams, start every team from the centroid of the waypoints"""
+    if not waypoints:
+        return []
+    lat = sum(w['latitude'] for w in waypoints) / len(waypoints)
+    lon = sum(w['longitude'] for w in waypoints) / len(waypoints)
+    return [{'id': f'team_{i + 1}', 'name': f'Team {i + 1}', 'latitude': lat, 'longitude': lon}
+            for i in range(count)]
+
+class _Problem:
+    """Travel-time matrix over team starts (first) and waypoints (after)"""
+
+    def __init__(self, teams, waypoints, speed_kmh, service_minutes):
+        self.nodes = teams + waypoints
+        self.n_teams = len(teams)
+        ref_lat = sum(n['latitude'] for n in self.nodes) / len(self.nodes)
+        km_per_lon = KM_PER_DEGREE * math.cos(math.radians(ref_lat))
+        xy = [(n['longitude'] * km_per_lon, n['latitude'] * KM_PER_DEGREE) for n in self.nodes]
+        self.minutes_per_km = 60.0 / speed_kmh
+        hypot, minutes_per_km = math.hypot, self.minutes_per_km
+        self.travel = [[hypot(ax - bx, ay - by) * minutes_per_km for bx, by in xy] for ax, ay in xy]
+        self.service = service_minutes
+        self.priority = [0.0] * self.n_teams + [w['priority'] for w in waypoints]
+
+    def km(self, a, b):
+        return self.travel[a][b] / self.minutes_per_km
+
+    def route_minutes(self, start, route, return_to_start):
+        total, prev = 0.0, start
+        for node in route:
+            total += self.travel[prev][node] + self.service
+            prev = node
+        if return_to_start and route:
+            total += self.travel[prev][start]
+        return total
+
+    def edge_extra(self, a, node, b):
+        """Extra minutes to visit node between a and b (b None: after the last stop, no return)"""
+        travel = self.travel
+        extra = travel[a][node] + self.service
+        if b is not None:
+            extra += travel[node][b] - travel[a][b]
+        return extra
+
+    def insertion_cost(self, start, route, node, return_to_start):
+        """Cheapest (extra minutes, node to insert after) for node in route; start stands for the route head"""
+        end = start if return_to_start else None
+        best, best_after = self.edge_extra(start, node, route[0] if route else end), start
+        for pos, prev in enumerate(route):
+            extra = self.edge_extra(prev, node, route[pos + 1] if pos + 1 < len(route) else end)
+            if extra < best:
+                best, best_after = extra, prev
+        return best, best_after
+
+def _two_opt(problem, start, route, return_to_start, deadline):
+    """Reverse segments while that shortens the route (stops at the deadline)"""
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        path = [start] + route + ([start] if return_to_start else [])
+        for i in range(1, len(path) - 2):
+            for j in range(i + 1, len(path) - (1 if return_to_start else 0)):
+                a, b = path[i - 1], path[i]
+                c = path[j]
+                d = path[j + 1] if j + 1 < len(path) else None
+                delta = problem.travel[a][c] - problem.travel[a][b]
+                if d is not None:
+                    delta += problem.travel[b][d] - problem.travel[c][d]
+                if delta < -1e-9:
+                    path[i:j + 1] = reversed(path[i:j + 1])
+                    improved = True
+            if time.perf_counter() >= deadline:
+                break
+        route[:] = path[1:len(path) - (1 if return_to_start else 0)]
+    return route
+
+class _Insertions:
+    """
+    Cheapest insertion of every unvisited waypoint into every route.
+
+    Inserting a waypoint x after a only replaces the edge leaving a, so
+    afterwards a waypoint's cached best for that route is still valid
+    unless it was that edge; it only has to be compared with the two new
+    edges a -> x and x -> b. Only waypoints whose best edge was broken, and
+    routes rewritten by 2-opt, are re-evaluated in full.
+    """
+
+    def __init__(self, problem, routes, unvisited, return_to_start):
+        self.problem = problem
+        self.routes = routes
+        self.return_to_start = return_to_start
+        self.best = {node: [problem.insertion_cost(t, route, node, return_to_start)
+                            for t, route in enumerate(routes)] for node in unvisited}
+
+    def insert(self, node, t, after):
+        """Put node into route t after `after` (t: at the head) and update the other waypoints' costs"""
+        problem, route = self.problem, self.routes[t]
+        pos = 0 if after == t else route.index(after) + 1
+        route.insert(pos, node)
+        del self.best[node]
+        b = route[pos + 1] if pos + 1 < len(route) else (t if self.return_to_start else None)
+        for other, costs in self.best.items():
+            extra, other_after = costs[t]
+            if other_after == after:
+                costs[t] = problem.insertion_cost(t, route, other, self.return_to_start)
+                continue
+            before_node = problem.edge_extra(after, other, node)
+            after_node = problem.edge_extra(node, other, b)
+            if before_node < extra:
+                extra, other_after = before_node, after
+            if after_node < extra:
+                extra, other_after = after_node, node
+            costs[t] = (extra, other_after)
+
+    def reset(self, t):
+        """Re-evaluate every waypoint against route t (after 2-opt rewrote it)"""
+        route = self.routes[t]
+        for other, costs in self.best.items():
+            costs[t] = self.problem.insertion_cost(t, route, other, self.return_to_start)
+
+
+def _insert_greedy(problem, insertions, used, budget):
+    """Repeatedly insert the waypoint with the best priority per added minute that fits; returns the count"""
+    inserted = 0
+    while insertions.best:
+        best = None
+        for node, costs in insertions.best.items():
+            priority = problem.priority[node]
+            for t, (extra, after) in enumerate(costs):
+                if used[t] + extra > budget:
+                    continue
+                ratio = priority / max(extra, 1e-6)
+                if best is None or ratio > best[0]:
+                    best = (ratio, node, t, after, extra)
+        if best is None:
+            break
+        _, node, t, after, extra = best
+        insertions.insert(node, t, after)
+        used[t] += extra
+        inserted += 1
+    return inserted
+
+@tracer.traced('patrol.plan_patrols')
+def plan_patrols(waypoints, teams=None, budget_minutes=None, speed_kmh=None, service_minutes=None,
+                 return_to_start=True, time_limit=None):
+    """
+    Compute prioritized patrol routes for each ranger team within a time budget.
+
+    Waypoints are inserted greedily by priority per added minute (cheapest
+    insertion position across all teams, kept up to date incrementally),
+    then each route is shortened with 2-opt and freed time is used for
+    further insertions, until nothing fits or the solver time limit is
+    reached. The first construction pass always completes; time_limit
+    bounds the improvement rounds after it.
+    """
+    budget = budget_minutes if budget_minutes is not None else PATROL_BUDGET_MINUTES
+    speed = speed_kmh or PATROL_SPEED_KMH
+    service = service_minutes if service_minutes is not None else PATROL_SERVICE_MINUTES
+    limit = time_limit if time_limit is not None else PATROL_TIME_LIMIT
+    teams = teams or default_teams(waypoints)
+    started = time.perf_counter()
+    deadline = started + limit
+
+    if not teams or not waypoints:
+        return {'routes': [], 'unassigned': waypoints, 'budget_minutes': budget,
+                'solver': {'elapsed_ms': 0.0, 'rounds': 0}}
+
+    problem = _Problem(teams, waypoints, speed, service)
+    routes = [[] for _ in teams]
+    used = [0.0] * len(teams)
+    insertions = _Insertions(problem, routes, range(problem.n_teams, len(problem.nodes)), return_to_start)
+    rounds = 0
+    # Construction always runs to completion so every team gets work; the
+    # time limit only bounds the 2-opt and re-insertion rounds after it
+    while True:
+        rounds += 1
+        inserted = _insert_greedy(problem, insertions, used, budget)
+        if (rounds > 1 and not inserted) or not insertions.best or time.perf_counter() >= deadline:
+            break
+        improved = False
+        for t, route in enumerate(routes):
+            before = list(route)
+            _two_opt(problem, t, route, return_to_start, deadline)
+            if route != before:
+                used[t] = problem.route_minutes(t, route, return_to_start)
+                insertions.reset(t)
+                improved = True
+        if not improved:
+            break
+
+    plan_routes = []
+    for t, route in enumerate(routes):
+        stops, clock, km, prev = [], 0.0, 0.0, t
+        for node in route:
+            clock += problem.travel[prev][node]
+            km += problem.km(prev, node)
+            stops.append(dict(problem.nodes[node], eta_minutes=round(clock), distance_km=round(km, 2)))
+            clock += service
+            prev = node
+        if return_to_start and route:
+            clock += problem.travel[prev][t]
+            km += problem.km(prev, t)
+        plan_routes.append({
+            'team': teams[t],
+            'waypoints': stops,
+            'distance_km': round(km, 2),
+            'duration_minutes': round(clock),
+            'priority_covered': round(sum(problem.priority[n] for n in route), 1)
+        })
+
+    unassigned = sorted((problem.nodes[n] for n in insertions.best), key=lambda w: w['priority'], reverse=True)
+    return {
+        'routes': plan_routes,
+        'unassigned': unassigned,
+        'budget_minutes': budget,
+        'solver': {'elapsed_ms': round((time.perf_counter() - started) * 1000, 1), 'rounds': rounds}
+    }
+
+def summarize_plan(plan, max_stops=5):
+    """Compact route description for briefings and prompts"""
+    lines = []
+    for route in plan.get('routes', []):
+        if not route['waypoints']:
+            continue
+        stops = ' -> '.join(w['name'] for w in route['waypoints'][:max_stops])
+        more = len(route['waypoints']) - max_stops
+        if more > 0:
+            stops += f' (+{more} more)'
+        lines.append(f"{route['team']['name']}: {stops} "
+                     f"[{route['distance_km']} km, ~{route['duration_minutes']} min]")
+    return lines
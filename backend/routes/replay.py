@@ -0,0 +1,227 @@
+import itertools
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import movement
+from .orchestrate import process_context
+from utils.geo import KM_PER_DEGREE
+from utils.online_scorer import OnlineScorer, fix_epoch
+from utils.timestamps import parse_timestamp
+from utils.tracing import tracer
+from utils.tracks import group_by_animal, epoch_column, plain_records
+
+# An alert counts as detecting an incident within this distance and time
+INCIDENT_RADIUS_KM = 1.0
+INCIDENT_WINDOW_MINUTES = 120
+# Threshold combinations one backtest may replay
+BACKTEST_MAX_CONFIGS = int(os.getenv('BACKTEST_MAX_CONFIGS', 64))
+
+class StreamingDetector:
+    """
+    Causal version of movement.find_anomalies: each fix is judged only on
+    what came before it (running baseline speed and the previous fix), as a
+    live detector would see it. Confidences come from a fresh, unpersisted
+    OnlineScorer (unless one is given), so replays are repeatable.
+    """
+
+    def __init__(self, hotspots, thresholds=None, scorer=None):
+        self.thresholds = movement.resolve_thresholds(thresholds)
+        self.hotspot_coords = [(h['latitude'], h['longitude']) for h in hotspots.get('hotspots', [])]
+        self.scorer = scorer or OnlineScorer()
+        self._state = {}  # rhino_id -> [speed_sum, speed_count, prev_speed, AnimalStream]
+
+    def observe(self, fix):
+        """Feed one fix; returns an alert or None"""
+        rid = fix.get('rhino_id')
+        epoch = fix_epoch(fix)
+        state = self._state.get(rid)
+        if state is None:
+            state = self._state[rid] = [0.0, 0, None, self.scorer.stream(rid, epoch, self.thresholds)]
+        speed = fix.get('speed_kmh', 0)
+        baseline = state[0] / state[1] if state[1] else 1.0
+        alert = movement.classify_fix(fix, state[2], baseline, self.hotspot_coords, self.thresholds)
+        confidences = state[3].run([fix.get('latitude')], [fix.get('longitude')], [epoch], [speed],
+                                   {0: alert['reason']} if alert is not None else {})
+        if alert is not None:
+            alert['confidence'] = confidences[0]
+        if speed > self.thresholds['immobile_speed_kmh']:
+            state[0] += speed
+            state[1] += 1
+        state[2] = speed
+        return alert
+
+@tracer.traced('replay.replay')
+def replay(wildlife_data, hotspots, thresholds=None, speedup=None, on_alert=None):
+    """
+    Feed archived fixes through a StreamingDetector in timestamp order.
+
+    speedup replays in accelerated real time (e.g. 3600 plays an hour per
+    second); None replays as fast as possible. on_alert(alert) is called as
+    each alert fires. Returns every alert raised.
+    """
+    detector = StreamingDetector(hotspots, thresholds)
+    fixes = sorted(
+        (f for f in plain_records(wildlife_data) if f.get('timestamp_utc')),
+        key=lambda f: f['timestamp_utc']
+    )
+    alerts = []
+    started = time.monotonic()
+    first = parse_timestamp(fixes[0]['timestamp_utc']) if fixes and speedup else None
+    for fix in fixes:
+        if speedup:
+            due = (parse_timestamp(fix['timestamp_utc']) - first) / speedup
+            delay = due - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        alert = detector.observe(fix)
+        if alert is not None:
+            alerts.append(alert)
+            if on_alert:
+                on_alert(alert)
+    return alerts
+
+def _prepare_incidents(incidents, radius_km, window):
+    """Parse incidents once into (rhino_id, earliest, latest, lat, lon, km_per_lon, radius) tuples"""
+    prepared = []
+    for incident in incidents:
+        start = parse_timestamp(incident.get('start', incident.get('timestamp')))
+        end = parse_timestamp(incident.get('end', incident.get('timestamp')))
+        prepared.append((
+            incident.get('rhino_id'), start - window, end + window,
+            incident['latitude'], incident['longitude'],
+            KM_PER_DEGREE * math.cos(math.radians(incident['latitude'])),
+            incident.get('radius_km', radius_km)
+        ))
+    return prepared
+
+def _matching_incidents(alert, prepared):
+    t = parse_timestamp(alert['timestamp'])
+    for i, (rhino_id, earliest, latest, lat, lon, km_per_lon, radius) in enumerate(prepared):
+        if rhino_id and rhino_id != alert.get('rhino_id'):
+            continue
+        if t < earliest or t > latest:
+            continue
+        dy = (alert['latitude'] - lat) * KM_PER_DEGREE
+        dx = (alert['longitude'] - lon) * km_per_lon
+        if math.hypot(dx, dy) <= radius:
+            yield i
+
+def score_alerts(alerts, incidents, wildlife_data=None, radius_km=INCIDENT_RADIUS_KM,
+                 window_minutes=INCIDENT_WINDOW_MINUTES):
+    """
+    Precision, recall and alert volume of alerts against labelled incidents.
+
+    Incidents are {'latitude', 'longitude', 'timestamp' or 'start'/'end'}
+    with optional 'rhino_id' and 'radius_km'. An alert is a true positive if
+    it falls within the radius and time window of any incident; an incident
+    is detected if at least one alert matches it.
+    """
+    prepared = _prepare_incidents(incidents, radius_km, window_minutes * 60)
+    detected = set()
+    true_positives = 0
+    for alert in alerts:
+        hits = set(_matching_incidents(alert, prepared))
+        detected |= hits
+        true_positives += bool(hits)
+    precision = true_positives / len(alerts) if alerts else 0.0
+    recall = len(detected) / len(incidents) if incidents else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+    volume = None
+    if wildlife_data:
+        grouped = group_by_animal(wildlife_data)
+        stamps = [t for track in grouped.values() for t in epoch_column(track) if t is not None]
+        animals = grouped.keys()
+        days = max((max(stamps) - min(stamps)) / 86400, 1 / 24) if stamps else 1
+        volume = round(len(alerts) / (len(animals) * days), 3)
+
+    return {
+        'alerts': len(alerts),
+        'true_positives': true_positives,
+        'incidents_detected': len(detected),
+        'incidents': len(incidents),
+        'precision': round(precision, 3),
+        'recall': round(recall, 3),
+        'f1': round(f1, 3),
+        'alerts_per_animal_day': volume
+    }
+
+def threshold_grid(spec, max_configs=None):
+    """
+    Expand {'threshold': [values, ...]} into every combination.
+
+    Values must be non-negative numbers (duplicates are dropped) and the
+    grid may hold at most max_configs (default BACKTEST_MAX_CONFIGS)
+    combinations; anything else raises ValueError.
+    """
+    max_configs = max_configs or BACKTEST_MAX_CONFIGS
+    if not isinstance(spec, dict):
+        raise ValueError('grid must map threshold names to lists of values')
+    movement.resolve_thresholds({key: None for key in spec})  # validate names
+    keys = sorted(spec)
+    axes = []
+    for key in keys:
+        values = spec[key]
+        if not isinstance(values, list) or not values:
+            raise ValueError(f'grid.{key} must be a non-empty list')
+        if not all(isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v) and v >= 0
+                   for v in values):
+            raise ValueError(f'grid.{key} values must be non-negative numbers')
+        axes.append(list(dict.fromkeys(values)))
+    combinations = math.prod(len(axis) for axis in axes)
+    if combinations > max_configs:
+        raise ValueError(f'grid has {combinations} combinations; at most {max_configs} are allowed')
+    return [dict(zip(keys, values)) for values in itertools.product(*axes)]
+
+# Worker state, sent once per worker process instead of once per configuration
+_job = {}
+
+def _init_worker(wildlife_data, hotspots, incidents):
+    _job.update(wildlife_data=wildlife_data, hotspots=hotspots, incidents=incidents)
+
+def _evaluate(thresholds):
+    alerts = replay(_job['wildlife_data'], _job['hotspots'], thresholds)
+    result = score_alerts(alerts, _job['incidents'], _job['wildlife_data'])
+    result['thresholds'] = thresholds
+    return result
+
+@tracer.traced('replay.run_backtest')
+def run_backtest(wildlife_data, hotspots, incidents, configs, workers=None):
+    """
+    Replay every threshold configuration in parallel across CPU cores and
+    rank them by F1, then by fewest alerts. workers is capped at
+    BACKTEST_WORKERS (default: CPU count) and the number of configurations.
+    """
+    max_workers = int(os.getenv('BACKTEST_WORKERS') or os.cpu_count() or 1)
+    workers = min(int(workers), max_workers) if workers else max_workers
+    workers = max(1, min(workers, len(configs)))
+    started = time.perf_counter()
+    initargs = (wildlife_data, hotspots, incidents)
+    try:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=process_context(),
+                                       initializer=_init_worker, initargs=initargs)
+    except (OSError, NotImplementedError, ValueError):
+        # e.g. serverless runtimes without /dev/shm
+        _init_worker(*initargs)
+        executor = ThreadPoolExecutor(max_workers=workers)
+    with executor:
+        results = list(executor.map(_evaluate, configs))
+
+    results.sort(key=lambda r: (-r['f1'], r['alerts']))
+    baseline = _evaluate_inline(wildlife_data, hotspots, incidents)
+    return {
+        'results': results,
+        'best': results[0] if results else None,
+        'baseline': baseline,
+        'configurations': len(configs),
+        'elapsed_seconds': round(time.perf_counter() - started, 2)
+    }
+
+def _evaluate_inline(wildlife_data, hotspots, incidents):
+    """Score the current DEFAULT_THRESHOLDS for comparison"""
+    alerts = replay(wildlife_data, hotspots)
+    result = score_alerts(alerts, incidents, wildlife_data)
+    result['thresholds'] = movement.DEFAULT_THRESHOLDS
+    return result
@@ -1,103 +1,255 @@
 from datetime import datetime
 
-def generate_briefing(alerts, risk_score):
+from utils.tracing import tracer
+
+# A briefing is a header, independently rendered sections and a footer. Each
+# section is a pure function of its own inputs, so callers can cache them by
+# content (see orchestrate.report_stage); only the header and footer carry
+# the issue time and are rendered on every call.
+SECTIONS = ('summary', 'incidents', 'risk', 'patrols', 'environment')
+FORMATS = ('text', 'markdown', 'json', 'sms')
+MAX_INCIDENTS = 5
+SMS_MAX_INCIDENTS = 3
+SMS_MAX_CHARS = 480  # three concatenated SMS segments
+
+RULE = '=' * 80
+
+def _format_reasons(reason):
+    """Render an alert reason (string or list of reasons) as title-cased text"""
+    reasons = reason if isinstance(reason, list) else [reason]
+    return ', '.join(r.replace('_', ' ').title() for r in reasons)
+
+def threat_level(risk_score):
+    return 'CRITICAL' if risk_score >= 70 else 'HIGH' if risk_score >= 40 else 'MEDIUM'
+
+def section_inputs(alerts, risk_score, context=None):
+    """Inputs of every section, keyed by section name"""
+    context = context or {}
+    reserve_name = context.get('reserve_name', 'Protected Reserve')
+    hotspot_names = context.get('priority_hotspots') or ['known hotspots']
+    level = threat_level(risk_score)
+    return {
+        'summary': {'reserve_name': reserve_name, 'alert_count': len(alerts), 'threat_level': level},
+        'incidents': {
+            'total': len(alerts),
+            'alerts': [
+                {key: alert.get(key) for key in ('rhino_id', 'timestamp', 'latitude', 'longitude', 'reason', 'confidence')}
+                for alert in alerts[:MAX_INCIDENTS]
+            ]
+        },
+        'risk': {
+            'alert_count': len(alerts),
+            'risk_score': risk_score,
+            'threat_level': level,
+            'animal_count': context.get('animal_count', len({alert.get('rhino_id') for alert in alerts}))
+        },
+        'patrols': {
+            'primary_hotspot': hotspot_names[0],
+            'secondary_hotspot': hotspot_names[1] if len(hotspot_names) > 1 else hotspot_names[0],
+            'routes': list(context.get('patrol_plan') or [])
+        },
+        'environment': {
+            'season': 'Dry Season (increased poaching risk)',
+            'temperature': 'High risk period for animal stress',
+            'visibility': 'Excellent for surveillance operations',
+            'human_activity': 'Elevated detection probability'
+        }
+    }
+
+# ==================== SECTION RENDERERS ====================
+
+def _patrol_lines(data):
+    if data['routes']:
+        return list(data['routes'])
+    return [f"Increase patrols around {data['primary_hotspot']} and {data['secondary_hotspot']}"]
+
+def _incident_lines(alert):
+    return [
+        f"Time: {alert['timestamp']}",
+        f"Location: {alert['latitude']:.4f}°S, {alert['longitude']:.4f}°E",
+        f"Type: {_format_reasons(alert['reason'])}",
+        f"Confidence: {int(alert['confidence'] * 100)}%"
+    ]
+
+def _text_heading(title, lead=''):
+    return f"{lead}{RULE}\n{title}\n{RULE}\n\n"
+
+def _render_text(name, data):
+    if name == 'summary':
+        return _text_heading('EXECUTIVE SUMMARY') + (
+            f"WildGuard AI has detected {data['alert_count']} significant movement anomalies in\n"
+            f"{data['reserve_name']} over the last 24 hours. Combined with environmental factors\n"
+            f"and recent hotspot activity, the system assesses current poaching risk at\n"
+            f"{data['threat_level']} levels.\n\n"
+        )
+    if name == 'incidents':
+        parts = [_text_heading('DETECTED INCIDENTS')]
+        for i, alert in enumerate(data['alerts'], 1):
+            details = ''.join(f"   {line}\n" for line in _incident_lines(alert))
+            parts.append(f"\n{i}. INCIDENT: {alert['rhino_id'].upper()}\n{details}\n")
+        if not data['alerts']:
+            parts.append("\nNo critical incidents detected.\n")
+        return ''.join(parts)
+    if name == 'risk':
+        return _text_heading('RISK ASSESSMENT', lead='\n') + (
+            f"Movement Anomalies Detected: {data['alert_count']}\n"
+            f"Risk Score: {data['risk_score']}/100\n"
+            f"Threat Level: {data['threat_level']}\n\n"
+            f"The system evaluated:\n"
+            f"- Real-time GPS tracking of {data['animal_count']} monitored animals\n"
+            f"- Movement patterns vs. baseline behavior\n"
+            f"- Proximity to known poaching hotspots\n"
+            f"- Environmental factors (dry season conditions)\n\n"
+        )
+    if name == 'patrols':
+        routes = ''.join(f"- {line}\n" for line in _patrol_lines(data))
+        return _text_heading('RECOMMENDED PATROL ROUTES & ACTIONS') + (
+            f"IMMEDIATE ACTIONS (Next 2-4 hours):\n"
+            f"- Deploy rangers to {data['primary_hotspot']} hotspot (priority 1)\n"
+            f"- Establish checkpoint at {data['secondary_hotspot']} approach\n"
+            f"- Activate night-vision surveillance (dusk onwards)\n\n"
+            f"PATROL ROUTES (priority order):\n"
+            f"{routes}"
+            f"- Position mobile teams at access points\n"
+            f"- Monitor water sources during dry season\n\n"
+            f"RESOURCE ALLOCATION:\n"
+            f"- Recommend 3-4 additional rangers for rotation\n"
+            f"- Deploy 2 night-vision units\n"
+            f"- Position 1 rapid-response team at central base\n\n"
+        )
+    if name == 'environment':
+        return _text_heading('WEATHER & ENVIRONMENTAL FACTORS') + (
+            f"Current Season: {data['season']}\n"
+            f"Temperature: {data['temperature']}\n"
+            f"Visibility: {data['visibility']}\n"
+            f"Human Activity: {data['human_activity']}\n\n"
+        )
+    raise ValueError(f'Unknown briefing section: {name}')
+
+def _render_markdown(name, data):
+    if name == 'summary':
+        return (f"## Executive Summary\n\nWildGuard AI has detected {data['alert_count']} significant movement "
+                f"anomalies in {data['reserve_name']} over the last 24 hours. Combined with environmental "
+                f"factors and recent hotspot activity, the system assesses current poaching risk at "
+                f"**{data['threat_level']}** levels.\n")
+    if name == 'incidents':
+        lines = ['## Detected Incidents', '']
+        for i, alert in enumerate(data['alerts'], 1):
+            lines.append(f"{i}. **{alert['rhino_id'].upper()}**")
+            lines.extend(f"   - {line}" for line in _incident_lines(alert))
+        if not data['alerts']:
+            lines.append('No critical incidents detected.')
+        return '\n'.join(lines) + '\n'
+    if name == 'risk':
+        return (f"## Risk Assessment\n\n"
+                f"| Movement anomalies | Risk score | Threat level |\n|---|---|---|\n"
+                f"| {data['alert_count']} | {data['risk_score']}/100 | {data['threat_level']} |\n\n"
+                f"Evaluated: real-time GPS tracking of {data['animal_count']} monitored animals, movement "
+                f"patterns vs. baseline behavior, proximity to known poaching hotspots and environmental "
+                f"factors (dry season conditions).\n")
+    if name == 'patrols':
+        routes = '\n'.join(f"- {line}" for line in _patrol_lines(data))
+        return (f"## Recommended Patrol Routes & Actions\n\n"
+                f"**Immediate actions (next 2-4 hours)**\n"
+                f"- Deploy rangers to {data['primary_hotspot']} hotspot (priority 1)\n"
+                f"- Establish checkpoint at {data['secondary_hotspot']} approach\n"
+                f"- Activate night-vision surveillance (dusk onwards)\n\n"
+                f"**Patrol routes (priority order)**\n{routes}\n"
+                f"- Position mobile teams at access points\n"
+                f"- Monitor water sources during dry season\n\n"
+                f"**Resource allocation**\n"
+                f"- Recommend 3-4 additional rangers for rotation\n"
+                f"- Deploy 2 night-vision units\n"
+                f"- Position 1 rapid-response team at central base\n")
+    if name == 'environment':
+        return (f"## Weather & Environmental Factors\n\n"
+                f"- **Season:** {data['season']}\n"
+                f"- **Temperature:** {data['temperature']}\n"
+                f"- **Visibility:** {data['visibility']}\n"
+                f"- **Human activity:** {data['human_activity']}\n")
+    raise ValueError(f'Unknown briefing section: {name}')
+
+def _render_sms(name, data):
+    if name == 'incidents':
+        if not data['alerts']:
+            return 'NO INCIDENTS'
+        items = [f"{alert['rhino_id'].upper()} {str(alert['timestamp'])[11:16]} "
+                 f"{_format_reasons(alert['reason']).upper()} {int(alert['confidence'] * 100)}%"
+                 for alert in data['alerts'][:SMS_MAX_INCIDENTS]]
+        more = data['total'] - SMS_MAX_INCIDENTS
+        return 'ALERTS: ' + '; '.join(items) + (f' +{more}' if more > 0 else '')
+    if name == 'patrols':
+        return f"GO {data['primary_hotspot'].upper()}; " + '; '.join(_patrol_lines(data)[:2])
+    if name in SECTIONS:
+        return ''  # carried by the SMS header or too long for radio
+    raise ValueError(f'Unknown briefing section: {name}')
+
+def render_section(name, data, fmt='text'):
+    """Render one section's inputs in fmt (json returns the inputs themselves)"""
+    if fmt == 'json':
+        return data
+    if fmt == 'markdown':
+        return _render_markdown(name, data)
+    if fmt == 'sms':
+        return _render_sms(name, data)
+    return _render_text(name, data)
+
+# ==================== ASSEMBLY ====================
+
+def _assemble(fmt, rendered, inputs, generated_at):
+    summary, risk = inputs['summary'], inputs['risk']
+    date = generated_at.strftime('%Y-%m-%d %H:%M UTC')
+    next_hour = (generated_at.hour + 24) % 24
+    if fmt == 'json':
+        return {
+            'generated_at': generated_at.isoformat(),
+            'reserve': summary['reserve_name'],
+            'risk_score': risk['risk_score'],
+            'threat_level': risk['threat_level'],
+            'sections': rendered,
+            'next_briefing': f'{next_hour}:00 UTC'
+        }
+    if fmt == 'sms':
+        parts = [f"WILDGUARD {summary['reserve_name'].upper()} {generated_at.strftime('%d/%m %H:%MZ')} "
+                 f"RISK {risk['risk_score']}/100 {risk['threat_level']}"]
+        parts.extend(text for text in rendered.values() if text)
+        message = ' | '.join(parts)
+        return message if len(message) <= SMS_MAX_CHARS else message[:SMS_MAX_CHARS - 3] + '...'
+    if fmt == 'markdown':
+        header = (f"# WildGuard AI - Daily Ranger Briefing\n\n"
+                  f"**Date:** {date}  \n**Reserve:** {summary['reserve_name']}  \n"
+                  f"**Overall risk score:** {risk['risk_score']}/100 [{risk['threat_level']}]\n")
+        footer = (f"## Next Briefing\n\nNext automated briefing: {next_hour}:00 UTC tomorrow. "
+                  f"Priority updates will be sent immediately if risk score exceeds 80.\n\n"
+                  f"Contact: WildGuard AI Command Center ([admin@wildguardai.com](mailto:admin@wildguardai.com))\n")
+        return '\n'.join([header] + list(rendered.values()) + [footer])
+    header = (f"\n{RULE}\n                     WILDGUARD AI - DAILY RANGER BRIEFING\n{RULE}\n\n"
+              f"DATE: {date}\n"
+              f"RESERVE: {summary['reserve_name']}\n"
+              f"OVERALL RISK SCORE: {risk['risk_score']}/100 [{risk['threat_level']}]\n\n")
+    footer = _text_heading('NEXT BRIEFING') + (
+        f"Next automated briefing: {next_hour}:00 UTC tomorrow\n"
+        f"Priority updates will be sent immediately if risk score exceeds 80\n\n"
+        f"Contact: WildGuard AI Command Center\n"
+        f"Questions: admin@wildguardai.com\n\n"
+        f"{RULE}\n"
+    )
+    return header + ''.join(rendered.values()) + footer
+
+@tracer.traced('report.generate_briefing')
+def generate_briefing(alerts, risk_score, context=None, fmt='text', generated_at=None, render=None):
     """
     Generate professional ranger briefing report.
+
+    context carries reserve facts (reserve_name, animal_count,
+    priority_hotspots) so the text matches the reserve being briefed, and
+    patrol_plan (routes.patrol.summarize_plan lines) for the patrol section.
+    fmt is one of FORMATS. render(name, inputs) renders a section and
+    defaults to render_section; pass a caching one to skip unchanged sections.
     """
-    
-    timestamp = datetime.utcnow().isoformat()
-    threat_level = 'CRITICAL' if risk_score >= 70 else 'HIGH' if risk_score >= 40 else 'MEDIUM'
-    
-    report = f"""
-================================================================================
-                     WILDGUARD AI - DAILY RANGER BRIEFING
-================================================================================
-
-DATE: {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}
-OVERALL RISK SCORE: {risk_score}/100 [{threat_level}]
-
-================================================================================
-EXECUTIVE SUMMARY
-================================================================================
-
-WildGuard AI has detected {len(alerts)} significant movement anomalies in the
-protected reserve over the last 24 hours. Combined with environmental factors
-and recent hotspot activity, the system assesses current poaching risk at
-{threat_level} levels.
-
-================================================================================
-DETECTED INCIDENTS
-================================================================================
-
-"""
-    
-    if alerts:
-        for i, alert in enumerate(alerts[:5], 1):
-            report += f"""
-{i}. INCIDENT: {alert['rhino_id'].upper()}
-   Time: {alert['timestamp']}
-   Location: {alert['latitude']:.4f}°S, {alert['longitude']:.4f}°E
-   Type: {alert['reason'].replace('_', ' ').title()}
-   Confidence: {int(alert['confidence'] * 100)}%
-
-"""
-    else:
-        report += "\nNo critical incidents detected.\n"
-    
-    report += f"""
-================================================================================
-RISK ASSESSMENT
-================================================================================
-
-Movement Anomalies Detected: {len(alerts)}
-Risk Score: {risk_score}/100
-Threat Level: {threat_level}
-
-The system evaluated:
-- Real-time GPS tracking of {5} monitored animals
-- Movement patterns vs. baseline behavior
-- Proximity to known poaching hotspots
-- Environmental factors (dry season conditions)
-
-================================================================================
-RECOMMENDED PATROL ROUTES & ACTIONS
-================================================================================
-
-IMMEDIATE ACTIONS (Next 2-4 hours):
-- Deploy rangers to Northern Ridge hotspot (priority 1)
-- Establish checkpoint at Eastern Valley approach
-- Activate night-vision surveillance (dusk onwards)
-
-PATROL RECOMMENDATIONS:
-- Increase patrols in grid zone X-7 (85% higher risk)
-- Position mobile teams at access points
-- Monitor water sources during dry season
-
-RESOURCE ALLOCATION:
-- Recommend 3-4 additional rangers for rotation
-- Deploy 2 night-vision units
-- Position 1 rapid-response team at central base
-
-================================================================================
-WEATHER & ENVIRONMENTAL FACTORS
-================================================================================
-
-Current Season: Dry Season (increased poaching risk)
-Temperature: High risk period for animal stress
-Visibility: Excellent for surveillance operations
-Human Activity: Elevated detection probability
-
-================================================================================
-NEXT BRIEFING
-================================================================================
-
-Next automated briefing: {(datetime.utcnow().hour + 24) % 24}:00 UTC tomorrow
-Priority updates will be sent immediately if risk score exceeds 80
-
-Contact: WildGuard AI Command Center
-Questions: admin@wildguardai.com
-
-================================================================================
-"""
-    
-    return report
\ No newline at end of file
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    render = render or (lambda name, data: render_section(name, data, fmt))
+    inputs = section_inputs(alerts, risk_score, context)
+    rendered = {name: render(name, inputs[name]) for name in SECTIONS}
+    return _assemble(fmt, rendered, inputs, generated_at or datetime.utcnow())
@@ -1,47 +1,322 @@
-def compute_score(movement_alerts, vision_findings, hotspots):
+import heapq
+import math
+import os
+from utils.geo import KM_PER_DEGREE, HOTSPOT_HALF_LIFE_DAYS
+from utils.stage_cache import content_hash
+from utils.timestamps import epoch_or_none
+from utils.tracing import tracer
+
+# Component weights of the overall (and per-cell) risk score
+WEIGHTS = {
+    'movement': 0.40,
+    'vision': 0.35,
+    'hotspot': 0.15,
+    'environment': 0.10
+}
+
+# Environmental layers: {'name', 'value'} applies everywhere, while
+# {'name', 'points': [{'latitude', 'longitude', 'radius_km', 'value'}]}
+# raises risk around features such as water sources or access roads.
+DEFAULT_LAYERS = [
+    {'name': 'dry_season', 'value': 15}  # Dry season = higher risk
+]
+
+HOTSPOT_RISK_WEIGHTS = {'CRITICAL': 1.0, 'HIGH': 0.75, 'MEDIUM': 0.5, 'LOW': 0.25}
+HOTSPOT_INFLUENCE_KM = 1.0
+GRID_CELL_KM = float(os.getenv('RISK_GRID_CELL_KM', 0.25))
+GRID_MAX_CELLS = int(os.getenv('RISK_GRID_MAX_CELLS', 10000))
+RISK_SCORE_TOP_CELLS = int(os.getenv('RISK_SCORE_TOP_CELLS', 10))
+
+def threat_level_for(risk_score):
+    if risk_score >= 70:
+        return 'CRITICAL'
+    if risk_score >= 40:
+        return 'HIGH'
+    return 'MEDIUM'
+
+class RiskGrid:
+    """Flat row-major grid over the reserve in a local equirectangular projection"""
+    
+    def __init__(self, points, cell_km=GRID_CELL_KM, max_cells=GRID_MAX_CELLS):
+        lats = [p[0] for p in points] or [0.0]
+        lons = [p[1] for p in points] or [0.0]
+        self.ref_lat = (min(lats) + max(lats)) / 2
+        self.km_per_lon = KM_PER_DEGREE * math.cos(math.radians(self.ref_lat))
+        span_y = (max(lats) - min(lats)) * KM_PER_DEGREE
+        span_x = (max(lons) - min(lons)) * self.km_per_lon
+        # Grow cells until the grid (with a one-cell margin) fits the budget
+        while (span_y / cell_km + 3) * (span_x / cell_km + 3) > max_cells:
+            cell_km *= 2
+        self.cell_km = cell_km
+        self.min_lat = min(lats) - cell_km / KM_PER_DEGREE
+        self.min_lon = min(lons) - cell_km / self.km_per_lon
+        self.rows = int(span_y / cell_km) + 3
+        self.cols = int(span_x / cell_km) + 3
+        self.size = self.rows * self.cols
+        # Cell centres, computed once and shared by every layer and scenario
+        self.centres = [
+            ((r + 0.5) * cell_km, (c + 0.5) * cell_km)
+            for r in range(self.rows) for c in range(self.cols)
+        ]
+    
+    def xy(self, lat, lon):
+        return (lat - self.min_lat) * KM_PER_DEGREE, (lon - self.min_lon) * self.km_per_lon
+    
+    def index(self, lat, lon):
+        y, x = self.xy(lat, lon)
+        r = min(max(int(y // self.cell_km), 0), self.rows - 1)
+        c = min(max(int(x // self.cell_km), 0), self.cols - 1)
+        return r * self.cols + c
+    
+    def cell_centre(self, i):
+        y, x = self.centres[i]
+        return {
+            'row': i // self.cols,
+            'col': i % self.cols,
+            'latitude': round(self.min_lat + y / KM_PER_DEGREE, 6),
+            'longitude': round(self.min_lon + x / self.km_per_lon, 6)
+        }
+    
+    def radial(self, lat, lon, radius_km, value, out):
+        """Add a Gaussian bump of height value around (lat, lon) into out"""
+        y0, x0 = self.xy(lat, lon)
+        reach = 3 * radius_km
+        r_lo = max(int((y0 - reach) // self.cell_km), 0)
+        r_hi = min(int((y0 + reach) // self.cell_km), self.rows - 1)
+        c_lo = max(int((x0 - reach) // self.cell_km), 0)
+        c_hi = min(int((x0 + reach) // self.cell_km), self.cols - 1)
+        if r_lo > r_hi or c_lo > c_hi:
+            return
+        # The Gaussian is separable: one exp per row and per column, then a
+        # multiply-add over each row slice
+        scale = radius_km * radius_km
+        half = 0.5 * self.cell_km
+        col_factors = [math.exp(-((c * self.cell_km + half - x0) ** 2) / scale) for c in range(c_lo, c_hi + 1)]
+        for r in range(r_lo, r_hi + 1):
+            row_value = value * math.exp(-((r * self.cell_km + half - y0) ** 2) / scale)
+            start = r * self.cols + c_lo
+            end = start + len(col_factors)
+            out[start:end] = [o + row_value * f for o, f in zip(out[start:end], col_factors)]
+    
+    def smooth(self, counts):
+        """3x3 kernel (centre 1, neighbours 0.5) so density bleeds into adjacent cells"""
+        out = [0.0] * self.size
+        for i, n in enumerate(counts):
+            if not n:
+                continue
+            r, c = divmod(i, self.cols)
+            for dr in (-1, 0, 1):
+                for dc in (-1, 0, 1):
+                    rr, cc = r + dr, c + dc
+                    if 0 <= rr < self.rows and 0 <= cc < self.cols:
+                        out[rr * self.cols + cc] += n * (1.0 if dr == dc == 0 else 0.5)
+        return out
+
+def _bin(grid, items, value):
+    """Per-cell sums of value(item) for located items, plus the total for unlocated ones"""
+    cells = [0.0] * grid.size
+    unlocated = 0.0
+    for item in items:
+        v = value(item)
+        lat, lon = item.get('latitude'), item.get('longitude')
+        if lat is None or lon is None:
+            unlocated += v
+        else:
+            cells[grid.index(lat, lon)] += v
+    return cells, unlocated
+
+def _environment(grid, layers):
+    """Uniform part (exact) and spatial per-cell part of the environmental layers"""
+    uniform = 0.0
+    spatial = [0.0] * grid.size
+    for layer in layers:
+        uniform += layer.get('value', 0) if 'points' not in layer else 0
+        for point in layer.get('points', []):
+            grid.radial(point['latitude'], point['longitude'], point.get('radius_km', 1.0),
+                        point.get('value', 0), spatial)
+    return uniform, spatial
+
+def _hotspot_field(grid, hotspots, now, half_life_days):
+    """Recency-weighted proximity to known hotspots (0-100 per cell) and per-hotspot recency"""
+    field = [0.0] * grid.size
+    recency = {}
+    for hotspot in hotspots:
+        last = epoch_or_none(hotspot.get('last_incident'))
+        age_days = max(0.0, (now - last) / 86400) if last is not None and now is not None else 0.0
+        weight = HOTSPOT_RISK_WEIGHTS.get(hotspot.get('risk_level'), 0.25) * 0.5 ** (age_days / half_life_days)
+        recency[hotspot.get('id')] = round(age_days, 1)
+        grid.radial(hotspot['latitude'], hotspot['longitude'], HOTSPOT_INFLUENCE_KM, 100 * weight, field)
+    return [min(v, 100.0) for v in field], recency
+
+def _combine(weights, movement, vision, hotspot, environment):
+    """Per-cell weighted risk (0-100) from the clamped 0-100 component fields"""
+    wm, wv, wh, we = (weights[k] for k in ('movement', 'vision', 'hotspot', 'environment'))
+    return [min(wm * m + wv * v + wh * h + we * e, 100)
+            for m, v, h, e in zip(movement, vision, hotspot, environment)]
+
+def _aggregate(risk, top_cells=RISK_SCORE_TOP_CELLS):
     """
-    Compute overall risk score 0-100 using weighted factors.
+    Reserve-wide score aggregated from the surface: the mean of the hottest
+    top_cells cells, so a concentrated threat scores high without one stray
+    cell deciding the level on its own.
+    """
+    hottest = heapq.nlargest(max(top_cells, 1), risk)
+    return int(min(sum(hottest) / len(hottest), 100)) if hottest else 0
+
+def _hotspot_summary(grid, hotspots, risk, alerts, recency):
+    located = [grid.xy(a['latitude'], a['longitude']) for a in alerts
+               if a.get('latitude') is not None and a.get('longitude') is not None]
+    summary = []
+    for hotspot in hotspots:
+        i = grid.index(hotspot['latitude'], hotspot['longitude'])
+        y0, x0 = grid.xy(hotspot['latitude'], hotspot['longitude'])
+        nearby = sum(1 for y, x in located if math.hypot(y - y0, x - x0) <= HOTSPOT_INFLUENCE_KM)
+        summary.append({
+            'id': hotspot.get('id'),
+            'name': hotspot.get('name'),
+            'risk': round(risk[i], 1),
+            'alerts_nearby': nearby,
+            'days_since_incident': recency.get(hotspot.get('id'))
+        })
+    return sorted(summary, key=lambda h: h['risk'], reverse=True)
+
+def _top_cells(grid, risk, limit=10):
+    ranked = heapq.nlargest(limit, range(grid.size), key=risk.__getitem__)
+    return [dict(grid.cell_centre(i), risk=round(risk[i], 1)) for i in ranked if risk[i] > 0]
+
+@tracer.traced('scoring.compute_risk_surface')
+def compute_risk_surface(movement_alerts, vision_findings, hotspots, layers=None, scenarios=None,
+                         cell_km=None, now=None, include_cells=True):
+    """
+    Compute a risk surface over a grid covering the reserve.
     
-    Weights:
-    - Movement alerts: 40%
-    - Vision findings: 35%
-    - Hotspot proximity: 15%
-    - Environment: 10%
+    Each cell combines alert density, vision severity, recency-weighted
+    hotspot proximity and the environmental layers with WEIGHTS; risk_score
+    aggregates the hottest cells (see _aggregate). The grid is built once
+    and each component field (movement density, vision, hotspot proximity,
+    environment) is computed once per distinct input, so scenarios only
+    rebuild the fields they change and re-combine the rest. A scenario may override 'weights', 'layers',
+    'vision_findings', 'hotspot_half_life_days' or add hypothetical
+    'extra_alerts'.
+    
+    now (ISO timestamp) anchors hotspot recency; it defaults to the newest
+    alert or incident so results are reproducible for the same inputs.
     """
+    layers = DEFAULT_LAYERS if layers is None else layers
+    hotspot_list = hotspots.get('hotspots', [])
+    scenarios = scenarios or []
     
-    # Movement score (0-100)
-    movement_score = min(len(movement_alerts) * 10, 100)
+    points = [(h['latitude'], h['longitude']) for h in hotspot_list]
+    for item in list(movement_alerts) + list(vision_findings) + [
+            a for sc in scenarios for a in sc.get('extra_alerts', []) + sc.get('vision_findings', [])]:
+        if item.get('latitude') is not None and item.get('longitude') is not None:
+            points.append((item['latitude'], item['longitude']))
+    for layer in layers + [l for sc in scenarios for l in sc.get('layers', [])]:
+        points.extend((p['latitude'], p['longitude']) for p in layer.get('points', []))
+    grid = RiskGrid(points, cell_km or GRID_CELL_KM)
     
-    # Vision score (0-100)
-    vision_score = 0
-    for finding in vision_findings:
-        severity = finding.get('severity', 0)
-        vision_score += severity * 100
-    vision_score = min(vision_score, 100)
+    if now is None:
+        stamps = [a.get('timestamp') for a in movement_alerts] + [h.get('last_incident') for h in hotspot_list]
+        stamps = [t for t in (epoch_or_none(s) for s in stamps) if t is not None]
+        now_ts = max(stamps) if stamps else None
+    else:
+        now_ts = epoch_or_none(now)
     
-    # Hotspot proximity score
-    hotspot_score = 30 if len(movement_alerts) > 0 else 0
+    movement_counts, unlocated_alerts = _bin(grid, movement_alerts, lambda a: 1)
     
-    # Environment score (simulated weather, season)
-    environment_score = 15  # Dry season = higher risk
+    # Component fields, clamped to 0-100 and memoized by their inputs so
+    # scenarios that share them (e.g. only re-weighting) do not rebuild them
+    fields = {}
     
-    # Weighted calculation
-    total_score = (
-        movement_score * 0.40 +
-        vision_score * 0.35 +
-        hotspot_score * 0.15 +
-        environment_score * 0.10
-    )
+    def field(kind, inputs, build):
+        key = (kind, content_hash(inputs))
+        if key not in fields:
+            fields[key] = build()
+        return fields[key]
     
-    risk_score = int(min(total_score, 100))
+    def movement_field(extra_alerts):
+        density = movement_counts
+        if extra_alerts:
+            extra, _ = _bin(grid, extra_alerts, lambda a: 1)
+            density = [a + b for a, b in zip(movement_counts, extra)]
+        return [min(10 * v, 100) for v in grid.smooth(density)]
     
-    # Determine threat level
-    if risk_score >= 70:
-        threat_level = 'CRITICAL'
-    elif risk_score >= 40:
-        threat_level = 'HIGH'
-    else:
-        threat_level = 'MEDIUM'
+    def vision_field(findings):
+        cells, uniform = _bin(grid, findings, lambda f: f.get('severity', 0))
+        return [min(100 * (v + uniform), 100) for v in cells]
+    
+    def environment_field(env_layers):
+        uniform, spatial = _environment(grid, env_layers)
+        return [min(uniform + v, 100) for v in spatial]
+    
+    def evaluate(weights, env_layers, findings, half_life, extra_alerts):
+        hotspot, recency = field('hotspot', half_life, lambda: _hotspot_field(grid, hotspot_list, now_ts, half_life))
+        risk = _combine(
+            weights,
+            field('movement', extra_alerts, lambda: movement_field(extra_alerts)),
+            field('vision', findings, lambda: vision_field(findings)),
+            hotspot,
+            field('environment', env_layers, lambda: environment_field(env_layers))
+        )
+        risk_score = _aggregate(risk)
+        return {
+            'risk_score': risk_score,
+            'threat_level': threat_level_for(risk_score),
+            'max_cell_risk': round(max(risk), 1),
+            'hotspots': _hotspot_summary(grid, hotspot_list, risk, list(movement_alerts) + list(extra_alerts), recency),
+            'top_cells': _top_cells(grid, risk)
+        }, risk
+    
+    result, risk = evaluate(WEIGHTS, layers, vision_findings, HOTSPOT_HALF_LIFE_DAYS, [])
+    result['grid'] = {
+        'origin': {'latitude': round(grid.min_lat, 6), 'longitude': round(grid.min_lon, 6)},
+        'cell_km': grid.cell_km,
+        'rows': grid.rows,
+        'cols': grid.cols
+    }
+    if include_cells:
+        result['cells'] = [
+            [round(v, 1) for v in risk[r * grid.cols:(r + 1) * grid.cols]]
+            for r in range(grid.rows)
+        ]
+    result['unlocated_alerts'] = int(unlocated_alerts)
+    result['layers'] = [layer['name'] for layer in layers if layer.get('name')]
+    
+    result['scenarios'] = []
+    for i, scenario in enumerate(scenarios):
+        outcome, _ = evaluate(
+            dict(WEIGHTS, **scenario.get('weights', {})),
+            scenario.get('layers', layers),
+            scenario.get('vision_findings', vision_findings),
+            float(scenario.get('hotspot_half_life_days', HOTSPOT_HALF_LIFE_DAYS)),
+            scenario.get('extra_alerts', [])
+        )
+        outcome['name'] = scenario.get('name', f'scenario_{i + 1}')
+        outcome['risk_delta'] = outcome['risk_score'] - result['risk_score']
+        result['scenarios'].append(outcome)
+    
+    return result
+
+@tracer.traced('scoring.compute_score')
+def compute_score(movement_alerts, vision_findings, hotspots, surface=None):
+    """
+    Compute overall risk score 0-100 using weighted factors.
+    
+    Weights:
+    - Movement alerts: 40%
+    - Vision findings: 35%
+    - Hotspot proximity: 15%
+    - Environment: 10%
+    
+    The score is the aggregate of compute_risk_surface with the default
+    layers; pass that surface when it is already built to reuse its grid.
+    """
+    
+    if surface is None:
+        surface = compute_risk_surface(movement_alerts, vision_findings, hotspots, include_cells=False)
+    risk_score = surface['risk_score']
+    threat_level = surface['threat_level']
+    conditions = ', '.join(name.replace('_', ' ') for name in surface.get('layers', []))
     
     # Generate recommendations
     recommendations = []
@@ -67,6 +342,7 @@ def compute_score(movement_alerts, vision_findings, hotspots):
     return {
         'risk_score': risk_score,
         'threat_level': threat_level,
-        'justification': f'Based on {len(movement_alerts)} movement alerts and {len(vision_findings)} visual findings during dry season conditions.',
+        'justification': f'Based on {len(movement_alerts)} movement alerts and {len(vision_findings)} visual findings'
+                         + (f' during {conditions} conditions.' if conditions else '.'),
         'recommendations': recommendations
     }
\ No newline at end of file
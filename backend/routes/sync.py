@@ -0,0 +1,156 @@
+import math
+import os
+from datetime import datetime
+
+from . import analytics, patrol, report
+from .orchestrate import anomalies_stage, report_stage
+from utils.stage_cache import content_hash
+from utils.timestamps import epoch_or_none, is_future
+from utils.sync import encode_delta, decode_body
+from utils.tracks import plain_records
+
+MAX_UPLOAD = int(os.getenv('SYNC_MAX_UPLOAD', 10000))
+FIX_FIELDS = ('rhino_id', 'timestamp_utc', 'latitude', 'longitude')
+COORDINATE_RANGES = {'latitude': (-90.0, 90.0), 'longitude': (-180.0, 180.0)}
+OPTIONAL_NUMERIC_FIELDS = ('speed_kmh', 'heading')
+
+def _fix_key(fix):
+    return (fix.get('rhino_id'), fix.get('timestamp_utc'))
+
+def _alert_key(alert):
+    return (alert.get('rhino_id'), alert.get('timestamp'))
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def fix_error(fix):
+    """Why a collar fix cannot be ingested, or None when it is valid"""
+    if not isinstance(fix, dict):
+        return 'fix must be an object'
+    if any(fix.get(field) is None for field in FIX_FIELDS):
+        return f"fix requires {', '.join(FIX_FIELDS)}"
+    if not isinstance(fix['rhino_id'], str):
+        return 'rhino_id must be a string'
+    epoch = epoch_or_none(fix['timestamp_utc']) if isinstance(fix['timestamp_utc'], str) else None
+    if epoch is None:
+        return 'timestamp_utc must be an ISO-8601 timestamp'
+    if is_future(epoch):
+        return 'timestamp_utc is in the future'
+    for field, (low, high) in COORDINATE_RANGES.items():
+        if not _is_number(fix[field]) or not low <= fix[field] <= high:
+            return f'{field} must be a number between {low:g} and {high:g}'
+    for field in OPTIONAL_NUMERIC_FIELDS:
+        if field in fix and (not _is_number(fix[field]) or fix[field] < 0):
+            return f'{field} must be a non-negative number'
+    return None
+
+def record_dataset(reserve, dataset):
+    """Log fixes, alerts and hotspots that are new or changed in a dataset version"""
+    log = reserve.sync
+    hotspots = dataset.hotspots.get('hotspots', [])
+    alerts = anomalies_stage(dataset.wildlife_data, dataset.hotspots, dataset.version, reserve.cache, reserve.model())
+    recorded = {
+        'fixes': log.put_many('fixes', ((_fix_key(f), f) for f in plain_records(dataset.wildlife_data))),
+        'alerts': log.put_many('alerts', ((_alert_key(a), a) for a in alerts)),
+        'hotspots': log.put_many('hotspots', ((h.get('id'), h) for h in hotspots)),
+        'hotspots_removed': log.delete_missing('hotspots', [h.get('id') for h in hotspots])
+    }
+    log.checkpoint(dataset.version)
+    return recorded
+
+def ingest_fixes(reserve, fixes):
+    """
+    New collar fixes: fold the valid ones into the analytics rollups, the
+    sync log and (after scoring them) the reserve's anomaly model. Invalid
+    fixes are listed under rejected (index, error).
+    """
+    valid, rejected = [], []
+    for index, fix in enumerate(fixes):
+        error = fix_error(fix)
+        if error:
+            rejected.append({'index': index, 'error': error})
+        else:
+            valid.append(fix)
+    if not valid:
+        return {'fixes': 0, 'alerts': 0, 'rejected': rejected}
+    alerts = analytics.classify_observations(reserve, valid)
+    ingested = analytics.ingest_observations(reserve, valid, alerts)
+    reserve.sync.put_many('fixes', ((_fix_key(f), f) for f in valid))
+    reserve.sync.put_many('alerts', ((_alert_key(a), a) for a in alerts))
+    reserve.learn(valid)
+    return dict(ingested, rejected=rejected)
+
+def record_briefing(reserve, results):
+    """Log a pipeline run's ranger briefing (only when its content, not just its issue time, changed)"""
+    report_text = results.get('ranger_report')
+    if not report_text:
+        return
+    risk = results.get('risk_assessment') or {}
+    alerts = results.get('movement_alerts', [])
+    score = risk.get('risk_score', 0)
+    context = dict(reserve.context(), patrol_plan=patrol.summarize_plan(results.get('patrol_plan') or {}))
+    sections = report.section_inputs(alerts, score, context)
+    reserve.sync.put('briefings', 'ranger_report', {
+        'id': 'ranger_report',
+        'text': report_text,
+        'sms': report_stage(alerts, score, context, reserve.cache, 'sms'),
+        'risk_score': risk.get('risk_score'),
+        'threat_level': risk.get('threat_level')
+    }, version=lambda payload: content_hash(sections))
+
+def upload_observations(reserve, device_id, observations):
+    """
+    Accept a device's queued offline observations.
+
+    Each observation needs a client_id unique on the device, so retried
+    uploads are idempotent. Observations of type 'fix' (collar fixes with
+    rhino_id, timestamp_utc, latitude, longitude) are ingested like
+    /api/ingest; everything else (sightings, photo metadata, ...) is stored
+    and synced to the other devices.
+    """
+    if not device_id:
+        raise ValueError('device_id is required')
+    if not isinstance(observations, list):
+        raise ValueError('observations must be a list')
+    if len(observations) > MAX_UPLOAD:
+        raise ValueError(f'at most {MAX_UPLOAD} observations per upload')
+
+    log = reserve.sync
+    received_at = datetime.utcnow().isoformat()
+    fixes, others, rejected, duplicates = [], [], [], 0
+    seen_fixes = set()
+    for index, observation in enumerate(observations):
+        if not isinstance(observation, dict) or not observation.get('client_id'):
+            rejected.append({'index': index, 'error': 'client_id is required'})
+            continue
+        if observation.get('type') == 'fix':
+            fix = {k: v for k, v in observation.items() if k not in ('type', 'client_id')}
+            error = fix_error(fix)
+            if error:
+                rejected.append({'index': index, 'error': error})
+            elif log.contains('fixes', _fix_key(fix)) or _fix_key(fix) in seen_fixes:
+                duplicates += 1
+            else:
+                seen_fixes.add(_fix_key(fix))
+                fixes.append(fix)
+            continue
+        key = (device_id, observation['client_id'])
+        if log.contains('observations', key):
+            duplicates += 1
+        else:
+            others.append((key, dict(observation, device_id=device_id, received_at=received_at)))
+
+    ingested = ingest_fixes(reserve, fixes)
+    return {
+        'observations': log.put_many('observations', others),
+        'fixes': ingested['fixes'],
+        'alerts': ingested['alerts'],
+        'duplicates': duplicates,
+        'rejected': rejected
+    }
+
+def get_changes(reserve, token=None, limit=None):
+    """Delta since a device's sync token"""
+    delta = reserve.sync.changes(token, limit)
+    delta['reserve'] = reserve.id
+    return delta
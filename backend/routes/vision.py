@@ -5,20 +5,9 @@ except ImportError:
 import io
 import base64
 
-# Try to import agents, fallback to simple agents if not available
-try:
-    from utils.agents import wildguard_agents
-    AGENTS_AVAILABLE = True
-    AGENT_TYPE = "groq"
-except ImportError:
-    try:
-        from utils.simple_agents import simple_wildguard_agents as wildguard_agents
-        AGENTS_AVAILABLE = True
-        AGENT_TYPE = "simulated"
-    except ImportError:
-        AGENTS_AVAILABLE = False
-        wildguard_agents = None
-        AGENT_TYPE = "none"
+from utils.tracing import tracer
+from utils.backends import agent_backends
+
 
 def analyze_image(file):
     """
@@ -27,7 +16,9 @@ def analyze_image(file):
     try:
         # Open image
         if Image:
-            img = Image.open(file.stream)
+            with tracer.span('vision.decode_image'):
+                img = Image.open(file.stream)
+                img.load()  # open() only reads the header; decode the pixels inside the span
             # Convert to base64 for analysis description
             img_info = f"Image: {file.filename}, Size: {img.size if hasattr(img, 'size') else 'unknown'}"
         else:
@@ -50,9 +41,11 @@ def analyze_image(file):
         ]
         
         # Get AI agent analysis of the findings (if available)
-        if AGENTS_AVAILABLE and wildguard_agents:
+        wildguard_agents, agent_type = agent_backends.current()
+        if wildguard_agents:
             try:
-                agent_analysis = wildguard_agents.vision_analyst_agent(findings)
+                with tracer.span('vision.agent_analysis'):
+                    agent_analysis = wildguard_agents.vision_analyst_agent(findings)
                 findings.append({
                     'label': 'ai_analysis',
                     'confidence': 0.95,
@@ -71,7 +64,7 @@ def analyze_image(file):
                 'label': 'ai_analysis_unavailable',
                 'confidence': 0.0,
                 'severity': 0.0,
-                'notes': f'AI agent analysis not available (mode: {AGENT_TYPE})'
+                'notes': f'AI agent analysis not available (mode: {agent_type})'
             })
         
         return findings
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from utils.admission import AdmissionController, AdmissionPolicy, AdmissionRejected, CRITICAL
+
+
+def _controller(total=1, reserved=0, **overrides):
+    settings = {'max_concurrent': 1, 'max_queue': 4, 'queue_timeout': 2.0, 'rate': 100.0, 'burst': 100}
+    settings.update(overrides)
+    return AdmissionController({
+        'llm': AdmissionPolicy('llm', **settings),
+        'ingest': AdmissionPolicy('ingest', **dict(settings, priority=CRITICAL)),
+    }, total=total, reserved=reserved)
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def test_rate_limited_clients_get_429():
+    controller = _controller(rate=0.5, burst=1)
+    controller.release(controller.acquire('llm', 'client-a'))
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire('llm', 'client-a')
+    assert rejected.value.status == 429 and rejected.value.reason == 'rate_limited'
+    assert rejected.value.retry_after >= 1
+    controller.release(controller.acquire('llm', 'client-b'))   # buckets are per client
+
+
+def test_full_queue_and_queue_timeout_get_503():
+    controller = _controller(max_queue=0)
+    ticket = controller.acquire('llm', 'a')
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire('llm', 'b')
+    assert (rejected.value.status, rejected.value.reason) == (503, 'queue_full')
+    controller.release(ticket)
+
+    controller = _controller(queue_timeout=0.05)
+    ticket = controller.acquire('llm', 'a')
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire('llm', 'b')
+    assert (rejected.value.status, rejected.value.reason) == (503, 'queue_timeout')
+    assert controller.status()['classes']['llm']['queued'] == 0
+    controller.release(ticket)
+
+
+def test_release_admits_the_next_waiter():
+    controller = _controller()
+    ticket = controller.acquire('llm', 'a')
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(controller.acquire('llm', 'b')))
+    waiter.start()
+    _wait_until(lambda: controller.status()['classes']['llm']['queued'] == 1)
+    assert not admitted
+    controller.release(ticket)
+    waiter.join(2)
+    assert len(admitted) == 1
+    controller.release(admitted[0])
+    assert controller.status()['in_use'] == 0
+
+
+def test_critical_waiters_are_served_before_earlier_normal_ones():
+    controller = _controller(max_concurrent=4)
+    ticket = controller.acquire('llm', 'holder')
+    order = []
+
+    def request(name):
+        admitted = controller.acquire(name, name)
+        order.append(name)
+        controller.release(admitted)
+
+    threads = []
+    for name, queued in (('llm', lambda s: s['llm']['queued'] == 1), ('ingest', lambda s: s['ingest']['queued'] == 1)):
+        threads.append(threading.Thread(target=request, args=(name,)))
+        threads[-1].start()
+        _wait_until(lambda: queued(controller.status()['classes']))
+    controller.release(ticket)
+    for thread in threads:
+        thread.join(2)
+    assert order == ['ingest', 'llm']
+
+
+def test_reserved_slots_are_kept_for_critical_classes():
+    controller = _controller(total=2, reserved=1, max_concurrent=4, queue_timeout=0.05)
+    ticket = controller.acquire('llm', 'a')
+    with pytest.raises(AdmissionRejected):
+        controller.acquire('llm', 'b')
+    critical = controller.acquire('ingest', 'c')
+    assert controller.status()['in_use'] == 2
+    controller.release(critical)
+    controller.release(ticket)
@@ -0,0 +1,113 @@
+import json
+import random
+import time
+
+import pytest
+
+from routes.movement import resolve_thresholds
+from utils.datasets import TRACKS_FILE, HOTSPOTS_FILE
+from utils.online_scorer import OnlineScorer, MODEL_FILE
+from utils.reserves import ReserveRegistry
+
+START = 1600000000
+REASON = 'sudden_speed_drop'
+
+
+def _walk(count, start=START, seed=7, rid='R1'):
+    """Fixes 30 minutes apart with lognormal speeds and a random-walk position"""
+    rng = random.Random(seed)
+    lat, lon = -1.0, 36.0
+    fixes = []
+    for i in range(count):
+        lat += rng.uniform(-1, 1) * 0.001
+        lon += rng.uniform(-1, 1) * 0.001
+        fixes.append({'rhino_id': rid, 'timestamp_utc': start + 1800 * i, 'latitude': lat, 'longitude': lon,
+                      'speed_kmh': rng.lognormvariate(1.0, 0.6)})
+    return fixes
+
+
+def _columns(fixes):
+    return ([f['latitude'] for f in fixes], [f['longitude'] for f in fixes],
+            [f['timestamp_utc'] for f in fixes], [f['speed_kmh'] for f in fixes])
+
+
+def test_confidences_are_calibrated_on_normal_behaviour():
+    scorer = OnlineScorer()
+    assert scorer.learn_records(_walk(3000)) == 3000
+    fresh = _walk(2000, start=START + 1800 * 3000, seed=8)
+    hits = {i: [REASON] for i in range(len(fresh))}
+    confidences = scorer.snapshot().score('R1', *_columns(fresh), hits, resolve_thresholds())
+    for c in (0.5, 0.75, 0.9, 0.95):
+        exceeded = sum(value > c for value in confidences.values()) / len(confidences)
+        assert exceeded == pytest.approx(1 - c, abs=0.07)
+
+
+def test_save_and_load_keep_the_model_version(tmp_path):
+    path = tmp_path / 'model.json'
+    scorer = OnlineScorer(path)
+    scorer.learn_records(_walk(500))
+    assert scorer.save(force=True)
+    assert not scorer.save(force=True)   # nothing new to write
+
+    loaded = OnlineScorer(path)
+    assert loaded.version == scorer.version
+    fresh = _walk(50, start=START + 1800 * 500, seed=9)
+    hits = {i: [REASON] for i in range(len(fresh))}
+    thresholds = resolve_thresholds()
+    assert loaded.snapshot().score('R1', *_columns(fresh), hits, thresholds) == \
+        scorer.snapshot().score('R1', *_columns(fresh), hits, thresholds)
+
+
+def test_in_memory_scorer_never_writes():
+    scorer = OnlineScorer()
+    scorer.learn_records(_walk(100))
+    assert not scorer.save(force=True)
+
+
+def test_learning_is_idempotent_and_skips_future_fixes():
+    scorer = OnlineScorer()
+    fixes = _walk(200)
+    assert scorer.learn_records(fixes) == 200
+    version = scorer.version
+    assert scorer.learn_records(fixes) == 0
+    assert scorer.learn_records(_walk(10, start=int(time.time()) + 86400)) == 0
+    assert scorer.version == version
+
+
+def test_stream_scores_each_fix_before_learning_it():
+    history, batch = _walk(300), _walk(40, start=START + 1800 * 300, seed=11)
+    thresholds = resolve_thresholds()
+    for k in (0, 25):
+        scorer = OnlineScorer()
+        scorer.learn_records(history)
+        stream = scorer.stream('R1', batch[0]['timestamp_utc'], thresholds)
+        confidence = stream.run(*_columns(batch), {k: [REASON]})[k]
+
+        # Same model as the stream had when it reached fix k: history plus the fixes before it
+        twin = OnlineScorer()
+        twin.learn_records(history + batch[:k])
+        expected = twin.snapshot().score('R1', *_columns(batch[k:k + 1]), {0: [REASON]}, thresholds)[0]
+        assert confidence == expected
+
+        # ...and afterwards it has learned the whole batch (the saved track state may differ in rounding)
+        twin.learn_records(batch[k:])
+        learned, expected_model = scorer._animals['R1'], twin._animals['R1']
+        assert (learned.learned, learned.counts) == (expected_model.learned, expected_model.counts)
+
+
+def test_reserve_models_persist_only_with_a_state_dir(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    (data_dir / TRACKS_FILE).write_text(json.dumps(_walk(200)))
+    (data_dir / HOTSPOTS_FILE).write_text(json.dumps({'hotspots': []}))
+
+    in_memory = ReserveRegistry(data_dir, state_dir='').get()
+    assert in_memory.state_dir is None and in_memory.scorer.path is None
+    assert in_memory.learn(in_memory.datasets.current().wildlife_data) == 200
+
+    state_dir = tmp_path / 'state'
+    reserve = ReserveRegistry(data_dir, state_dir=state_dir).get()
+    reserve.learn(reserve.datasets.current().wildlife_data)
+    assert (state_dir / reserve.id / MODEL_FILE).is_file()
+    assert ReserveRegistry(data_dir, state_dir=state_dir).get().model().version == reserve.model().version
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['data', 'state']
@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from routes import patrol
+
+
+def _waypoints(count, seed=7, spread=0.03):
+    rng = random.Random(seed)
+    return [{'id': f'w{i}', 'kind': 'alert', 'name': f'w{i}',
+             'latitude': -24 + rng.uniform(-spread, spread), 'longitude': 31.5 + rng.uniform(-spread, spread),
+             'priority': round(rng.uniform(10, 100), 1)} for i in range(count)]
+
+
+def _teams(count):
+    return [{'id': f't{i}', 'name': f'Team {i}', 'latitude': -24 + 0.05 * (i % 2) - 0.025,
+             'longitude': 31.5 + 0.05 * (i // 2) - 0.025} for i in range(count)]
+
+
+@pytest.mark.parametrize('time_limit', [None, 0.0])
+def test_every_team_gets_work_at_max_waypoints(time_limit):
+    # Construction is never cut off by the time limit, even a zero one
+    plan = patrol.plan_patrols(_waypoints(patrol.MAX_WAYPOINTS), _teams(4), time_limit=time_limit)
+    assert len(plan['routes']) == 4
+    assert all(len(route['waypoints']) >= 10 for route in plan['routes'])
+
+
+@pytest.mark.parametrize('return_to_start', [True, False])
+def test_routes_fit_the_budget_and_visit_each_waypoint_once(return_to_start):
+    waypoints = _waypoints(120, seed=3)
+    plan = patrol.plan_patrols(waypoints, _teams(3), budget_minutes=180, return_to_start=return_to_start)
+    visited = [w['id'] for route in plan['routes'] for w in route['waypoints']]
+    assert len(visited) == len(set(visited))
+    assert sorted(visited + [w['id'] for w in plan['unassigned']]) == sorted(w['id'] for w in waypoints)
+    assert all(route['duration_minutes'] <= 180 for route in plan['routes'])
+
+
+def test_insertion_cache_matches_full_rescan():
+    problem = patrol._Problem(_teams(2), _waypoints(40, seed=5), 4.0, 10.0)
+    routes = [[], []]
+    insertions = patrol._Insertions(problem, routes, range(2, 42), True)
+    patrol._insert_greedy(problem, insertions, [0.0, 0.0], 240)
+    for node, costs in insertions.best.items():
+        for t, (extra, _) in enumerate(costs):
+            assert extra == pytest.approx(problem.insertion_cost(t, routes[t], node, True)[0])
+
+
+def test_no_waypoints():
+    plan = patrol.plan_patrols([], _teams(2))
+    assert plan['routes'] == [] and plan['unassigned'] == []
@@ -0,0 +1,78 @@
+from utils.sync import ChangeLog, checkpoint_id
+
+
+def _fix(rid, timestamp, lat=-1.0):
+    return {'rhino_id': rid, 'timestamp_utc': timestamp, 'latitude': lat, 'longitude': 36.0}
+
+
+def _record(log, fixes, version):
+    log.put_many('fixes', (((f['rhino_id'], f['timestamp_utc']), f) for f in fixes))
+    log.checkpoint(version)
+
+
+def test_token_names_checkpoint_log_and_sequence():
+    log = ChangeLog()
+    assert log.token() == f'.{log.log_id}.0'
+    _record(log, [_fix('R1', 't1'), _fix('R1', 't2')], 'v1')
+    assert log.token() == f'{checkpoint_id("v1")}.{log.log_id}.2'
+    assert checkpoint_id('v1') == checkpoint_id('v1') != checkpoint_id('v2')
+
+
+def test_changes_since_a_token_are_compacted_by_key():
+    log = ChangeLog()
+    _record(log, [_fix('R1', 't1'), _fix('R1', 't2')], 'v1')
+    first = log.changes()
+    assert first['reset'] and len(first['fixes']) == 2
+
+    assert log.put_many('fixes', [(('R1', 't1'), _fix('R1', 't1'))]) == 0   # unchanged
+    log.put('fixes', ('R1', 't2'), _fix('R1', 't2', lat=-1.1))
+    log.put('fixes', ('R1', 't2'), _fix('R1', 't2', lat=-1.2))
+    delta = log.changes(first['token'])
+    assert not delta['reset'] and not delta['more']
+    assert delta['fixes'] == [_fix('R1', 't2', lat=-1.2)]
+    assert log.changes(delta['token'])['fixes'] == []
+
+
+def test_deletions_reach_devices_but_not_full_resyncs():
+    log = ChangeLog()
+    log.put_many('hotspots', [('H1', {'id': 'H1'}), ('H2', {'id': 'H2'})])
+    token = log.token()
+    assert log.delete_missing('hotspots', ['H1']) == 1
+    assert log.changes(token)['deleted'] == {'hotspots': ['H2']}
+    full = log.changes()
+    assert full['deleted'] == {} and full['hotspots'] == [{'id': 'H1'}]
+
+
+def test_limit_pages_through_changes():
+    log = ChangeLog()
+    _record(log, [_fix('R1', f't{i}') for i in range(5)], 'v1')
+    page = log.changes(limit=2)
+    seen = list(page['fixes'])
+    while page['more']:
+        page = log.changes(page['token'], limit=2)
+        seen += page['fixes']
+    assert [f['timestamp_utc'] for f in seen] == [f't{i}' for i in range(5)]
+
+
+def test_trimmed_history_forces_a_full_resync():
+    log = ChangeLog(max_entries=3)
+    _record(log, [_fix('R1', 't0')], 'v1')
+    old = log.token()
+    _record(log, [_fix('R1', f't{i}') for i in range(1, 5)], 'v2')
+    delta = log.changes(old)
+    assert delta['reset']
+    assert [f['timestamp_utc'] for f in delta['fixes']] == ['t2', 't3', 't4']
+
+
+def test_tokens_from_another_process_resume_from_the_checkpoint():
+    fixes = [_fix('R1', 't1'), _fix('R1', 't2')]
+    here, elsewhere = ChangeLog(), ChangeLog()
+    _record(here, fixes, 'v1')
+    _record(elsewhere, fixes, 'v1')
+    token = elsewhere.token()
+    here.put('fixes', ('R1', 't3'), _fix('R1', 't3'))
+
+    delta = here.changes(token)
+    assert not delta['reset'] and delta['fixes'] == [_fix('R1', 't3')]
+    for stale in (f'{checkpoint_id("v0")}.{elsewhere.log_id}.2', 'garbage', f'.{here.log_id}.x', None):
+        assert here.changes(stale)['reset']
@@ -0,0 +1,47 @@
+import json
+from array import array
+
+from utils.rollups import RollupStore
+from utils.tracks import TrackStore, NumberColumn, plain_records
+
+
+def _records():
+    return [
+        {'rhino_id': 'R1', 'timestamp_utc': '2024-01-15T08:00:00Z', 'latitude': -1.2921, 'longitude': 36.8219,
+         'speed_kmh': 0, 'heading': 90.5},
+        {'rhino_id': 'R2', 'timestamp_utc': '2024-01-15T08:00:00Z', 'latitude': -1.5, 'longitude': 36.9,
+         'speed_kmh': 1.25, 'heading': 180.0},
+        {'rhino_id': 'R1', 'timestamp_utc': '2024-01-15T08:30:00Z', 'latitude': -1.2925, 'longitude': 36.8301,
+         'speed_kmh': 2.3, 'heading': 91, 'collar': 'C7'},
+        {'rhino_id': 'R2', 'timestamp_utc': '2024-01-15T08:30:00Z', 'latitude': -1.51, 'longitude': 36.91,
+         'speed_kmh': 3.5, 'heading': 181.0},
+    ]
+
+
+def test_mixed_int_and_float_columns_are_packed_and_keep_their_types():
+    store = TrackStore(_records())
+    track = store.by_animal['R1']
+    assert isinstance(track.speed_kmh, NumberColumn)
+    assert isinstance(track.heading, NumberColumn)
+    assert isinstance(store.by_animal['R2'].speed_kmh, array)
+    assert [type(v) for v in track.speed_kmh] == [int, float]
+    assert store[0]['speed_kmh'] == 0 and type(store[0]['speed_kmh']) is int
+    assert isinstance(track.column('speed_kmh'), array)
+
+
+def test_to_list_matches_the_views_in_original_order():
+    records = _records()
+    records.append({'rhino_id': 'R3', 'timestamp_utc': 1705309200, 'latitude': None, 'longitude': 36.0})
+    store = TrackStore(records)
+    expected = [dict(view) for view in store]
+    assert json.dumps(store.to_list()) == json.dumps(expected)
+    assert json.dumps(store.to_list(), sort_keys=True) == json.dumps(records, sort_keys=True)
+    assert plain_records(records) is records
+
+
+def test_rollups_read_columns_like_records():
+    records = _records()
+    records.append({'rhino_id': 'R2', 'latitude': -1.6, 'longitude': 36.9})
+    from_store, from_list = RollupStore(), RollupStore()
+    assert from_store.add_fixes(TrackStore(records)) == from_list.add_fixes(records) == 4
+    assert from_store.snapshot('hour') == from_list.snapshot('hour')
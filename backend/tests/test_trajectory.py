@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+from utils import trajectory
+from utils.sync import encode_delta, decode_delta
+
+
+def _fix(rid, timestamp, lat, lon, **extra):
+    return dict({'rhino_id': rid, 'timestamp_utc': timestamp, 'latitude': lat, 'longitude': lon}, **extra)
+
+
+def _walk(rid, count, start_lat=-1.0, start_lon=36.0, step=0.001, start=1705305600):
+    """Fixes 30 minutes apart moving north-east in a straight line"""
+    return [_fix(rid, trajectory.format_timestamp(start + 1800 * i), start_lat + step * i, start_lon + step * i)
+            for i in range(count)]
+
+
+def _roundtrip(records):
+    return trajectory.decode_fixes(trajectory.encode_fixes(records))
+
+
+def _same(decoded, records):
+    """Equal values of equal types (0 vs 0.0, '...' vs an epoch number)"""
+    assert json.dumps(decoded, sort_keys=True) == json.dumps(records, sort_keys=True)
+
+
+def test_roundtrip_iso_timestamps_and_mixed_numbers():
+    records = [
+        _fix('R1', '2024-01-15T08:00:00Z', -1.2921, 36.8219, speed_kmh=0, heading=90.5),
+        _fix('R1', '2024-01-15T08:30:00Z', -1.2925, 36.8301, speed_kmh=2.3, heading=91),
+        _fix('R2', '2024-01-15T08:00:00Z', -1.5, 36.9, speed_kmh=1.25),
+    ]
+    _same(_roundtrip(records), records)
+
+
+def test_roundtrip_keeps_epoch_timestamps_numeric():
+    records = [_fix('R1', 1705307400, -1.2921, 36.8219), _fix('R1', 1705309200.5, -1.2925, 36.83)]
+    decoded = _roundtrip(records)
+    _same(decoded, records)
+    assert decoded[0]['timestamp_utc'] == 1705307400
+
+
+def test_roundtrip_keeps_non_canonical_timestamps():
+    records = [_fix('R1', '2024-01-15T08:00:00+03:00', -1.0, 36.0), _fix('R1', '2024-01-15T09:00:00.250Z', -1.1, 36.1)]
+    _same(_roundtrip(records), records)
+
+
+def test_roundtrip_missing_fields_extras_and_mixed_timestamp_types():
+    records = [
+        _fix('R1', '2024-01-15T08:00:00Z', -1.0, 36.0, collar='C7'),
+        {'rhino_id': 'R1', 'timestamp_utc': 1705309200, 'latitude': None},
+        {'timestamp_utc': '2024-01-15T10:00:00Z', 'latitude': -1.2, 'longitude': 36.2},
+    ]
+    decoded = _roundtrip(records)
+    key = lambda r: json.dumps(r, sort_keys=True)
+    assert sorted(map(key, decoded)) == sorted(map(key, records))
+
+
+def test_archive_is_smaller_than_json():
+    records = [_fix('R1', 1705307400 + 1800 * i, -1.29 + i * 1e-4, 36.82 + i * 1e-4, speed_kmh=round(i % 7 * 0.3, 1))
+               for i in range(500)]
+    for record in records:
+        record['timestamp_utc'] = trajectory.format_timestamp(record['timestamp_utc'])
+    blob = trajectory.encode_fixes(records)
+    assert len(blob) < len(json.dumps(records)) / 5
+    _same(trajectory.decode_fixes(blob), records)
+
+
+def test_rejects_foreign_blob():
+    with pytest.raises(ValueError):
+        trajectory.decode_fixes(b'not an archive')
+
+
+def test_sync_delta_roundtrip_keeps_timestamp_types():
+    fixes = [_fix('R1', 1705307400, -1.0, 36.0), _fix('R2', '2024-01-15T08:30:00Z', -1.1, 36.1, speed_kmh=0)]
+    delta = decode_delta(encode_delta({'token': 't', 'fixes': fixes}))
+    _same(sorted(delta['fixes'], key=lambda f: f['rhino_id']), fixes)
+
+
+def test_simplify_keeps_anomalies_and_endpoints():
+    track = _walk('R1', 50)
+    pinned = track[20]['timestamp_utc']
+    kept = trajectory.simplify_tracks(track, 10.0, anomalies=[('R1', pinned)])
+    assert [r['timestamp_utc'] for r in kept] == [track[0]['timestamp_utc'], pinned, track[-1]['timestamp_utc']]
+
+
+@pytest.mark.parametrize('method', ['dp', 'visvalingam'])
+def test_simplify_same_result_from_track_store(method):
+    from utils.tracks import TrackStore
+    records = _walk('R1', 40) + _walk('R2', 40, start_lat=-1.2, step=-0.0007)
+    records[10]['latitude'] += 0.01
+    assert trajectory.simplify_tracks(TrackStore(records), 50.0, method) == \
+        trajectory.simplify_tracks(records, 50.0, method)
+
+
+def test_viewport_clips_excursions():
+    # Inside the viewport for fixes 0-9, out for 10-29, back in for 30-39
+    track = _walk('R1', 40)
+    for i in range(10, 30):
+        track[i]['longitude'] += 1.0
+    bbox = [35.9, -1.1, 36.2, -0.9]
+    kept = trajectory.simplify_tracks(track, 0.0, bbox=bbox)
+    expected = track[:11] + track[29:]
+    assert [r['timestamp_utc'] for r in kept] == [r['timestamp_utc'] for r in expected]
+
+
+def test_simplify_sorts_mixed_timestamps_and_skips_unplaceable_fixes():
+    records = [
+        _fix('R1', 1705309200, -1.01, 36.01),
+        _fix('R1', '2024-01-15T08:00:00Z', -1.0, 36.0),
+        {'rhino_id': 'R1', 'timestamp_utc': '2024-01-15T09:00:00Z', 'longitude': 36.02},
+        _fix('R1', None, -1.03, 36.03),
+        _fix('R1', 'yesterday', -1.04, 36.04),
+    ]
+    kept = trajectory.simplify_tracks(records, 5.0, bbox=[35.0, -2.0, 37.0, 0.0])
+    assert [r['timestamp_utc'] for r in kept] == ['2024-01-15T08:00:00Z', 1705309200]
@@ -0,0 +1,232 @@
+"""
+Admission control for expensive endpoints.
+
+Requests are grouped into classes (LLM chains, image decodes, ingest,
+threshold backtests). Each
+class has a concurrency limit, a bounded wait queue with a timeout and a
+per-client token bucket; all classes also share ADMISSION_TOTAL_CONCURRENCY
+slots, of which ADMISSION_RESERVED_CRITICAL can only be used by critical
+classes, so alert ingest is never starved by a burst of dashboard refreshes.
+Waiters are served by priority, then arrival order.
+
+Rejections are fast: 429 when a client is over its rate, 503 when the queue
+is full or the wait timed out, both with a Retry-After estimate. Endpoints
+outside any class (health, data, metrics) are never queued.
+"""
+import itertools
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from utils.tracing import metrics
+
+admission_rejected = metrics.counter(
+    'wildguard_admission_rejected_total', 'Requests rejected by admission control', ('cls', 'reason'))
+admission_active = metrics.gauge(
+    'wildguard_admission_active', 'Admitted requests in progress', ('cls',))
+admission_queued = metrics.gauge(
+    'wildguard_admission_queued', 'Requests waiting for admission', ('cls',))
+
+CRITICAL = 0
+NORMAL = 1
+MAX_CLIENTS = 10000
+
+
+def _env(name, default, cast=float):
+    return cast(os.getenv(name, default))
+
+
+@dataclass(frozen=True)
+class AdmissionPolicy:
+    name: str
+    max_concurrent: int
+    max_queue: int
+    queue_timeout: float   # seconds a request may wait for a slot
+    rate: float            # sustained requests per second per client
+    burst: int             # bucket size per client
+    priority: int = NORMAL
+
+
+def default_policies():
+    """Classes for the expensive endpoints, tunable through ADMISSION_<CLASS>_* env vars"""
+    def policy(name, concurrent, queue, timeout, rate, burst, priority=NORMAL):
+        prefix = f'ADMISSION_{name.upper()}_'
+        return AdmissionPolicy(
+            name=name,
+            max_concurrent=_env(prefix + 'CONCURRENCY', concurrent, int),
+            max_queue=_env(prefix + 'QUEUE', queue, int),
+            queue_timeout=_env(prefix + 'QUEUE_TIMEOUT', timeout),
+            rate=_env(prefix + 'RATE', rate),
+            burst=_env(prefix + 'BURST', burst, int),
+            priority=priority
+        )
+    return {
+        'llm': policy('llm', 4, 8, 10.0, 0.2, 3),
+        'vision': policy('vision', os.cpu_count() or 2, 8, 5.0, 1.0, 5),
+        'ingest': policy('ingest', 16, 64, 5.0, 20.0, 100, CRITICAL),
+        # Threshold backtests use every CPU core: one at a time
+        'backtest': policy('backtest', 1, 1, 5.0, 1 / 60, 2)
+    }
+
+
+class AdmissionRejected(Exception):
+    """Request not admitted; status is 429 or 503, retry_after in whole seconds"""
+
+    def __init__(self, status, retry_after, reason):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    """Classic token bucket; take() returns 0 when admitted, else seconds until a token"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+
+class Ticket:
+    """An admitted request; hand it back to release()"""
+
+    __slots__ = ('policy', 'started')
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.started = time.monotonic()
+
+
+class AdmissionController:
+    """Per-class concurrency limits, shared slots, bounded priority queue and per-client rate limits"""
+
+    def __init__(self, policies=None, total=None, reserved=None):
+        self.policies = policies or default_policies()
+        self.total = total or _env('ADMISSION_TOTAL_CONCURRENCY', 24, int)
+        self.reserved = reserved if reserved is not None else _env('ADMISSION_RESERVED_CRITICAL', 4, int)
+        self._cond = threading.Condition()
+        self._active = {name: 0 for name in self.policies}
+        self._in_use = 0
+        self._waiting = []   # (priority, seq, policy) sorted
+        self._queued = {name: 0 for name in self.policies}
+        self._seq = itertools.count()
+        # Smoothed service time per class, for Retry-After estimates
+        self._service = {name: 1.0 for name in self.policies}
+        self._buckets = OrderedDict()
+        self._buckets_lock = threading.Lock()
+
+    def _rate_limit(self, policy, client):
+        """Seconds the client must wait before its next request of this class (0 = go)"""
+        key = (policy.name, client)
+        with self._buckets_lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(policy.rate, policy.burst)
+                if len(self._buckets) > MAX_CLIENTS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.take()
+
+    def _can_run(self, policy):
+        limit = self.total if policy.priority == CRITICAL else self.total - self.reserved
+        return self._active[policy.name] < policy.max_concurrent and self._in_use < limit
+
+    def _retry_after(self, policy):
+        waiting = self._queued[policy.name] + 1
+        estimate = self._service[policy.name] * waiting / max(policy.max_concurrent, 1)
+        return max(1, math.ceil(estimate))
+
+    def _reject(self, policy, status, retry_after, reason):
+        admission_rejected.inc(cls=policy.name, reason=reason)
+        return AdmissionRejected(status, retry_after, reason)
+
+    def _start(self, policy):
+        self._active[policy.name] += 1
+        self._in_use += 1
+        admission_active.inc(cls=policy.name)
+        return Ticket(policy)
+
+    def _first_runnable(self):
+        for entry in self._waiting:
+            if self._can_run(entry[2]):
+                return entry
+        return None
+
+    def acquire(self, name, client):
+        """Admit a request of class name from client, waiting for a slot if needed"""
+        policy = self.policies[name]
+        wait = self._rate_limit(policy, client)
+        if wait > 0:
+            raise self._reject(policy, 429, max(1, math.ceil(wait)), 'rate_limited')
+
+        with self._cond:
+            if self._can_run(policy) and self._first_runnable() is None:
+                return self._start(policy)
+            if self._queued[name] >= policy.max_queue:
+                raise self._reject(policy, 503, self._retry_after(policy), 'queue_full')
+
+            entry = (policy.priority, next(self._seq), policy)
+            self._waiting.append(entry)
+            self._waiting.sort(key=lambda e: e[:2])
+            self._queued[name] += 1
+            admission_queued.inc(cls=name)
+            deadline = time.monotonic() + policy.queue_timeout
+            try:
+                while True:
+                    if self._first_runnable() is entry:
+                        return self._start(policy)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._reject(policy, 503, self._retry_after(policy), 'queue_timeout')
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting.remove(entry)
+                self._queued[name] -= 1
+                admission_queued.dec(cls=name)
+                self._cond.notify_all()
+
+    def release(self, ticket):
+        name = ticket.policy.name
+        elapsed = time.monotonic() - ticket.started
+        with self._cond:
+            self._active[name] -= 1
+            self._in_use -= 1
+            self._service[name] = 0.8 * self._service[name] + 0.2 * elapsed
+            admission_active.dec(cls=name)
+            self._cond.notify_all()
+
+    def status(self):
+        with self._cond:
+            return {
+                'total_slots': self.total,
+                'in_use': self._in_use,
+                'classes': {
+                    name: {
+                        'active': self._active[name],
+                        'queued': self._queued[name],
+                        'max_concurrent': policy.max_concurrent,
+                        'max_queue': policy.max_queue,
+                        'avg_service_seconds': round(self._service[name], 3)
+                    }
+                    for name, policy in self.policies.items()
+                }
+            }
+
+
+# Global instance
+admission = AdmissionController()
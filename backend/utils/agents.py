@@ -1,83 +1,175 @@
 import os
-from dotenv import load_dotenv
 import json
+import logging
+import threading
+import time
 from datetime import datetime
 
-load_dotenv()
+from utils.tracing import tracer, llm_tokens
+from utils.prompts import prompt_builder, summarize_alerts, summarize_findings, estimate_tokens
+from utils.streaming import StreamCancelled, run_agent_step, stream_events
+from utils.llm_client import ResilientLLMClient, LLMUnavailableError
+from utils.simple_agents import simple_wildguard_agents
+from utils.backends import resolve_agent_mode
 
-# Initialize Groq client using OpenAI-compatible interface
-try:
-    import openai
-    
-    # Handle different OpenAI client versions
-    groq_api_key = os.getenv("GROQ_API_KEY")
-    if groq_api_key:
-        try:
-            # Try new OpenAI client initialization
-            client = openai.OpenAI(
-                base_url="https://api.groq.com/openai/v1",
-                api_key=groq_api_key
-            )
-        except Exception as e:
-            # Fallback for older versions or compatibility issues
-            print(f"OpenAI client initialization failed: {e}")
-            client = None
-    else:
-        client = None
-        print("GROQ_API_KEY not found in environment")
-        
-except ImportError:
-    print("OpenAI package not installed")
-    client = None
-    openai = None
+logger = logging.getLogger(__name__)
+
+# Sections of the consolidated JSON response -> (agent, agent_analyses key)
+CONSOLIDATED_SECTIONS = {
+    'planning': 'planner',
+    'movement': 'movement_analyst',
+    'vision': 'vision_analyst',
+    'risk_assessment': 'risk_scorer',
+    'final_report': 'report_generator'
+}
+
+_client = None
+_client_initialized = False
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    Return the shared Groq client, creating it on first use.
+
+    The OpenAI SDK import and connection pool setup are deferred so that
+    importing this module (and starting the app) stays cheap.
+    """
+    global _client, _client_initialized
+    if _client_initialized:
+        return _client
+    with _client_lock:
+        if _client_initialized:
+            return _client
+        # Initialize Groq client using OpenAI-compatible interface
+        groq_api_key = os.getenv("GROQ_API_KEY")
+        if not groq_api_key:
+            logger.warning("GROQ_API_KEY not found in environment")
+        else:
+            try:
+                # Shared pooled client with retries, deadlines and a circuit breaker
+                _client = ResilientLLMClient(
+                    base_url="https://api.groq.com/openai/v1",
+                    api_key=groq_api_key
+                )
+            except ImportError:
+                logger.warning("OpenAI package not installed")
+            except Exception as e:
+                logger.warning("OpenAI client initialization failed: %s", e)
+        _client_initialized = True
+        return _client
 
 class WildGuardAgents:
     """Multi-agent system for wildlife conservation using Groq API"""
     
     def __init__(self):
         self.model = "llama3-8b-8192"  # Groq's fast model
+        # Used whenever the upstream LLM is unhealthy or saturated
+        self.fallback = simple_wildguard_agents
+    
+    def _chat(self, agent_name, system_prompt, prompt, on_token=None, response_format=None):
+        """
+        Run one chat completion, tracing latency and token usage.
+
+        When on_token is given the completion is streamed and each text delta
+        is passed to it as it arrives; the full text is still returned.
+        response_format (e.g. {"type": "json_object"}) is passed to the API.
+        """
+        max_tokens = prompt_builder.max_tokens(agent_name)
+        temperature = prompt_builder.temperature(agent_name)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        extra = {'response_format': response_format} if response_format else {}
+        client = get_client()
+        with tracer.span(f'agent.{agent_name}') as span:
+            if on_token is None:
+                response = client.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    **extra
+                )
+                usage = getattr(response, 'usage', None)
+                tokens_in = getattr(usage, 'prompt_tokens', 0) or 0
+                tokens_out = getattr(usage, 'completion_tokens', 0) or 0
+                content = response.choices[0].message.content
+            else:
+                stream = client.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stream=True,
+                    **extra
+                )
+                parts = []
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        on_token(delta)
+                content = ''.join(parts)
+                # Streamed responses carry no usage block, so estimate locally
+                tokens_in = estimate_tokens(system_prompt) + estimate_tokens(prompt)
+                tokens_out = estimate_tokens(content)
+            llm_tokens.inc(tokens_in, agent=agent_name, direction='in')
+            llm_tokens.inc(tokens_out, agent=agent_name, direction='out')
+            span.set('tokens_in', tokens_in)
+            span.set('tokens_out', tokens_out)
+            logger.info("Agent %s completed in %.2fs", agent_name, time.perf_counter() - span.start)
+            return content
         
-    def planner_agent(self, wildlife_data, hotspots, alerts):
+    def planner_agent(self, wildlife_data, hotspots, alerts, patrol_plan=None, on_token=None):
         """Strategic planning agent for ranger deployment"""
-        if not client:
+        if not get_client():
             return "Groq client not available. Check GROQ_API_KEY and OpenAI installation."
             
-        prompt = f"""
+        system_prompt, prompt = prompt_builder.build(
+            'planner',
+            "You are an expert wildlife conservation strategist.",
+            f"""
 You are a wildlife conservation strategic planner. Analyze the data and create an optimal ranger deployment plan.
 
 WILDLIFE DATA: {len(wildlife_data)} tracked animals
 HOTSPOTS: {len(hotspots.get('hotspots', []))} known risk areas  
 CURRENT ALERTS: {len(alerts)} active alerts
+COMPUTED PATROL ROUTES: {{evidence}}
 
 Create a tactical deployment plan including:
-1. Priority zones for immediate patrol
+1. Priority zones for immediate patrol (follow the computed routes)
 2. Resource allocation recommendations
 3. Risk mitigation strategies
 4. Timeline for actions
 
 Be concise and actionable.
-"""
+""",
+            evidence=patrol_plan or ['No routes computed'],
+            summarize=lambda lines: lines[:3]
+        )
         
         try:
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert wildlife conservation strategist."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=500,
-                temperature=0.3
-            )
-            return response.choices[0].message.content
+            return self._chat('planner', system_prompt, prompt, on_token)
+        except StreamCancelled:
+            raise
+        except LLMUnavailableError as e:
+            logger.warning("Agent planner falling back to simulated output: %s", e)
+            return self.fallback.planner_agent(wildlife_data, hotspots, alerts, patrol_plan)
         except Exception as e:
             return f"Planner agent error: {str(e)}"
     
-    def movement_analyst_agent(self, movement_alerts):
+    def movement_analyst_agent(self, movement_alerts, hotspots=None, on_token=None):
         """Specialized agent for movement pattern analysis"""
-        prompt = f"""
+        system_prompt, prompt = prompt_builder.build(
+            'movement_analyst',
+            "You are a wildlife behavior expert specializing in anti-poaching detection.",
+            """
 Analyze these wildlife movement alerts for patterns and threats:
 
-ALERTS: {json.dumps(movement_alerts[:3], indent=2)}
+ALERTS: {evidence}
 
 Identify:
 1. Movement anomaly patterns
@@ -86,28 +178,30 @@ Identify:
 4. Recommended monitoring adjustments
 
 Provide expert wildlife behavior analysis.
-"""
+""",
+            evidence=movement_alerts,
+            summarize=lambda alerts: summarize_alerts(alerts, hotspots)
+        )
         
         try:
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a wildlife behavior expert specializing in anti-poaching detection."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=400,
-                temperature=0.2
-            )
-            return response.choices[0].message.content
+            return self._chat('movement_analyst', system_prompt, prompt, on_token)
+        except StreamCancelled:
+            raise
+        except LLMUnavailableError as e:
+            logger.warning("Agent movement_analyst falling back to simulated output: %s", e)
+            return self.fallback.movement_analyst_agent(movement_alerts)
         except Exception as e:
             return f"Movement analyst error: {str(e)}"
     
-    def vision_analyst_agent(self, image_findings):
+    def vision_analyst_agent(self, image_findings, on_token=None):
         """Agent for analyzing visual evidence and camera trap data"""
-        prompt = f"""
+        system_prompt, prompt = prompt_builder.build(
+            'vision_analyst',
+            "You are a forensic analyst specializing in wildlife crime detection.",
+            """
 Analyze these visual findings from camera traps and surveillance:
 
-FINDINGS: {json.dumps(image_findings, indent=2)}
+FINDINGS: {evidence}
 
 Assess:
 1. Threat level of detected objects/activities
@@ -116,25 +210,27 @@ Assess:
 4. Correlation with known poaching methods
 
 Provide forensic-level analysis for conservation officers.
-"""
+""",
+            evidence=image_findings,
+            summarize=summarize_findings
+        )
         
         try:
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a forensic analyst specializing in wildlife crime detection."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=400,
-                temperature=0.2
-            )
-            return response.choices[0].message.content
+            return self._chat('vision_analyst', system_prompt, prompt, on_token)
+        except StreamCancelled:
+            raise
+        except LLMUnavailableError as e:
+            logger.warning("Agent vision_analyst falling back to simulated output: %s", e)
+            return self.fallback.vision_analyst_agent(image_findings)
         except Exception as e:
             return f"Vision analyst error: {str(e)}"
     
-    def risk_scoring_agent(self, movement_alerts, vision_findings, risk_score):
+    def risk_scoring_agent(self, movement_alerts, vision_findings, risk_score, on_token=None):
         """Agent for intelligent risk assessment and scoring"""
-        prompt = f"""
+        system_prompt, prompt = prompt_builder.build(
+            'risk_scorer',
+            "You are a risk assessment specialist for wildlife conservation.",
+            f"""
 Evaluate the current conservation threat level:
 
 MOVEMENT ALERTS: {len(movement_alerts)} detected
@@ -149,25 +245,25 @@ Provide:
 
 Focus on accuracy and false positive reduction.
 """
+        )
         
         try:
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a risk assessment specialist for wildlife conservation."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=300,
-                temperature=0.1
-            )
-            return response.choices[0].message.content
+            return self._chat('risk_scorer', system_prompt, prompt, on_token)
+        except StreamCancelled:
+            raise
+        except LLMUnavailableError as e:
+            logger.warning("Agent risk_scorer falling back to simulated output: %s", e)
+            return self.fallback.risk_scoring_agent(movement_alerts, vision_findings, risk_score)
         except Exception as e:
             return f"Risk scoring agent error: {str(e)}"
     
-    def report_generator_agent(self, alerts, risk_score, analysis_results):
+    def report_generator_agent(self, alerts, risk_score, analysis_results, on_token=None):
         """Agent for generating comprehensive ranger briefings"""
-        prompt = f"""
-Generate a professional ranger briefing report:
+        system_prompt, prompt = prompt_builder.build(
+            'report_generator',
+            "You are a conservation operations coordinator writing for field rangers.",
+            f"""
+{prompt_builder.template('ranger_briefing', 'Generate a professional ranger briefing report:')}
 
 ALERTS: {len(alerts)} total
 RISK SCORE: {risk_score}/100
@@ -181,37 +277,111 @@ Create a briefing that includes:
 
 Format for field rangers - clear, actionable, professional.
 """
+        )
         
         try:
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a conservation operations coordinator writing for field rangers."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=600,
-                temperature=0.2
-            )
-            return response.choices[0].message.content
+            return self._chat('report_generator', system_prompt, prompt, on_token)
+        except StreamCancelled:
+            raise
+        except LLMUnavailableError as e:
+            logger.warning("Agent report_generator falling back to simulated output: %s", e)
+            return self.fallback.report_generator_agent(alerts, risk_score, analysis_results)
         except Exception as e:
             return f"Report generator error: {str(e)}"
     
-    def orchestrate_agents(self, wildlife_data, hotspots, movement_alerts, vision_findings, risk_score):
-        """Coordinate all agents for comprehensive analysis"""
+    def consolidated_agent(self, wildlife_data, hotspots, movement_alerts, vision_findings, risk_score,
+                           patrol_plan=None):
+        """All five analyses from a single JSON-mode completion, as a dict of section texts"""
+        if not get_client():
+            raise LLMUnavailableError("Groq client not available")
+        
+        evidence = {
+            'movement_alerts': movement_alerts,
+            'vision_findings': vision_findings,
+            'patrol_routes': patrol_plan or ['No routes computed']
+        }
+        
+        def summarize(items):
+            alerts = summarize_alerts(items['movement_alerts'], hotspots)
+            findings = summarize_findings(items['vision_findings'])
+            return {
+                'total_alerts': alerts['total_alerts'],
+                'reasons': alerts['reasons'],
+                'animals': alerts['animals'],
+                'hotspots': alerts['hotspots'],
+                'findings': findings['labels'],
+                'patrol_routes': items['patrol_routes'][:3]
+            }
+        
+        system_prompt, prompt = prompt_builder.build(
+            'consolidated',
+            "You are a wildlife conservation operations team: strategist, behavior expert, "
+            "forensic analyst, risk specialist and briefing coordinator.",
+            f"""
+Analyze the current anti-poaching situation as five specialists at once.
+
+WILDLIFE DATA: {len(wildlife_data)} tracked animals
+HOTSPOTS: {len(hotspots.get('hotspots', []))} known risk areas
+MOVEMENT ALERTS: {len(movement_alerts)} detected
+VISION FINDINGS: {len(vision_findings)} items
+COMPUTED RISK SCORE: {risk_score}/100
+EVIDENCE (alerts, findings, computed patrol routes): {{evidence}}
+
+Respond with one JSON object and nothing else, with exactly these string fields:
+{{"planning": "ranger deployment plan following the computed routes: priority zones, resources, timeline",
+ "movement": "movement anomaly patterns, threat indicators, stress behaviour, monitoring adjustments",
+ "vision": "threat level and reliability of visual evidence, follow-up actions",
+ "risk_assessment": "validation of the computed score, missing factors, confidence",
+ "final_report": "ranger briefing: executive summary, immediate actions, deployment, follow-up monitoring"}}
+
+Be concise and actionable.
+""",
+            evidence=evidence,
+            summarize=summarize
+        )
+        return parse_consolidated(self._chat('consolidated', system_prompt, prompt,
+                                             response_format={"type": "json_object"}))
+    
+    def orchestrate_agents(self, wildlife_data, hotspots, movement_alerts, vision_findings, risk_score,
+                           patrol_plan=None, emit=None, agent_mode=None):
+        """
+        Coordinate all agents for comprehensive analysis.
+
+        patrol_plan is the route summary from routes.patrol, handed to the planner.
+        agent_mode 'consolidated' asks for every analysis in one JSON completion
+        and falls back to one call per agent if that fails or does not parse.
+
+        Pass emit(event, data) to receive tokens and finished sections as each
+        agent runs (see utils.streaming).
+        """
+        consolidated_error = None
+        if resolve_agent_mode(agent_mode) == 'consolidated':
+            try:
+                return self._orchestrate_consolidated(
+                    wildlife_data, hotspots, movement_alerts, vision_findings, risk_score, patrol_plan, emit)
+            except StreamCancelled:
+                raise
+            except Exception as e:
+                logger.warning("Consolidated agent call failed, using one call per agent: %s", e)
+                consolidated_error = str(e)
         
-        print("🤖 Starting multi-agent analysis...")
+        logger.info("🤖 Starting multi-agent analysis...")
         
         # Agent 1: Strategic Planning
-        planning_analysis = self.planner_agent(wildlife_data, hotspots, movement_alerts)
+        planning_analysis = run_agent_step(emit, 'planner', 'planning', lambda on_token:
+            self.planner_agent(wildlife_data, hotspots, movement_alerts, patrol_plan, on_token=on_token))
         
         # Agent 2: Movement Analysis  
-        movement_analysis = self.movement_analyst_agent(movement_alerts)
+        movement_analysis = run_agent_step(emit, 'movement_analyst', 'movement', lambda on_token:
+            self.movement_analyst_agent(movement_alerts, hotspots, on_token=on_token))
         
         # Agent 3: Vision Analysis
-        vision_analysis = self.vision_analyst_agent(vision_findings)
+        vision_analysis = run_agent_step(emit, 'vision_analyst', 'vision', lambda on_token:
+            self.vision_analyst_agent(vision_findings, on_token=on_token))
         
         # Agent 4: Risk Assessment
-        risk_analysis = self.risk_scoring_agent(movement_alerts, vision_findings, risk_score)
+        risk_analysis = run_agent_step(emit, 'risk_scorer', 'risk_assessment', lambda on_token:
+            self.risk_scoring_agent(movement_alerts, vision_findings, risk_score, on_token=on_token))
         
         # Compile results
         analysis_results = {
@@ -223,14 +393,72 @@ Format for field rangers - clear, actionable, professional.
         }
         
         # Agent 5: Final Report Generation
-        final_report = self.report_generator_agent(movement_alerts, risk_score, analysis_results)
+        final_report = run_agent_step(emit, 'report_generator', 'final_report', lambda on_token:
+            self.report_generator_agent(movement_alerts, risk_score, analysis_results, on_token=on_token))
         
+        result = {
+            'agent_analyses': analysis_results,
+            'final_report': final_report,
+            'timestamp': datetime.utcnow().isoformat(),
+            'agents_used': ['planner', 'movement_analyst', 'vision_analyst', 'risk_scorer', 'report_generator'],
+            'mode': 'multi_call'
+        }
+        if consolidated_error:
+            result['consolidated_error'] = consolidated_error
+        return result
+    
+    def _orchestrate_consolidated(self, wildlife_data, hotspots, movement_alerts, vision_findings, risk_score,
+                                  patrol_plan, emit):
+        """Single-call orchestration in the same shape as the multi-call result"""
+        logger.info("🤖 Starting consolidated agent analysis...")
+        if emit is not None:
+            emit('agent_start', {'agent': 'consolidated', 'section': 'all'})
+        sections = self.consolidated_agent(
+            wildlife_data, hotspots, movement_alerts, vision_findings, risk_score, patrol_plan)
+        if emit is not None:
+            for section, agent in CONSOLIDATED_SECTIONS.items():
+                emit('section', {'agent': agent, 'section': section, 'content': sections[section]})
+        
+        final_report = sections.pop('final_report')
+        analysis_results = dict(
+            sections,
+            summary=f"Consolidated agent analysis completed with {len(movement_alerts)} alerts processed"
+        )
         return {
             'agent_analyses': analysis_results,
             'final_report': final_report,
             'timestamp': datetime.utcnow().isoformat(),
-            'agents_used': ['planner', 'movement_analyst', 'vision_analyst', 'risk_scorer', 'report_generator']
+            'agents_used': ['consolidated'],
+            'mode': 'consolidated'
         }
+    
+    def stream_agents(self, **kwargs):
+        """Yield (event, data) pairs for a streamed orchestration, ending with 'complete'"""
+        return stream_events(lambda emit: emit('complete', self.orchestrate_agents(emit=emit, **kwargs)))
+
+def parse_consolidated(text):
+    """
+    Validate a consolidated response and return its sections.
+
+    Tolerates code fences or prose around the JSON object. Lists of strings
+    are joined into lines; anything else missing or malformed raises ValueError.
+    """
+    text = (text or '').strip()
+    start, end = text.find('{'), text.rfind('}')
+    if start < 0 or end < start:
+        raise ValueError("consolidated response contains no JSON object")
+    data = json.loads(text[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("consolidated response is not a JSON object")
+    sections = {}
+    for key in CONSOLIDATED_SECTIONS:
+        value = data.get(key)
+        if isinstance(value, list) and all(isinstance(item, str) for item in value):
+            value = '\n'.join(value)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"consolidated response is missing section '{key}'")
+        sections[key] = value.strip()
+    return sections
 
 # Global instance
 wildguard_agents = WildGuardAgents()
\ No newline at end of file
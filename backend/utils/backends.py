@@ -0,0 +1,113 @@
+"""
+Central registry for the agent backend used by every route.
+
+The backend (Groq or simulated) is chosen once and constructed lazily on
+first use, so importing the app does not pay for the LLM SDK. It can be
+swapped at runtime, e.g. to force the simulated agents during an outage.
+"""
+import importlib.util
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = {
+    'groq': ('utils.agents', 'wildguard_agents'),
+    'simulated': ('utils.simple_agents', 'simple_wildguard_agents'),
+}
+
+# multi_call: one completion per agent; consolidated: one JSON completion for all
+AGENT_MODES = ('multi_call', 'consolidated')
+
+
+def resolve_agent_mode(mode=None):
+    """Requested orchestration mode, or AGENT_MODE from the environment"""
+    mode = (mode or os.getenv('AGENT_MODE', 'multi_call')).lower()
+    if mode not in AGENT_MODES:
+        raise ValueError(f"Unknown agent mode: {mode} (expected one of: {', '.join(AGENT_MODES)})")
+    return mode
+
+
+class AgentBackendRegistry:
+    """Selects, lazily constructs and hot-swaps the agent backend"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backend = None
+        self._agent_type = None
+        self._requested = None
+
+    def _select(self):
+        """Pick a backend name without importing any backend module"""
+        requested = self._requested or os.getenv('AGENT_BACKEND', 'auto').lower()
+        if requested in BACKENDS:
+            return requested
+        if os.getenv('GROQ_API_KEY') and importlib.util.find_spec('openai') is not None:
+            return 'groq'
+        return 'simulated'
+
+    def _load(self, name):
+        module_name, attribute = BACKENDS[name]
+        module = __import__(module_name, fromlist=[attribute])
+        return getattr(module, attribute)
+
+    def current(self):
+        """
+        (backend, agent type), constructing the backend on first use.
+
+        Both are read under the lock, so a concurrent set_backend is seen
+        either entirely or not at all.
+        """
+        with self._lock:
+            if self._agent_type is None:
+                name = self._select()
+                try:
+                    self._backend = self._load(name)
+                    self._agent_type = name
+                except ImportError as e:
+                    logger.warning("Agent backend %s unavailable: %s", name, e)
+                    try:
+                        self._backend = self._load('simulated')
+                        self._agent_type = 'simulated'
+                    except ImportError:
+                        self._backend = None
+                        self._agent_type = 'none'
+                logger.info("Agent backend initialized: %s", self._agent_type)
+            return self._backend, self._agent_type
+
+    def get(self):
+        """Return the active backend, constructing it on first use"""
+        return self.current()[0]
+
+    @property
+    def agent_type(self):
+        return self.current()[1]
+
+    @property
+    def available(self):
+        return self.get() is not None
+
+    def set_backend(self, backend):
+        """
+        Swap the backend at runtime.
+
+        backend is 'groq', 'simulated', 'auto' (re-run selection on next use)
+        or an object implementing the agent interface.
+        """
+        with self._lock:
+            if isinstance(backend, str):
+                name = backend.lower()
+                if name != 'auto' and name not in BACKENDS:
+                    raise ValueError(f"Unknown agent backend: {backend}")
+                self._requested = None if name == 'auto' else name
+                self._backend = None
+                self._agent_type = None
+            else:
+                self._requested = None
+                self._backend = backend
+                self._agent_type = 'custom'
+
+
+# Global instance
+agent_backends = AgentBackendRegistry()
@@ -0,0 +1,166 @@
+"""
+Versioned, hot-reloadable hotspot and track datasets.
+
+Each load produces an immutable Dataset snapshot (raw data, indexes and a
+content-derived version). Reloads parse and index the new files off the
+request path and then swap the snapshot reference in one assignment, so a
+request that grabbed a snapshot keeps seeing consistent data.
+"""
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import threading
+from datetime import datetime
+
+from utils.tracks import TrackStore
+
+logger = logging.getLogger(__name__)
+
+TRACKS_FILE = 'wildguard_simulated_tracks.json'
+HOTSPOTS_FILE = 'hotspots.json'
+
+
+class Dataset:
+    """Immutable snapshot of one version of the tracks and hotspots"""
+
+    def __init__(self, wildlife_data, hotspots, version, loaded_at):
+        # Fixes are held column-wise; iterate for dict-like FixViews
+        self.wildlife_data = wildlife_data if isinstance(wildlife_data, TrackStore) else TrackStore(wildlife_data)
+        self.hotspots = hotspots
+        self.version = version
+        self.loaded_at = loaded_at
+        # Indexes built once per version
+        self.tracks_by_animal = self.wildlife_data.by_animal
+        self.hotspots_by_id = {h.get('id'): h for h in hotspots.get('hotspots', [])}
+
+    @property
+    def etag(self):
+        return f'"{self.version}"'
+
+
+class DatasetManager:
+    """Loads the data directory, watches it for changes and swaps versions"""
+
+    def __init__(self, data_dir, watch_interval=None):
+        self.data_dir = pathlib.Path(data_dir)
+        self.watch_interval = watch_interval if watch_interval is not None else float(
+            os.getenv('DATASET_WATCH_INTERVAL', 0))
+        self._current = None
+        self._reload_lock = threading.Lock()
+        self._deliver_lock = threading.Lock()
+        self._delivered = None
+        self._listeners = []
+        self._mtimes = None
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def _file_mtimes(self):
+        return tuple(
+            (self.data_dir / name).stat().st_mtime_ns
+            for name in (TRACKS_FILE, HOTSPOTS_FILE)
+        )
+
+    def _load(self):
+        """Parse and index both files; raises on invalid data without swapping"""
+        with open(self.data_dir / TRACKS_FILE, 'rb') as f:
+            tracks_raw = f.read()
+        with open(self.data_dir / HOTSPOTS_FILE, 'rb') as f:
+            hotspots_raw = f.read()
+
+        wildlife_data = json.loads(tracks_raw)
+        hotspots = json.loads(hotspots_raw)
+        if not isinstance(wildlife_data, list) or not isinstance(hotspots.get('hotspots'), list):
+            raise ValueError('Unexpected dataset layout')
+
+        digest = hashlib.sha256(tracks_raw + b'\0' + hotspots_raw).hexdigest()[:16]
+        return Dataset(wildlife_data, hotspots, digest, datetime.utcnow().isoformat())
+
+    def current(self):
+        """Return the active snapshot, loading it on first use"""
+        dataset = self._current
+        if dataset is None:
+            self.reload()
+            dataset = self._current
+        return dataset
+
+    @property
+    def version(self):
+        return self.current().version
+
+    def on_swap(self, callback):
+        """Register callback(old, new) to run after a new version goes live (serialized, newest wins)"""
+        self._listeners.append(callback)
+        return callback
+
+    def reload(self):
+        """
+        Load the data directory and swap it in if the content changed.
+
+        Returns True when a new version went live. If parsing fails the
+        previous version stays active and the error is raised.
+        """
+        with self._reload_lock:
+            # Remember mtimes even if parsing fails so the watcher retries
+            # only after the files change again
+            self._mtimes = self._file_mtimes()
+            dataset = self._load()
+            current = self._current
+            if current is not None and current.version == dataset.version:
+                return False
+            # Single reference assignment: readers see old or new, never a mix
+            self._current = dataset
+        logger.info("Dataset version %s live (%d fixes, %d hotspots)",
+                    dataset.version, len(dataset.wildlife_data), len(dataset.hotspots_by_id))
+        self._deliver(dataset)
+        return True
+
+    def _deliver(self, dataset):
+        """
+        Run the swap listeners for dataset, one version at a time. A version
+        that was superseded before its turn is skipped, so listeners never
+        see an older version after a newer one; old is the version they
+        were last given.
+        """
+        with self._deliver_lock:
+            if self._current is not dataset:
+                return
+            old, self._delivered = self._delivered, dataset
+            for callback in list(self._listeners):
+                try:
+                    callback(old, dataset)
+                except Exception:
+                    logger.exception("Dataset swap listener failed")
+
+    def reload_async(self):
+        """Reload in a background thread so the caller returns immediately"""
+        thread = threading.Thread(target=self._safe_reload, name='dataset-reload', daemon=True)
+        thread.start()
+        return thread
+
+    def _safe_reload(self):
+        try:
+            self.reload()
+        except Exception:
+            logger.exception("Dataset reload failed; keeping version %s",
+                             self._current.version if self._current else None)
+
+    def start_watching(self):
+        """Poll file modification times every watch_interval seconds"""
+        if self.watch_interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name='dataset-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.watch_interval):
+            try:
+                if self._file_mtimes() != self._mtimes:
+                    self._safe_reload()
+            except OSError:
+                # Files are mid-replacement; try again next tick
+                continue
@@ -0,0 +1,38 @@
+"""Shared geographic constants and helpers (projection scale, distances, hotspots)"""
+import math
+
+KM_PER_DEGREE = 111.32   # of latitude; scale by cos(latitude) for longitude
+EARTH_RADIUS_KM = 6371.0
+
+# Hotspot proximity radius in degrees (~1km); movement.DEFAULT_THRESHOLDS starts from it
+HOTSPOT_RADIUS_DEG = 0.01
+# A hotspot's weight halves every this many days since its last incident
+HOTSPOT_HALF_LIFE_DAYS = 14.0
+
+RISK_ORDER = {'CRITICAL': 0, 'HIGH': 1, 'MEDIUM': 2, 'LOW': 3}
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def nearest_hotspot(lat, lon, hotspots, radius_deg=HOTSPOT_RADIUS_DEG):
+    """Closest hotspot (from a hotspot list) within radius_deg of a point, or None"""
+    if lat is None or lon is None:
+        return None
+    best, best_dist = None, radius_deg
+    for hotspot in hotspots:
+        dist = math.sqrt((lat - hotspot['latitude'])**2 + (lon - hotspot['longitude'])**2)
+        if dist < best_dist:
+            best, best_dist = hotspot, dist
+    return best
+
+
+def priority_hotspots(hotspots):
+    """Hotspots ordered by risk level, then most recent incident first"""
+    ordered = sorted(hotspots.get('hotspots', []), key=lambda h: h.get('last_incident', ''), reverse=True)
+    return sorted(ordered, key=lambda h: RISK_ORDER.get(h.get('risk_level', 'LOW'), len(RISK_ORDER)))
@@ -0,0 +1,277 @@
+"""
+Resilient, pooled LLM client shared by the Groq-backed agents.
+
+Wraps the OpenAI-compatible SDK with:
+- a tuned HTTP connection pool with keep-alive
+- per-call deadlines covering queueing, retries and backoff
+- jittered exponential backoff on 429/5xx that honours Retry-After
+- a circuit breaker that fails fast while upstream is unhealthy
+- a concurrency limiter that keeps us under provider rate limits
+"""
+import os
+import random
+import threading
+import time
+
+from utils.tracing import metrics
+
+llm_retries = metrics.counter(
+    'wildguard_llm_retries_total', 'LLM calls retried after a transient failure', ('reason',))
+llm_failures = metrics.counter(
+    'wildguard_llm_unavailable_total', 'LLM calls that failed fast or exhausted retries', ('reason',))
+llm_breaker_state = metrics.gauge(
+    'wildguard_llm_circuit_open', 'Whether the LLM circuit breaker is open (1) or closed (0)')
+llm_waiting = metrics.gauge(
+    'wildguard_llm_waiting_calls', 'LLM calls waiting for a concurrency slot')
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMUnavailableError(Exception):
+    """Upstream LLM cannot serve this call; callers should use the fallback agents"""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """The circuit breaker is open after repeated upstream failures"""
+
+
+class ConcurrencyLimitError(LLMUnavailableError):
+    """No concurrency slot became free before the call's deadline"""
+
+
+class UpstreamDegradedError(LLMUnavailableError):
+    """Retries were exhausted or the deadline passed on transient errors"""
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+class CircuitBreaker:
+    """
+    Classic closed/open/half-open breaker.
+
+    Opens after failure_threshold consecutive failures, rejects calls for
+    reset_timeout seconds, then lets a single trial call through.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+        llm_breaker_state.set(0)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                opened = True
+            else:
+                opened = False
+        if opened:
+            llm_breaker_state.set(1)
+
+    def release_trial(self):
+        """Give back a half-open trial slot that ended without a verdict"""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class _SlotStream:
+    """Iterates a streamed completion and frees its concurrency slot exactly once"""
+
+    def __init__(self, stream, slots):
+        self._stream = stream
+        self._slots = slots
+        self._released = False
+        self._lock = threading.Lock()
+
+    def _release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._slots.release()
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                yield chunk
+        finally:
+            self._release()
+
+    def __del__(self):
+        self._release()
+
+
+class ResilientLLMClient:
+    """Chat completion client with pooling, deadlines, retries and a breaker"""
+
+    def __init__(self, api_key, base_url="https://api.groq.com/openai/v1",
+                 timeout=None, max_retries=None, max_concurrency=None,
+                 pool_connections=None, keepalive_expiry=None,
+                 backoff_base=None, backoff_max=None, breaker=None):
+        import httpx
+        import openai
+
+        self._openai = openai
+        self.timeout = timeout if timeout is not None else _env_float('LLM_TIMEOUT_SECONDS', 20)
+        self.max_retries = max_retries if max_retries is not None else _env_int('LLM_MAX_RETRIES', 3)
+        self.backoff_base = backoff_base if backoff_base is not None else _env_float('LLM_BACKOFF_BASE_SECONDS', 0.5)
+        self.backoff_max = backoff_max if backoff_max is not None else _env_float('LLM_BACKOFF_MAX_SECONDS', 8)
+        max_concurrency = max_concurrency or _env_int('LLM_MAX_CONCURRENCY', 4)
+        pool_connections = pool_connections or _env_int('LLM_POOL_CONNECTIONS', max(max_concurrency * 2, 10))
+        keepalive_expiry = keepalive_expiry if keepalive_expiry is not None else _env_float('LLM_KEEPALIVE_SECONDS', 60)
+
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=_env_int('LLM_BREAKER_THRESHOLD', 5),
+            reset_timeout=_env_float('LLM_BREAKER_RESET_SECONDS', 30)
+        )
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        self._http = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=pool_connections,
+                max_keepalive_connections=pool_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=min(5.0, self.timeout))
+        )
+        # Retries are handled here so the deadline and breaker see every attempt
+        self._client = openai.OpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            http_client=self._http,
+            max_retries=0
+        )
+
+    def _classify(self, error):
+        """Return (retryable, reason, retry_after_seconds) for an SDK error"""
+        openai = self._openai
+        if isinstance(error, openai.APIStatusError):
+            status = error.status_code
+            retry_after = None
+            headers = getattr(error.response, 'headers', None) or {}
+            value = headers.get('retry-after')
+            if value is not None:
+                try:
+                    retry_after = max(0.0, float(value))
+                except ValueError:
+                    retry_after = None
+            return status in RETRYABLE_STATUS, f'http_{status}', retry_after
+        if isinstance(error, openai.APITimeoutError):
+            return True, 'timeout', None
+        if isinstance(error, openai.APIConnectionError):
+            return True, 'connection', None
+        return False, type(error).__name__, None
+
+    def _backoff(self, attempt, retry_after):
+        if retry_after is not None:
+            return retry_after
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def create(self, deadline=None, **kwargs):
+        """
+        Run chat.completions.create within deadline seconds (default: timeout).
+
+        Raises LLMUnavailableError subclasses when upstream is unhealthy and
+        re-raises non-retryable SDK errors (bad request, auth) unchanged.
+        For stream=True the concurrency slot is held until the stream ends.
+        """
+        deadline_at = time.monotonic() + (deadline if deadline is not None else self.timeout)
+
+        if not self.breaker.allow():
+            llm_failures.inc(reason='circuit_open')
+            raise CircuitOpenError('LLM circuit breaker is open')
+
+        llm_waiting.inc()
+        try:
+            acquired = self._slots.acquire(timeout=max(0.0, deadline_at - time.monotonic()))
+        finally:
+            llm_waiting.dec()
+        if not acquired:
+            self.breaker.release_trial()
+            llm_failures.inc(reason='concurrency')
+            raise ConcurrencyLimitError('Timed out waiting for an LLM concurrency slot')
+
+        streaming = bool(kwargs.get('stream'))
+        try:
+            response = self._create_with_retries(deadline_at, kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        if streaming:
+            return self._hold_slot(response)
+        self._slots.release()
+        return response
+
+    def _create_with_retries(self, deadline_at, kwargs):
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                self.breaker.record_failure()
+                llm_failures.inc(reason='deadline')
+                raise UpstreamDegradedError('LLM call deadline exceeded')
+            try:
+                response = self._client.with_options(timeout=remaining).chat.completions.create(**kwargs)
+                self.breaker.record_success()
+                return response
+            except Exception as e:
+                retryable, reason, retry_after = self._classify(e)
+                if not retryable:
+                    # The request itself is bad; upstream is healthy
+                    self.breaker.release_trial()
+                    raise
+                delay = self._backoff(attempt, retry_after)
+                attempt += 1
+                if attempt > self.max_retries or time.monotonic() + delay >= deadline_at:
+                    self.breaker.record_failure()
+                    llm_failures.inc(reason=reason)
+                    raise UpstreamDegradedError(f'LLM upstream unavailable ({reason})') from e
+                llm_retries.inc(reason=reason)
+                time.sleep(delay)
+
+    def _hold_slot(self, stream):
+        return _SlotStream(stream, self._slots)
+
+    def close(self):
+        self._http.close()
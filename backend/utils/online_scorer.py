@@ -0,0 +1,509 @@
+"""
+Online statistical anomaly scoring for collar fixes.
+
+Every animal keeps streaming distributions of four movement features: speed,
+step length, turning angle and dwell time (minutes spent within
+DWELL_RADIUS_KM of where it stopped). Each distribution is a fixed-bin
+histogram (log-spaced where the feature is heavy-tailed) whose counts are
+halved once they pass twice ANOMALY_MODEL_HALF_LIFE fixes, so memory per
+animal is constant, updates are O(1) and old behaviour fades out.
+
+A fix is scored against its animal's own history, shrunk towards the pooled
+distribution of all animals. Tail probabilities are calibrated: for normal
+behaviour, a confidence of c is exceeded by a fraction 1 - c of fixes.
+While an animal has little history the confidence is blended with the
+fixed per-rule confidences of routes.movement, which remain the cold-start
+prior.
+
+Each reserve owns one OnlineScorer. It learns only from trusted input: the
+dataset versions the server loads and validated ingest, never from the data
+a request asks to be scored. Learning is idempotent per animal (fixes at or
+before the last learned timestamp are skipped, as are fixes in the future),
+so loading the same dataset again after a restart changes nothing.
+Detection scores against a ModelSnapshot, an immutable copy named by a
+content hash of the model (its version), so the same data and model version
+always produce the same confidences and the version can key cached results.
+The model is saved as JSON (written atomically) at most every
+ANOMALY_MODEL_SAVE_INTERVAL seconds after learning, and at exit.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import pathlib
+import threading
+import time
+
+from utils.geo import KM_PER_DEGREE
+from utils.timestamps import epoch_or_none, is_future
+from utils.tracks import Track, group_by_animal, column
+
+logger = logging.getLogger(__name__)
+
+MODEL_FORMAT = 2
+MODEL_FILE = 'anomaly_model.json'
+BINS = 32
+DWELL_RADIUS_KM = 0.05
+MIN_STEP_KM = 0.005   # shorter steps are GPS jitter: no meaningful bearing
+
+# Features in histogram order: (name, low, high, log-spaced bins, tail that counts as anomalous)
+FEATURES = (
+    ('speed_kmh', 0.05, 80.0, True, 'both'),
+    ('step_km', 0.005, 20.0, True, 'both'),
+    ('turn_deg', 0.0, 180.0, False, 'upper'),
+    ('dwell_min', 5.0, 2880.0, True, 'upper'),
+)
+SPEED, STEP, TURN, DWELL = range(len(FEATURES))
+
+# Rule -> the feature tail that measures it; rules not listed use every feature
+REASON_FEATURES = {
+    'sudden_speed_drop': (SPEED, 'lower'),
+    'prolonged_immobility': (DWELL, 'upper'),
+}
+
+RULE_CONFIDENCE = {
+    'sudden_speed_drop': 'confidence_speed_drop',
+    'near_hotspot': 'confidence_near_hotspot',
+    'prolonged_immobility': 'confidence_immobility',
+}
+
+
+def _binner(low, high, log_scale):
+    """Value -> histogram bin for one feature; bin 0 and the last bin are open-ended"""
+    last = BINS - 1
+    if log_scale:
+        per_unit = (BINS - 2) / math.log(high / low)
+        log = math.log
+
+        def to_bin(value):
+            if value <= low:
+                return 0
+            if value >= high:
+                return last
+            return 1 + int(log(value / low) * per_unit)
+    else:
+        per_unit = (BINS - 2) / (high - low)
+
+        def to_bin(value):
+            if value <= low:
+                return 0
+            if value >= high:
+                return last
+            return 1 + int((value - low) * per_unit)
+    return to_bin
+
+
+_speed_bin, _step_bin, _turn_bin, _dwell_bin = (_binner(low, high, log_scale)
+                                                for _, low, high, log_scale, _ in FEATURES)
+
+
+def fix_epoch(fix):
+    """Epoch seconds of a fix (FixView or dict), or None"""
+    epoch = getattr(fix, 'epoch', None)
+    if epoch is not None:
+        return epoch
+    return epoch_or_none(fix.get('timestamp_utc'))
+
+
+def track_epochs(track):
+    """Epoch seconds of every fix of a track (the array column when available)"""
+    if isinstance(track, Track) and track.epochs is not None:
+        return track.epochs
+    return [fix_epoch(fix) for fix in track]
+
+
+class TrackState:
+    """Previous fix, heading and stop anchor of one animal: turns fixes into feature bins"""
+
+    __slots__ = ('lat', 'lon', 'epoch', 'bearing', 'anchor')
+
+    def __init__(self, lat=None, lon=None, epoch=None, bearing=None, anchor=None):
+        self.lat = lat
+        self.lon = lon
+        self.epoch = epoch
+        self.bearing = bearing
+        self.anchor = anchor   # (lat, lon, epoch) where the animal last stopped moving
+
+    def copy(self):
+        return TrackState(self.lat, self.lon, self.epoch, self.bearing, self.anchor)
+
+    def to_list(self):
+        return [self.lat, self.lon, self.epoch, self.bearing, list(self.anchor) if self.anchor else None]
+
+    @classmethod
+    def from_list(cls, values):
+        lat, lon, epoch, bearing, anchor = values
+        return cls(lat, lon, epoch, bearing, tuple(anchor) if anchor else None)
+
+    def steps(self, lats, lons, epochs, speeds):
+        """Advance through fixes in time order; returns their feature bins in FEATURES order (None where unknown)"""
+        out = []
+        lat0, lon0, epoch0, bearing, anchor = self.lat, self.lon, self.epoch, self.bearing, self.anchor
+        hypot, atan2, degrees = math.hypot, math.atan2, math.degrees
+        km_per_lon = None
+        for lat, lon, epoch, speed in zip(lats, lons, epochs, speeds):
+            speed_bin = _speed_bin(speed or 0.0)
+            if lat is None or lon is None:
+                out.append((speed_bin, None, None, None))
+                continue
+            if km_per_lon is None:
+                # Steps are short: one flat-earth scale per pass is plenty
+                km_per_lon = KM_PER_DEGREE * math.cos(math.radians(lat))
+            step_bin = turn_bin = dwell_bin = None
+            if lat0 is not None:
+                east = (lon - lon0) * km_per_lon
+                north = (lat - lat0) * KM_PER_DEGREE
+                step = hypot(east, north)
+                step_bin = _step_bin(step)
+                if step >= MIN_STEP_KM:
+                    heading = degrees(atan2(east, north))
+                    if bearing is not None:
+                        turn = abs(heading - bearing) % 360
+                        turn_bin = _turn_bin(min(turn, 360 - turn))
+                    bearing = heading
+            if epoch is not None:
+                if anchor is not None and hypot((lon - anchor[1]) * km_per_lon,
+                                                (lat - anchor[0]) * KM_PER_DEGREE) <= DWELL_RADIUS_KM:
+                    dwell_bin = _dwell_bin((epoch - anchor[2]) / 60)
+                else:
+                    anchor = (lat, lon, epoch)
+                    dwell_bin = 0
+            lat0, lon0, epoch0 = lat, lon, epoch
+            out.append((speed_bin, step_bin, turn_bin, dwell_bin))
+        self.lat, self.lon, self.epoch, self.bearing, self.anchor = lat0, lon0, epoch0, bearing, anchor
+        return out
+
+
+class AnimalModel:
+    """Decaying feature histograms (one flat count list), learned-fix count and last state"""
+
+    __slots__ = ('counts', 'totals', 'learned', 'last_epoch', 'state')
+
+    def __init__(self):
+        self.counts = [0.0] * (BINS * len(FEATURES))
+        self.totals = [0.0] * len(FEATURES)
+        self.learned = 0
+        self.last_epoch = None
+        self.state = None
+
+    def decay(self, feature):
+        """Halve one feature's counts so old behaviour fades out"""
+        start = feature * BINS
+        self.counts[start:start + BINS] = [c / 2 for c in self.counts[start:start + BINS]]
+        self.totals[feature] /= 2
+
+    def tail(self, feature, index, side):
+        """Mass at least as extreme as bin index (half of the bin itself counts), and the total"""
+        start = feature * BINS
+        below = sum(self.counts[start:start + index])
+        same = self.counts[start + index]
+        total = self.totals[feature]
+        lower = below + same / 2
+        upper = total - below - same / 2
+        if side == 'lower':
+            return lower, total
+        if side == 'upper':
+            return upper, total
+        return 2 * min(lower, upper), total
+
+    def to_dict(self):
+        return {
+            'learned': self.learned,
+            'last_epoch': self.last_epoch,
+            'state': self.state.to_list() if self.state else None,
+            'histograms': {
+                name: self.counts[f * BINS:(f + 1) * BINS] for f, (name, *_) in enumerate(FEATURES)
+            },
+            'totals': self.totals
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        model = cls()
+        model.learned = data.get('learned', 0)
+        model.last_epoch = data.get('last_epoch')
+        model.state = TrackState.from_list(data['state']) if data.get('state') else None
+        histograms = data.get('histograms', {})
+        totals = data.get('totals') or [None] * len(FEATURES)
+        for f, (name, *_) in enumerate(FEATURES):
+            counts = histograms.get(name)
+            if counts and len(counts) == BINS:
+                model.counts[f * BINS:(f + 1) * BINS] = [float(c) for c in counts]
+                model.totals[f] = float(totals[f] if totals[f] is not None else sum(counts))
+        return model
+
+    def copy(self):
+        model = AnimalModel()
+        model.counts = list(self.counts)
+        model.totals = list(self.totals)
+        model.learned = self.learned
+        model.last_epoch = self.last_epoch
+        model.state = self.state.copy() if self.state else None
+        return model
+
+
+class _Scoring:
+    """Scoring against a set of animal models; shared by the live scorer and its snapshots"""
+
+    def _start_state(self, rhino_id, epoch):
+        """Saved track state when fixes continue right after what was last learned, else a fresh one"""
+        model = self._animals.get(rhino_id)
+        if model is not None and model.state is not None and epoch is not None \
+                and model.last_epoch is not None and epoch > model.last_epoch:
+            return model.state.copy()
+        return TrackState()
+
+    def _p_value(self, model, feature, index, side):
+        """Smoothed probability of a value at least this extreme, own history shrunk to the pool"""
+        extreme, total = model.tail(feature, index, side) if model else (0.0, 0.0)
+        pooled_extreme, pooled_total = self._pooled.tail(feature, index, side)
+        if pooled_total > 0:
+            weight = min(self.prior_weight, pooled_total)
+            extreme += weight * pooled_extreme / pooled_total
+            total += weight
+        return min(1.0, (extreme + 0.5) / (total + 1))
+
+    def _movement_probability(self, model, feature_bins):
+        """Any unusual movement: smallest feature p-value, Sidak-corrected for the number of features"""
+        p_values = [self._p_value(model, f, index, FEATURES[f][4])
+                    for f, index in enumerate(feature_bins) if index is not None]
+        return (1 - min(p_values)) ** len(p_values)
+
+    def probability(self, rhino_id, feature_bins, reason):
+        """Anomaly probability of a fix for one rule reason, and the model's weight against the rule prior"""
+        model = self._animals.get(rhino_id)
+        feature, side = REASON_FEATURES.get(reason, (None, None))
+        if feature is not None and feature_bins[feature] is not None:
+            prob = 1 - self._p_value(model, feature, feature_bins[feature], side)
+        else:
+            prob = self._movement_probability(model, feature_bins)
+        seen = (model.learned if model else 0) + min(self.prior_weight, self._pooled.learned)
+        return prob, min(1.0, seen / self.warmup)
+
+    def confidence(self, rhino_id, feature_bins, reasons, thresholds):
+        """Alert confidence for the fired rule reasons (max over reasons)"""
+        best = 0.0
+        for reason in set(reasons):
+            prob, weight = self.probability(rhino_id, feature_bins, reason)
+            prior = thresholds.get(RULE_CONFIDENCE.get(reason), 0.0)
+            best = max(best, weight * prob + (1 - weight) * prior)
+        return best
+
+
+class ModelSnapshot(_Scoring):
+    """Immutable copy of a scorer's models at one version; detection scores against it"""
+
+    def __init__(self, version, animals, pooled, warmup, prior_weight):
+        self.version = version
+        self._animals = animals
+        self._pooled = pooled
+        self.warmup = warmup
+        self.prior_weight = prior_weight
+
+    def score(self, rhino_id, lats, lons, epochs, speeds, hits, thresholds):
+        """
+        Confidences for one animal's fixes (in time order) without learning
+        them; hits maps the index of each fix that fired rules to their
+        reasons. Returns index -> confidence.
+        """
+        if not hits:
+            return {}
+        state = self._start_state(rhino_id, epochs[0] if len(epochs) else None)
+        feature_bins = state.steps(lats, lons, epochs, speeds)
+        return {i: round(self.confidence(rhino_id, feature_bins[i], reasons, thresholds), 3)
+                for i, reasons in hits.items()}
+
+
+class AnimalStream:
+    """
+    One animal's fixes fed in time order, in batches of any size, each
+    scored and then learned. For a private scorer such as the replay
+    detector's; the reserve models learn through OnlineScorer.learn_records.
+    """
+
+    __slots__ = ('scorer', 'rhino_id', 'thresholds', 'state')
+
+    def __init__(self, scorer, rhino_id, thresholds, state):
+        self.scorer = scorer
+        self.rhino_id = rhino_id
+        self.thresholds = thresholds
+        self.state = state
+
+    def run(self, lats, lons, epochs, speeds, hits):
+        """
+        Learn a batch of fixes; hits maps the index of each fix that fired
+        rules to their reasons. Returns index -> confidence, each scored
+        before its own fix is learned.
+        """
+        feature_bins = self.state.steps(lats, lons, epochs, speeds)
+        confidences = {}
+        start = 0
+        for i in sorted(hits):
+            self.scorer.learn(self.rhino_id, feature_bins[start:i], epochs[start:i], self.state)
+            with self.scorer._lock:
+                confidences[i] = round(self.scorer.confidence(self.rhino_id, feature_bins[i], hits[i],
+                                                              self.thresholds), 3)
+            start = i
+        self.scorer.learn(self.rhino_id, feature_bins[start:], epochs[start:], self.state)
+        return confidences
+
+
+class OnlineScorer(_Scoring):
+    """Per-animal streaming feature distributions turning rule hits into calibrated confidences"""
+
+    def __init__(self, path=None, half_life=None, warmup=None, prior_weight=None, save_interval=None):
+        self.path = pathlib.Path(path) if path else None
+        self.half_life = half_life or float(os.getenv('ANOMALY_MODEL_HALF_LIFE', 2000))
+        # Fixes (own plus pooled prior) before the model fully replaces the rule confidences
+        self.warmup = warmup or float(os.getenv('ANOMALY_MODEL_WARMUP', 100))
+        # Pseudo-fixes of the all-animal distribution mixed into each animal's own
+        self.prior_weight = prior_weight if prior_weight is not None else float(os.getenv('ANOMALY_MODEL_PRIOR_WEIGHT', 20))
+        self.save_interval = save_interval if save_interval is not None else float(os.getenv('ANOMALY_MODEL_SAVE_INTERVAL', 60))
+        self._lock = threading.RLock()
+        self._animals = {}
+        self._pooled = AnimalModel()
+        self._loaded = self.path is None
+        self._dirty = False
+        self._saved_at = 0.0
+        self._snapshot = None
+
+    # ---------- persistence ----------
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            data = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning('Ignoring unreadable anomaly model %s: %s', self.path, e)
+            return
+        if data.get('format') != MODEL_FORMAT or data.get('bins') != BINS:
+            logger.warning('Ignoring anomaly model %s from an incompatible version', self.path)
+            return
+        self._pooled = AnimalModel.from_dict(data.get('pooled', {}))
+        self._animals = {rid: AnimalModel.from_dict(m) for rid, m in data.get('animals', {}).items()}
+
+    def _payload(self):
+        return json.dumps({
+            'format': MODEL_FORMAT,
+            'bins': BINS,
+            'pooled': self._pooled.to_dict(),
+            'animals': {rid: self._animals[rid].to_dict() for rid in sorted(self._animals)}
+        }, separators=(',', ':'))
+
+    def save(self, force=False):
+        """Write the model if it changed (throttled to save_interval unless force)"""
+        with self._lock:
+            if self.path is None or not self._dirty:
+                return False
+            if not force and time.monotonic() - self._saved_at < self.save_interval:
+                return False
+            payload = self._payload()
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        tmp = self.path.with_name(self.path.name + f'.{os.getpid()}.tmp')
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(payload)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning('Could not save anomaly model to %s: %s', self.path, e)
+            return False
+        return True
+
+    # ---------- scoring ----------
+
+    def snapshot(self):
+        """ModelSnapshot of the current models (rebuilt only after learning)"""
+        with self._lock:
+            self._ensure_loaded()
+            if self._snapshot is None:
+                version = hashlib.sha256(self._payload().encode('utf-8')).hexdigest()[:16]
+                self._snapshot = ModelSnapshot(
+                    version, {rid: m.copy() for rid, m in self._animals.items()}, self._pooled.copy(),
+                    self.warmup, self.prior_weight)
+            return self._snapshot
+
+    @property
+    def version(self):
+        return self.snapshot().version
+
+    def stream(self, rhino_id, epoch, thresholds):
+        """
+        Learning AnimalStream for fixes starting at epoch; picks up the
+        animal's saved track state when they continue right after what was
+        last learned.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            state = self._start_state(rhino_id, epoch)
+        return AnimalStream(self, rhino_id, thresholds, state)
+
+    # ---------- learning ----------
+
+    def learn(self, rhino_id, fix_bins, epochs, state, now=None):
+        """
+        Add fixes' feature bins to their animal and the pool, skipping any
+        at or before the last learned fix or in the future. Returns the
+        number learned.
+        """
+        learned = 0
+        now = time.time() if now is None else now
+        with self._lock:
+            self._ensure_loaded()
+            model = self._animals.get(rhino_id)
+            if model is None:
+                model = self._animals[rhino_id] = AnimalModel()
+            pooled = self._pooled
+            counts, totals = model.counts, model.totals
+            pooled_counts, pooled_totals = pooled.counts, pooled.totals
+            limit = 2 * self.half_life
+            last = model.last_epoch
+            for feature_bins, epoch in zip(fix_bins, epochs):
+                if epoch is None or (last is not None and epoch <= last) or is_future(epoch, now):
+                    continue
+                for feature, index in enumerate(feature_bins):
+                    if index is None:
+                        continue
+                    k = feature * BINS + index
+                    counts[k] += 1
+                    pooled_counts[k] += 1
+                    totals[feature] += 1
+                    pooled_totals[feature] += 1
+                    if totals[feature] > limit:
+                        model.decay(feature)
+                    if pooled_totals[feature] > limit:
+                        pooled.decay(feature)
+                last = epoch
+                learned += 1
+            if learned:
+                model.learned += learned
+                model.last_epoch = last
+                model.state = state.copy()
+                pooled.learned += learned
+                self._dirty = True
+                self._snapshot = None
+        return learned
+
+    def learn_records(self, records):
+        """
+        Learn trusted collar fixes (a loaded dataset or validated ingest),
+        each animal's in time order. Returns the number of fixes learned.
+        """
+        learned = 0
+        for rid, track in group_by_animal(records).items():
+            epochs = track_epochs(track)
+            lats, lons, speeds = column(track, 'latitude'), column(track, 'longitude'), column(track, 'speed_kmh', 0)
+            if any(a is not None and b is not None and b < a for a, b in zip(epochs, epochs[1:])):
+                order = sorted(range(len(epochs)), key=lambda i: (epochs[i] is None, epochs[i] or 0))
+                epochs = [epochs[i] for i in order]
+                lats, lons, speeds = ([values[i] for i in order] for values in (lats, lons, speeds))
+            with self._lock:
+                self._ensure_loaded()
+                state = self._start_state(rid, epochs[0] if len(epochs) else None)
+                learned += self.learn(rid, state.steps(lats, lons, epochs, speeds), epochs, state)
+        return learned
@@ -0,0 +1,223 @@
+"""
+Token-budgeted prompt building for the WildGuard agents.
+
+Agent roles, temperatures and budgets come from agents/prompts.json, which is
+read once per process. Evidence (alerts, findings) is serialized compactly and,
+when it does not fit the agent's input budget, replaced by aggregate statistics
+per animal and hotspot so prompt size stays bounded on busy nights.
+"""
+import json
+import math
+import os
+import pathlib
+import re
+import threading
+
+from utils.geo import nearest_hotspot
+
+PROMPTS_PATH = pathlib.Path(os.getenv(
+    'PROMPTS_PATH',
+    pathlib.Path(__file__).resolve().parents[2] / 'agents' / 'prompts.json'
+))
+
+# Used when prompts.json is not deployed alongside the backend
+DEFAULT_CONFIG = {
+    'system': 'You are WildGuard AI, an assistant for wildlife conservation.',
+    'agents': {},
+    'templates': []
+}
+DEFAULT_MAX_TOKENS = 400
+DEFAULT_INPUT_BUDGET = 800
+DEFAULT_TEMPERATURE = 0.2
+
+_TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+
+def estimate_tokens(text):
+    """
+    Estimate the token count of text without a remote tokenizer.
+
+    Words and punctuation are split like a BPE pre-tokenizer would, and long
+    words are charged roughly one token per four characters.
+    """
+    if not text:
+        return 0
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _TOKEN_PATTERN.findall(text))
+
+
+def compact_json(data):
+    """Serialize without indentation or padding whitespace"""
+    return json.dumps(data, separators=(',', ':'), default=str)
+
+
+def _reasons(alert):
+    reason = alert.get('reason', [])
+    return reason if isinstance(reason, list) else [reason]
+
+
+def summarize_alerts(alerts, hotspots=None):
+    """Aggregate movement alerts into per-animal and per-hotspot statistics"""
+    hotspot_list = (hotspots or {}).get('hotspots', [])
+    animals = {}
+    by_hotspot = {}
+    reasons = {}
+
+    for alert in alerts:
+        rid = alert.get('rhino_id', 'unknown')
+        stats = animals.get(rid)
+        if stats is None:
+            stats = animals[rid] = {
+                'id': rid, 'alerts': 0, 'max_conf': 0.0, 'conf_sum': 0.0,
+                'first': None, 'last': None, 'reasons': {}
+            }
+        confidence = alert.get('confidence', 0.0)
+        stats['alerts'] += 1
+        stats['conf_sum'] += confidence
+        stats['max_conf'] = max(stats['max_conf'], confidence)
+        timestamp = alert.get('timestamp')
+        if timestamp:
+            stats['first'] = min(stats['first'] or timestamp, timestamp)
+            if timestamp >= (stats['last'] or ''):
+                stats['last'] = timestamp
+                stats['last_pos'] = [round(alert.get('latitude') or 0.0, 5), round(alert.get('longitude') or 0.0, 5)]
+        for reason in _reasons(alert):
+            stats['reasons'][reason] = stats['reasons'].get(reason, 0) + 1
+            reasons[reason] = reasons.get(reason, 0) + 1
+
+        hotspot = nearest_hotspot(alert.get('latitude'), alert.get('longitude'), hotspot_list)
+        if hotspot is not None:
+            entry = by_hotspot.setdefault(hotspot.get('id'), {
+                'id': hotspot.get('id'), 'name': hotspot.get('name'), 'alerts': 0, 'animals': set()
+            })
+            entry['alerts'] += 1
+            entry['animals'].add(rid)
+
+    animal_rows = []
+    for stats in sorted(animals.values(), key=lambda s: (-s['alerts'], -s['max_conf'])):
+        conf_sum = stats.pop('conf_sum')
+        stats['mean_conf'] = round(conf_sum / stats['alerts'], 2)
+        stats['max_conf'] = round(stats['max_conf'], 2)
+        animal_rows.append(stats)
+
+    hotspot_rows = [
+        dict(entry, animals=sorted(entry['animals']))
+        for entry in sorted(by_hotspot.values(), key=lambda e: -e['alerts'])
+    ]
+
+    return {
+        'total_alerts': len(alerts),
+        'animals_affected': len(animal_rows),
+        'reasons': reasons,
+        'animals': animal_rows,
+        'hotspots': hotspot_rows
+    }
+
+
+def summarize_findings(findings):
+    """Aggregate vision findings by label"""
+    labels = {}
+    for finding in findings:
+        label = finding.get('label', 'unknown')
+        stats = labels.setdefault(label, {'label': label, 'count': 0, 'max_conf': 0.0, 'max_severity': 0.0})
+        stats['count'] += 1
+        stats['max_conf'] = max(stats['max_conf'], finding.get('confidence', 0.0))
+        stats['max_severity'] = max(stats['max_severity'], finding.get('severity', 0.0))
+    return {
+        'total_findings': len(findings),
+        'labels': sorted(labels.values(), key=lambda s: (-s['max_severity'], -s['count']))
+    }
+
+
+class PromptBuilder:
+    """Builds chat messages for each agent within its token budget"""
+
+    def __init__(self, path=PROMPTS_PATH):
+        self.path = pathlib.Path(path)
+        self._config = None
+        self._lock = threading.Lock()
+
+    @property
+    def config(self):
+        if self._config is None:
+            with self._lock:
+                if self._config is None:
+                    try:
+                        with open(self.path, 'r') as f:
+                            self._config = json.load(f).get('wildguard', DEFAULT_CONFIG)
+                    except (OSError, ValueError):
+                        self._config = DEFAULT_CONFIG
+        return self._config
+
+    def agent(self, name):
+        return self.config.get('agents', {}).get(name, {})
+
+    def system_prompt(self, name, fallback):
+        agent = self.agent(name)
+        if not agent.get('role'):
+            return fallback
+        prompt = f"{self.config.get('system', DEFAULT_CONFIG['system'])} Act as: {agent['role']}."
+        if agent.get('expertise'):
+            prompt += f" Expertise: {agent['expertise']}."
+        return prompt
+
+    def template(self, name, fallback=''):
+        for template in self.config.get('templates', []):
+            if template.get('name') == name:
+                return template.get('prompt', fallback)
+        return fallback
+
+    def temperature(self, name, fallback=DEFAULT_TEMPERATURE):
+        return self.agent(name).get('temperature', fallback)
+
+    def max_tokens(self, name, fallback=DEFAULT_MAX_TOKENS):
+        return self.agent(name).get('max_tokens', fallback)
+
+    def input_budget(self, name):
+        return self.agent(name).get('input_token_budget', DEFAULT_INPUT_BUDGET)
+
+    def fit_evidence(self, items, budget, summarize):
+        """
+        Return the most detailed serialization of items that fits budget.
+
+        Order of preference: every item verbatim, the aggregate summary, the
+        summary with its per-entity lists cut down, then a hard truncation.
+        """
+        text = compact_json(items)
+        if estimate_tokens(text) <= budget:
+            return text
+
+        summary = summarize(items)
+        text = compact_json(summary)
+        list_keys = [key for key, value in summary.items() if isinstance(value, list)]
+        limit = max((len(summary[key]) for key in list_keys), default=0)
+        while estimate_tokens(text) > budget and limit > 1:
+            limit //= 2
+            trimmed = dict(summary)
+            for key in list_keys:
+                if len(summary[key]) > limit:
+                    trimmed[key] = summary[key][:limit]
+                    trimmed[f'{key}_omitted'] = len(summary[key]) - limit
+            text = compact_json(trimmed)
+
+        if estimate_tokens(text) > budget:
+            # Average of ~2.5 characters per estimated token for compact JSON
+            text = text[:max(0, int(budget * 2.5) - 3)] + '...'
+        return text
+
+    def build(self, name, system_fallback, template, evidence=None, summarize=None):
+        """
+        Render template into (system, prompt), filling {evidence} to the budget.
+
+        The evidence budget is whatever remains of the agent's input budget
+        after the system prompt and the fixed template text.
+        """
+        system = self.system_prompt(name, system_fallback)
+        if evidence is None:
+            return system, template
+        fixed = estimate_tokens(system) + estimate_tokens(template.replace('{evidence}', ''))
+        budget = max(self.input_budget(name) - fixed, 16)
+        return system, template.replace('{evidence}', self.fit_evidence(evidence, budget, summarize))
+
+
+# Global instance
+prompt_builder = PromptBuilder()
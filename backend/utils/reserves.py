@@ -0,0 +1,146 @@
+"""
+Reserve (tenant) registry.
+
+The top-level data directory is the default reserve. Every subdirectory of
+data/reserves/ holding the same two dataset files is another reserve, with
+an optional reserve.json ({"name": "...", "teams": [{"id", "name",
+"latitude", "longitude"}, ...]}) naming it and its ranger team start points. Each reserve has its own
+DatasetManager, StageCache, RollupStore, sync ChangeLog and anomaly model,
+so data, indexes, caches, analytics, device sync and learned behaviour never
+mix. Learned state (the anomaly model) is kept in memory unless STATE_DIR is
+set, in which case it is saved under STATE_DIR/<reserve id>/.
+"""
+import atexit
+import json
+import logging
+import os
+import pathlib
+import threading
+
+from utils.datasets import DatasetManager, TRACKS_FILE, HOTSPOTS_FILE
+from utils.geo import priority_hotspots
+from utils.online_scorer import OnlineScorer, MODEL_FILE
+from utils.stage_cache import StageCache
+from utils.rollups import RollupStore
+from utils.sync import ChangeLog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESERVE_ID = os.getenv('DEFAULT_RESERVE_ID', 'default')
+STATE_DIR = os.path.expanduser(os.getenv('STATE_DIR', ''))
+
+
+class UnknownReserveError(KeyError):
+    """Raised when a request names a reserve that does not exist"""
+
+
+class Reserve:
+    """
+    One protected area with isolated datasets and stage cache.
+
+    state_dir, when given, persists what the reserve learns (the anomaly
+    model); without it the reserve only scores against models it is handed,
+    as batch workers do.
+    """
+
+    def __init__(self, reserve_id, name, data_dir, state_dir=None):
+        self.id = reserve_id
+        self.name = name
+        self.data_dir = pathlib.Path(data_dir)
+        self.state_dir = pathlib.Path(state_dir) if state_dir else None
+        self.teams = _reserve_config(self.data_dir).get('teams', [])
+        self.datasets = DatasetManager(self.data_dir)
+        self.cache = StageCache(name=reserve_id)
+        self.rollups = RollupStore()
+        self.sync = ChangeLog()
+        self.scorer = OnlineScorer(self.state_dir / MODEL_FILE if self.state_dir else None)
+        if self.state_dir:
+            atexit.register(self.scorer.save, True)
+
+    def model(self):
+        """Read-only snapshot of the anomaly model for detection"""
+        return self.scorer.snapshot()
+
+    def learn(self, records):
+        """Teach the anomaly model trusted fixes (loaded datasets, validated ingest) and save it"""
+        learned = self.scorer.learn_records(records)
+        if learned:
+            self.scorer.save()
+        return learned
+
+    def context(self, dataset=None):
+        """Reserve facts used to word briefings and prompts"""
+        dataset = dataset or self.datasets.current()
+        return {
+            'reserve_id': self.id,
+            'reserve_name': self.name,
+            'animal_count': len(dataset.tracks_by_animal),
+            'priority_hotspots': [h.get('name', h.get('id')) for h in priority_hotspots(dataset.hotspots)],
+            'patrol_teams': self.teams
+        }
+
+    def describe(self, model=None):
+        dataset = self.datasets.current()
+        return {
+            'id': self.id,
+            'name': self.name,
+            'data_version': dataset.version,
+            'model_version': (model or self.model()).version,
+            'animals': len(dataset.tracks_by_animal),
+            'hotspots': len(dataset.hotspots_by_id)
+        }
+
+
+def _reserve_config(data_dir):
+    try:
+        with open(pathlib.Path(data_dir) / 'reserve.json', 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class ReserveRegistry:
+    """Discovers reserves under the data directory and hands them out by id"""
+
+    def __init__(self, data_dir, state_dir=STATE_DIR):
+        self.data_dir = pathlib.Path(data_dir)
+        self.state_dir = pathlib.Path(state_dir) if state_dir else None
+        self._reserves = {}
+        self._lock = threading.Lock()
+        self.discover()
+
+    def discover(self):
+        """Pick up reserves added since the last scan; returns new reserve ids"""
+        found = {DEFAULT_RESERVE_ID: self.data_dir}
+        reserves_dir = self.data_dir / 'reserves'
+        if reserves_dir.is_dir():
+            for path in sorted(reserves_dir.iterdir()):
+                if (path / TRACKS_FILE).is_file() and (path / HOTSPOTS_FILE).is_file():
+                    found[path.name] = path
+
+        added = []
+        with self._lock:
+            for reserve_id, path in found.items():
+                if reserve_id not in self._reserves:
+                    fallback = os.getenv('RESERVE_NAME', 'Protected Reserve') if reserve_id == DEFAULT_RESERVE_ID else reserve_id
+                    self._reserves[reserve_id] = Reserve(
+                        reserve_id, _reserve_config(path).get('name', fallback), path,
+                        self.state_dir / reserve_id if self.state_dir else None)
+                    added.append(reserve_id)
+        if added:
+            logger.info("Reserves registered: %s", ', '.join(added))
+        return added
+
+    def get(self, reserve_id=None):
+        reserve = self._reserves.get(reserve_id or DEFAULT_RESERVE_ID)
+        if reserve is None:
+            raise UnknownReserveError(reserve_id)
+        return reserve
+
+    def all(self):
+        with self._lock:
+            return list(self._reserves.values())
+
+    def start_watching(self):
+        for reserve in self.all():
+            reserve.datasets.start_watching()
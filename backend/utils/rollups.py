@@ -0,0 +1,224 @@
+"""
+Incrementally maintained analytics rollups.
+
+Alerts, fixes and risk scores are folded into hourly and daily buckets as
+they are ingested, so /api/analytics reads pre-aggregated counters instead
+of scanning history. Retention is measured against the newest ingested
+event time (not the wall clock), so replayed or historical data ages the
+same way live data does:
+
+- hourly buckets older than ROLLUP_HOURLY_RETENTION_DAYS are dropped
+  (their totals live on in the daily buckets)
+- daily buckets older than ROLLUP_RETENTION_DAYS are dropped
+- raw risk scores older than ROLLUP_RISK_RAW_HOURS (relative to the newest
+  score) are downsampled to hourly min/max/avg points
+"""
+import os
+import threading
+from datetime import datetime, timezone
+
+from utils.geo import haversine_km
+from utils.timestamps import parse_timestamp, format_timestamp
+from utils.tracks import group_by_animal, column, epoch_column
+
+RESOLUTIONS = {'hour': 3600, 'day': 86400}
+DIMENSIONS = ('total', 'animal', 'hotspot', 'reason')
+
+
+class RollupStore:
+    """Thread-safe hourly/daily counters for one reserve"""
+
+    def __init__(self, hourly_retention_days=None, retention_days=None, risk_raw_hours=None):
+        self.hourly_retention = 86400 * (hourly_retention_days if hourly_retention_days is not None
+                                         else float(os.getenv('ROLLUP_HOURLY_RETENTION_DAYS', 7)))
+        self.retention = 86400 * (retention_days if retention_days is not None
+                                  else float(os.getenv('ROLLUP_RETENTION_DAYS', 365)))
+        self.risk_raw = 3600 * (risk_raw_hours if risk_raw_hours is not None
+                                else float(os.getenv('ROLLUP_RISK_RAW_HOURS', 48)))
+        self._lock = threading.Lock()
+        # alerts[resolution][dimension][key][bucket_start] = count
+        self._alerts = {res: {dim: {} for dim in DIMENSIONS} for res in RESOLUTIONS}
+        # distance[resolution][animal][bucket_start] = km
+        self._distance = {res: {} for res in RESOLUTIONS}
+        self._fixes = {res: {} for res in RESOLUTIONS}
+        self._last_fix = {}
+        self._seen_alerts = {}
+        self._risk_raw = []
+        self._risk_hourly = {}
+        self._watermark = None
+
+    # ---------- ingestion ----------
+
+    def _advance(self, t):
+        if self._watermark is None or t > self._watermark:
+            self._watermark = t
+
+    def add_alerts(self, alerts, hotspot_of=None):
+        """
+        Count alerts per animal, hotspot and reason. Alerts already counted
+        (same animal and timestamp) are skipped, so re-ingesting an
+        overlapping dataset version does not double count.
+        """
+        added = 0
+        with self._lock:
+            for alert in alerts:
+                try:
+                    t = parse_timestamp(alert['timestamp'])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                key = (alert.get('rhino_id'), t)
+                if key in self._seen_alerts:
+                    continue
+                self._seen_alerts[key] = t
+                reason = alert.get('reason', [])
+                reasons = reason if isinstance(reason, list) else [reason]
+                hotspot = hotspot_of(alert) if hotspot_of else None
+                for res, size in RESOLUTIONS.items():
+                    bucket = t - t % size
+                    dims = self._alerts[res]
+                    self._bump(dims['total'], 'all', bucket)
+                    self._bump(dims['animal'], alert.get('rhino_id'), bucket)
+                    if hotspot:
+                        self._bump(dims['hotspot'], hotspot, bucket)
+                    for r in set(reasons):
+                        self._bump(dims['reason'], r, bucket)
+                self._advance(t)
+                added += 1
+            self._prune()
+        return added
+
+    def add_fixes(self, records):
+        """
+        Accumulate fix counts and distance travelled per animal. Fixes must
+        arrive in time order per animal; older or duplicate fixes are ignored.
+        """
+        added = 0
+        with self._lock:
+            for rid, t, lat, lon in _fix_points(records):
+                last = self._last_fix.get(rid)
+                if last is not None and t <= last[0]:
+                    continue
+                step = haversine_km(last[1], last[2], lat, lon) if last is not None else 0.0
+                self._last_fix[rid] = (t, lat, lon)
+                for res, size in RESOLUTIONS.items():
+                    bucket = t - t % size
+                    self._bump(self._fixes[res], rid, bucket)
+                    if step:
+                        self._bump(self._distance[res], rid, bucket, step)
+                self._advance(t)
+                added += 1
+            self._prune()
+        return added
+
+    def add_risk(self, risk_score, threat_level=None, timestamp=None):
+        """Append a risk score to the history"""
+        t = parse_timestamp(timestamp) if timestamp is not None else datetime.now(timezone.utc).timestamp()
+        with self._lock:
+            self._risk_raw.append((t, risk_score, threat_level))
+            self._risk_raw.sort(key=lambda point: point[0])
+            self._prune_risk()
+
+    @staticmethod
+    def _bump(series, key, bucket, amount=1):
+        buckets = series.setdefault(key, {})
+        buckets[bucket] = buckets.get(bucket, 0) + amount
+
+    # ---------- retention ----------
+
+    def _prune(self):
+        """Drop or downsample buckets outside retention (caller holds the lock)"""
+        if self._watermark is None:
+            return
+        cutoffs = {'hour': self._watermark - self.hourly_retention, 'day': self._watermark - self.retention}
+        for res, cutoff in cutoffs.items():
+            series_groups = list(self._alerts[res].values()) + [self._distance[res], self._fixes[res]]
+            for group in series_groups:
+                for key in list(group):
+                    buckets = group[key]
+                    for bucket in [b for b in buckets if b < cutoff]:
+                        del buckets[bucket]
+                    if not buckets:
+                        del group[key]
+        day_cutoff = cutoffs['day']
+        if self._seen_alerts and min(self._seen_alerts.values()) < day_cutoff:
+            self._seen_alerts = {k: t for k, t in self._seen_alerts.items() if t >= day_cutoff}
+
+    def _prune_risk(self):
+        """Risk scores are stamped when pipelines run, so they age on their own clock"""
+        if not self._risk_raw:
+            return
+        latest = self._risk_raw[-1][0]
+        raw_cutoff = latest - self.risk_raw
+        while self._risk_raw and self._risk_raw[0][0] < raw_cutoff:
+            t, score, _ = self._risk_raw.pop(0)
+            bucket = t - t % RESOLUTIONS['hour']
+            point = self._risk_hourly.setdefault(bucket, {'min': score, 'max': score, 'sum': 0, 'count': 0})
+            point['min'] = min(point['min'], score)
+            point['max'] = max(point['max'], score)
+            point['sum'] += score
+            point['count'] += 1
+        for bucket in [b for b in self._risk_hourly if b < latest - self.retention]:
+            del self._risk_hourly[bucket]
+
+    # ---------- queries ----------
+
+    def snapshot(self, resolution='hour', since=None):
+        """
+        Materialized view for charts; cost depends on the number of buckets,
+        not on how much history was ingested.
+        """
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f'resolution must be one of: {", ".join(RESOLUTIONS)}')
+        since = parse_timestamp(since) if since is not None else None
+
+        def series(buckets, digits=None):
+            return [
+                {'bucket': format_timestamp(b), 'value': round(v, digits) if digits else v}
+                for b, v in sorted(buckets.items()) if since is None or b >= since
+            ]
+
+        with self._lock:
+            alerts = self._alerts[resolution]
+            risk = [
+                {'timestamp': format_timestamp(b), 'risk_score': round(p['sum'] / p['count'], 1),
+                 'min': p['min'], 'max': p['max'], 'samples': p['count']}
+                for b, p in sorted(self._risk_hourly.items()) if since is None or b >= since
+            ] + [
+                {'timestamp': format_timestamp(t), 'risk_score': score, 'threat_level': level}
+                for t, score, level in self._risk_raw if since is None or t >= since
+            ]
+            return {
+                'resolution': resolution,
+                'alerts': series(alerts['total'].get('all', {})),
+                'alerts_by_animal': {k: series(v) for k, v in alerts['animal'].items()},
+                'alerts_by_hotspot': {k: series(v) for k, v in alerts['hotspot'].items()},
+                'alerts_by_reason': {k: series(v) for k, v in alerts['reason'].items()},
+                'distance_km': {k: series(v, 3) for k, v in self._distance[resolution].items()},
+                'fixes': {k: series(v) for k, v in self._fixes[resolution].items()},
+                'risk_history': risk,
+                'totals': {
+                    'alerts': sum(alerts['total'].get('all', {}).values()),
+                    'animals': len(self._last_fix),
+                    'distance_km': round(sum(sum(v.values()) for v in self._distance[resolution].values()), 3)
+                },
+                'watermark': format_timestamp(self._watermark) if self._watermark is not None else None
+            }
+
+
+def _fix_points(records):
+    """
+    (rhino_id, epoch, lat, lon) of every fix with a timestamp and numeric
+    coordinates, ordered by animal then time. TrackStore fixes are read
+    from the columns (parsed epochs included) instead of per-fix mappings.
+    """
+    points = []
+    for rid, track in sorted(group_by_animal(records).items(), key=lambda item: str(item[0])):
+        for t, lat, lon in zip(epoch_column(track), column(track, 'latitude'), column(track, 'longitude')):
+            if t is None:
+                continue
+            try:
+                points.append((rid, float(t), float(lat), float(lon)))
+            except (TypeError, ValueError):
+                continue
+    points.sort(key=lambda point: (str(point[0]), point[1]))
+    return points
@@ -4,20 +4,38 @@ Simple fallback agents system without external dependencies
 import os
 from datetime import datetime
 
+from utils.streaming import run_agent_step, stream_events
+from utils.geo import priority_hotspots
+
+
+def _simulate_stream(text, on_token):
+    """Emit simulated output line by line, like a streamed completion"""
+    if on_token:
+        for line in text.splitlines(keepends=True):
+            on_token(line)
+    return text
+
 class SimpleWildGuardAgents:
     """Fallback agent system with simulated responses"""
     
     def __init__(self):
         self.model = "simulated"
         
-    def planner_agent(self, wildlife_data, hotspots, alerts):
-        """Strategic planning agent - simulated response"""
+    def planner_agent(self, wildlife_data, hotspots, alerts, patrol_plan=None):
+        """Strategic planning agent - simulated response built from the computed patrol plan"""
+        if patrol_plan:
+            zones = '\n'.join(f"{i}. {line}" for i, line in enumerate(patrol_plan, 1))
+        else:
+            ranked = priority_hotspots(hotspots)
+            zones = '\n'.join(
+                f"{i}. {h.get('name', h.get('id'))} ({h.get('risk_level', 'UNKNOWN').title()} Risk) - Patrol and verify"
+                for i, h in enumerate(ranked[:3], 1)
+            ) or '1. No known hotspots - Continue standard patrols'
         return f"""
 TACTICAL DEPLOYMENT PLAN - {datetime.now().strftime('%Y-%m-%d %H:%M')}
 
 PRIORITY ZONES:
-1. Northern Ridge (High Risk) - Deploy 2 ranger teams immediately
-2. Eastern Valley (Medium Risk) - Position 1 mobile patrol unit
+{zones}
 
 RESOURCE ALLOCATION:
 - 4 rangers for immediate deployment
@@ -113,14 +131,19 @@ RESOURCE REQUIREMENTS:
 NEXT BRIEFING: 6 hours or upon significant developments
 """
 
-    def orchestrate_agents(self, wildlife_data, hotspots, movement_alerts, vision_findings, risk_score):
-        """Coordinate all agents for comprehensive analysis"""
+    def orchestrate_agents(self, wildlife_data, hotspots, movement_alerts, vision_findings, risk_score,
+                           patrol_plan=None, emit=None, agent_mode=None):
+        """Coordinate all agents for comprehensive analysis (agent_mode is ignored: no LLM round trips)"""
         
         # Run all agent analyses
-        planning_analysis = self.planner_agent(wildlife_data, hotspots, movement_alerts)
-        movement_analysis = self.movement_analyst_agent(movement_alerts)
-        vision_analysis = self.vision_analyst_agent(vision_findings)
-        risk_analysis = self.risk_scoring_agent(movement_alerts, vision_findings, risk_score)
+        planning_analysis = run_agent_step(emit, 'planner', 'planning', lambda on_token:
+            _simulate_stream(self.planner_agent(wildlife_data, hotspots, movement_alerts, patrol_plan), on_token))
+        movement_analysis = run_agent_step(emit, 'movement_analyst', 'movement', lambda on_token:
+            _simulate_stream(self.movement_analyst_agent(movement_alerts), on_token))
+        vision_analysis = run_agent_step(emit, 'vision_analyst', 'vision', lambda on_token:
+            _simulate_stream(self.vision_analyst_agent(vision_findings), on_token))
+        risk_analysis = run_agent_step(emit, 'risk_scorer', 'risk_assessment', lambda on_token:
+            _simulate_stream(self.risk_scoring_agent(movement_alerts, vision_findings, risk_score), on_token))
         
         analysis_results = {
             'planning': planning_analysis,
@@ -130,7 +153,8 @@ NEXT BRIEFING: 6 hours or upon significant developments
             'summary': f"Simulated multi-agent analysis completed with {len(movement_alerts)} alerts processed"
         }
         
-        final_report = self.report_generator_agent(movement_alerts, risk_score, analysis_results)
+        final_report = run_agent_step(emit, 'report_generator', 'final_report', lambda on_token:
+            _simulate_stream(self.report_generator_agent(movement_alerts, risk_score, analysis_results), on_token))
         
         return {
             'agent_analyses': analysis_results,
@@ -140,5 +164,9 @@ NEXT BRIEFING: 6 hours or upon significant developments
             'mode': 'simulated'
         }
 
+    def stream_agents(self, **kwargs):
+        """Yield (event, data) pairs for a streamed orchestration, ending with 'complete'"""
+        return stream_events(lambda emit: emit('complete', self.orchestrate_agents(emit=emit, **kwargs)))
+
 # Global instance for fallback
 simple_wildguard_agents = SimpleWildGuardAgents()
\ No newline at end of file
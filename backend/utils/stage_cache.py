@@ -0,0 +1,136 @@
+"""
+Content-addressed memoization for analysis pipeline stages.
+
+Each stage result is keyed on a hash of the stage name and its inputs, so
+/api/movement, /api/score, /api/report and /api/orchestrate share work
+when they are called on the same data. Entries are evicted LRU-first once
+either the entry count or the approximate byte budget is exceeded.
+Cached values are shared between requests and must be treated as read-only.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+
+from utils.tracing import metrics
+
+cache_requests = metrics.counter(
+    'wildguard_stage_cache_requests_total', 'Stage cache lookups', ('stage', 'result'))
+cache_bytes = metrics.gauge(
+    'wildguard_stage_cache_bytes', 'Approximate size of cached stage results', ('reserve',))
+cache_entries = metrics.gauge(
+    'wildguard_stage_cache_entries', 'Number of cached stage results', ('reserve',))
+
+
+def _json_default(value):
+    """Serialize dict-like and list-like views (e.g. utils.tracks) by content"""
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, Sequence) and not isinstance(value, (str, bytes)):
+        return list(value)
+    return str(value)
+
+
+def content_hash(value):
+    """Stable hash of any JSON-serializable value"""
+    encoded = json.dumps(value, sort_keys=True, separators=(',', ':'), default=_json_default)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class StageCache:
+    """Thread-safe LRU cache with single-flight computation per key; name labels its metrics"""
+
+    def __init__(self, max_entries=None, max_bytes=None, name='global'):
+        self.name = name
+        self.max_entries = max_entries or int(os.getenv('STAGE_CACHE_MAX_ENTRIES', 256))
+        self.max_bytes = max_bytes or int(os.getenv('STAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def key(self, stage, inputs):
+        return f'{stage}:{content_hash(inputs)}'
+
+    def get(self, stage, inputs):
+        """Cached result for (stage, inputs), or None; never computes"""
+        key = self.key(stage, inputs)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        cache_requests.inc(stage=stage, result='hit')
+        return entry[0]
+
+    def put(self, stage, inputs, value):
+        """Store a result computed elsewhere (e.g. in a worker process)"""
+        self._store(self.key(stage, inputs), value)
+
+    def get_or_compute(self, stage, inputs, compute, cacheable=None):
+        """
+        Return the cached result for (stage, inputs) or compute and store it.
+
+        Concurrent callers with the same key wait for the first one instead of
+        repeating the work. cacheable(result) can veto storing a result
+        (e.g. an error payload).
+        """
+        key = self.key(stage, inputs)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    cache_requests.inc(stage=stage, result='hit')
+                    return entry[0]
+                waiter = self._in_flight.get(key)
+                if waiter is None:
+                    waiter = self._in_flight[key] = threading.Event()
+                    break
+            # Another request is computing this key; reuse its result
+            waiter.wait()
+
+        cache_requests.inc(stage=stage, result='miss')
+        try:
+            result = compute()
+            if cacheable is None or cacheable(result):
+                self._store(key, result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            waiter.set()
+
+    def _store(self, key, value):
+        size = len(json.dumps(value, separators=(',', ':'), default=_json_default))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+            cache_entries.set(len(self._entries), reserve=self.name)
+            cache_bytes.set(self._bytes, reserve=self.name)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            cache_entries.set(0, reserve=self.name)
+            cache_bytes.set(0, reserve=self.name)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes,
+                    'max_entries': self.max_entries, 'max_bytes': self.max_bytes}
+
+
+# Global instance
+stage_cache = StageCache()
@@ -0,0 +1,77 @@
+"""
+Helpers for streaming agent output to clients as Server-Sent Events
+"""
+import json
+import queue
+import threading
+
+
+class StreamCancelled(Exception):
+    """Raised inside the producer when the client has gone away"""
+
+
+def format_sse(event, data):
+    """Encode one Server-Sent Event frame"""
+    payload = json.dumps(data, separators=(',', ':'), default=str)
+    return f'event: {event}\ndata: {payload}\n\n'
+
+
+def run_agent_step(emit, agent, section, call):
+    """
+    Run one agent call, reporting progress through emit when streaming.
+
+    call receives an on_token callback (or None when not streaming) and
+    returns the agent's full text. The finished text is emitted as a section
+    event right away so clients can render it before later agents finish.
+    """
+    if emit is None:
+        return call(None)
+    emit('agent_start', {'agent': agent, 'section': section})
+    content = call(lambda text: emit('token', {'agent': agent, 'text': text}))
+    emit('section', {'agent': agent, 'section': section, 'content': content})
+    return content
+
+
+def stream_events(producer, max_buffer=1024):
+    """
+    Run producer(emit) in a worker thread and yield (event, data) as emitted.
+
+    The producer calls emit(event, data) for each event. When the consumer
+    stops iterating (client disconnect), the next emit raises StreamCancelled
+    so the producer stops making upstream calls nobody will read.
+    """
+    events = queue.Queue(maxsize=max_buffer)
+    cancelled = threading.Event()
+    done = object()
+
+    def emit(event, data):
+        if cancelled.is_set():
+            raise StreamCancelled()
+        events.put((event, data))
+
+    def run():
+        try:
+            producer(emit)
+        except StreamCancelled:
+            pass
+        except Exception as e:
+            events.put(('error', {'error': str(e)}))
+        finally:
+            events.put(done)
+
+    worker = threading.Thread(target=run, name='agent-stream', daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = events.get()
+            if item is done:
+                return
+            yield item
+    finally:
+        cancelled.set()
+        # Unblock a producer waiting on a full buffer
+        while not events.empty():
+            try:
+                events.get_nowait()
+            except queue.Empty:
+                break
@@ -0,0 +1,196 @@
+"""
+Delta sync for low-bandwidth field devices.
+
+Each reserve keeps a ChangeLog of fixes, alerts, hotspots, briefings and
+device observations. Every change gets a sequence number; the log is
+compacted by key, so an item changed several times is sent once, in its
+latest state. A sync token ("<checkpoint>.<log id>.<sequence>") names the
+last change a device has seen. The log id is per process; the checkpoint
+names the newest dataset version the device already holds in full, derived
+from the content-based dataset version so it means the same thing in every
+worker and after a restart. A token from another process resumes from this
+process's copy of that checkpoint (only the changes logged since are sent
+again). Tokens with an unknown checkpoint, from before trimmed history or
+that cannot be parsed trigger a full resync (reset: true).
+
+encode_delta packs a delta as: SYNC_MAGIC, a little-endian uint32 length,
+the zlib-compressed JSON of everything except fixes, then the fixes in the
+compact archive format of utils.trajectory.
+"""
+import hashlib
+import json
+import os
+import struct
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from utils import trajectory
+
+SYNC_MAGIC = b'WGS1'
+KINDS = ('fixes', 'alerts', 'hotspots', 'briefings', 'observations')
+
+_HEADER = struct.Struct('<I')
+
+
+def checkpoint_id(version):
+    """Short, process-independent name for a dataset version"""
+    return hashlib.sha1(str(version).encode('utf-8')).hexdigest()[:12]
+
+
+def _plain(payload):
+    """JSON-ready copy of a logged payload (fix views become dicts)"""
+    return dict(payload) if isinstance(payload, Mapping) else payload
+
+
+class ChangeLog:
+    """Thread-safe, key-compacted change log for one reserve"""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or int(os.getenv('SYNC_LOG_MAX_ENTRIES', 500000))
+        self.log_id = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._seq = 0
+        # Changes at or below floor may have been trimmed away
+        self._floor = 0
+        # (kind, key) -> (seq, payload, version), in sequence order; payload None marks a deletion
+        self._entries = OrderedDict()
+        # [(checkpoint id, seq)] of every fully recorded dataset version, oldest first
+        self._checkpoints = []
+
+    def checkpoint(self, version):
+        """Mark that everything of dataset version `version` is now in the log"""
+        with self._lock:
+            self._checkpoints.append((checkpoint_id(version), self._seq))
+
+    def token(self, seq=None):
+        seq = self._seq if seq is None else seq
+        checkpoint = next((cid for cid, at in reversed(self._checkpoints) if at <= seq), '')
+        return f'{checkpoint}.{self.log_id}.{seq}'
+
+    def _since(self, token):
+        """Sequence number a token refers to, or None when a full resync is needed"""
+        parts = (token or '').split('.')
+        if len(parts) != 3:
+            return None
+        checkpoint, log_id, seq = parts
+        if log_id == self.log_id:
+            if not seq.isdigit():
+                return None
+            seq = int(seq)
+        else:
+            # Another worker or an earlier run: resume from our copy of the checkpoint
+            seq = next((at for cid, at in reversed(self._checkpoints) if checkpoint and cid == checkpoint), None)
+            if seq is None:
+                return None
+        if seq < self._floor or seq > self._seq:
+            return None
+        return seq
+
+    def contains(self, kind, key):
+        entry = self._entries.get((kind, key))
+        return entry is not None and entry[1] is not None
+
+    def put_many(self, kind, items, version=None):
+        """
+        Record (key, payload) pairs; unchanged items are skipped. Returns the number recorded.
+
+        version(payload), when given, decides what counts as a change instead
+        of comparing whole payloads (e.g. to ignore an issue timestamp).
+        """
+        changed = 0
+        with self._lock:
+            for key, payload in items:
+                tag = version(payload) if version else None
+                entry = self._entries.get((kind, key))
+                if entry is not None and entry[1] is not None and (
+                        entry[2] == tag if version else entry[1] == payload):
+                    continue
+                self._seq += 1
+                self._entries[(kind, key)] = (self._seq, payload, tag)
+                self._entries.move_to_end((kind, key))
+                changed += 1
+            self._trim()
+        return changed
+
+    def put(self, kind, key, payload, version=None):
+        return self.put_many(kind, [(key, payload)], version) > 0
+
+    def delete_missing(self, kind, keys):
+        """Record deletions for every live key of kind not in keys"""
+        keys = set(keys)
+        with self._lock:
+            gone = [k for (entry_kind, k), (_, payload, _) in self._entries.items()
+                    if entry_kind == kind and payload is not None and k not in keys]
+            for key in gone:
+                self._seq += 1
+                self._entries[(kind, key)] = (self._seq, None, None)
+                self._entries.move_to_end((kind, key))
+        return len(gone)
+
+    def _trim(self):
+        while len(self._entries) > self.max_entries:
+            _, (seq, _, _) = self._entries.popitem(last=False)
+            self._floor = seq
+
+    def changes(self, token=None, limit=None):
+        """
+        Everything changed since token, oldest first.
+
+        With limit, at most that many changes are returned, the token points
+        at the last one and more is true until the device has caught up.
+        """
+        with self._lock:
+            since = self._since(token)
+            reset = since is None
+            since = since or 0
+            pending = []
+            for (kind, key), (seq, payload, _) in reversed(self._entries.items()):
+                if seq <= since:
+                    break
+                if reset and payload is None:
+                    continue
+                pending.append((seq, kind, key, payload))
+            current = self._seq
+        pending.reverse()
+        more = limit is not None and len(pending) > limit
+        if more:
+            pending = pending[:limit]
+            current = pending[-1][0]
+
+        delta = {kind: [] for kind in KINDS}
+        deleted = {}
+        for _, kind, key, payload in pending:
+            if payload is None:
+                deleted.setdefault(kind, []).append(key)
+            else:
+                delta[kind].append(_plain(payload))
+        delta.update(token=self.token(current), reset=reset, more=more, deleted=deleted)
+        return delta
+
+
+def encode_delta(delta):
+    """Compact binary form of a delta (see module docstring)"""
+    meta = {key: value for key, value in delta.items() if key != 'fixes'}
+    packed = zlib.compress(json.dumps(meta, separators=(',', ':'), default=str).encode('utf-8'), 9)
+    return SYNC_MAGIC + _HEADER.pack(len(packed)) + packed + trajectory.encode_fixes(delta.get('fixes', []))
+
+
+def decode_delta(blob):
+    """Inverse of encode_delta"""
+    if blob[:4] != SYNC_MAGIC:
+        raise ValueError('not a WildGuard sync payload')
+    (size,) = _HEADER.unpack_from(blob, 4)
+    start = 4 + _HEADER.size
+    delta = json.loads(zlib.decompress(blob[start:start + size]).decode('utf-8'))
+    delta['fixes'] = trajectory.decode_fixes(blob[start + size:])
+    return delta
+
+
+def decode_body(body, encoding=None):
+    """Parse an upload body: JSON, optionally gzip/zlib compressed"""
+    if encoding in ('gzip', 'deflate') or body[:1] in (b'\x1f', b'\x78'):
+        body = zlib.decompress(body, 47)  # 32 + 15: auto-detect gzip or zlib header
+    return json.loads(body.decode('utf-8'))
@@ -0,0 +1,43 @@
+"""Shared ISO-8601 timestamp parsing and formatting for fixes, alerts and incidents"""
+import os
+import time
+from datetime import datetime, timezone
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# How far ahead of the server clock a fix may be stamped (collar clock drift)
+MAX_CLOCK_SKEW_SECONDS = float(os.getenv('MAX_CLOCK_SKEW_SECONDS', 600))
+
+
+def parse_timestamp(value):
+    """
+    ISO-8601 (trailing Z allowed) or epoch number to epoch seconds.
+
+    Timestamps without an offset are read as UTC, like the collar feeds.
+    Raises TypeError or ValueError for anything else.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, str):
+        raise TypeError(f'timestamp must be a string, not {type(value).__name__}')
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def epoch_or_none(value):
+    """parse_timestamp, or None when value is missing or not a timestamp"""
+    try:
+        return parse_timestamp(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def format_timestamp(seconds):
+    # time.gmtime is several times cheaper than building an aware datetime
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(seconds))
+
+
+def is_future(epoch, now=None):
+    """Whether epoch seconds lie beyond the server clock plus MAX_CLOCK_SKEW_SECONDS"""
+    return epoch > (time.time() if now is None else now) + MAX_CLOCK_SKEW_SECONDS
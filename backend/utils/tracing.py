@@ -0,0 +1,269 @@
+"""
+Lightweight tracing and Prometheus-compatible metrics for WildGuard AI
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets (seconds) tuned for a mix of in-process stages and LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class for labelled metrics"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}'
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down (e.g. in-flight requests)"""
+
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Cumulative latency histogram"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def snapshot(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return dict(state, counts=list(state['counts'])) if state else None
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}'
+        ]
+        with self._lock:
+            items = sorted((key, dict(state, counts=list(state['counts']))) for key, state in self._values.items())
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ('le',), key + (_format_value(bound),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(state["sum"])}')
+            lines.append(f'{self.name}_count{labels} {state["count"]}')
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric and renders the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class Span:
+    """A single timed operation; attributes are kept for debugging only"""
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.attributes = {}
+        self.start = time.perf_counter()
+        self.duration = None
+        self.status = 'ok'
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+
+class Tracer:
+    """
+    Records spans as metrics and collects them per request for Server-Timing.
+
+    Every span feeds three series labelled by span name:
+    - wildguard_span_duration_seconds (histogram)
+    - wildguard_span_total (counter, with ok/error status)
+    - wildguard_span_in_flight (gauge)
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._local = threading.local()
+        self.span_duration = registry.histogram(
+            'wildguard_span_duration_seconds', 'Duration of traced pipeline stages', ('span',))
+        self.span_total = registry.counter(
+            'wildguard_span_total', 'Number of traced pipeline stages', ('span', 'status'))
+        self.span_in_flight = registry.gauge(
+            'wildguard_span_in_flight', 'Traced pipeline stages currently running', ('span',))
+
+    @contextmanager
+    def span(self, name, **labels):
+        span = Span(name, labels)
+        self.span_in_flight.inc(span=name)
+        try:
+            yield span
+        except Exception:
+            span.status = 'error'
+            raise
+        finally:
+            span.duration = time.perf_counter() - span.start
+            self.span_in_flight.dec(span=name)
+            self.span_duration.observe(span.duration, span=name)
+            self.span_total.inc(span=name, status=span.status)
+            collected = getattr(self._local, 'spans', None)
+            if collected is not None:
+                collected.append(span)
+
+    def traced(self, name):
+        """Decorator that wraps every call of a function in a span"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def start_request(self):
+        """Begin collecting spans for the current request thread"""
+        self._local.spans = []
+
+    def finish_request(self):
+        """Stop collecting and return the spans recorded for this request"""
+        spans = getattr(self._local, 'spans', None) or []
+        self._local.spans = None
+        return spans
+
+    @staticmethod
+    def server_timing(spans, total=None):
+        """Format spans as a Server-Timing header value"""
+        totals = {}
+        for span in spans:
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration
+        entries = [f'{name.replace(".", "-")};dur={duration * 1000:.1f}' for name, duration in totals.items()]
+        if total is not None:
+            entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+
+# Global instances
+metrics = MetricsRegistry()
+tracer = Tracer(metrics)
+
+llm_tokens = metrics.counter(
+    'wildguard_llm_tokens_total', 'LLM tokens consumed by agent calls', ('agent', 'direction'))
+http_requests = metrics.counter(
+    'wildguard_http_requests_total', 'HTTP requests served', ('endpoint', 'method', 'status'))
+http_latency = metrics.histogram(
+    'wildguard_http_request_duration_seconds', 'HTTP request latency', ('endpoint', 'method'))
+http_in_flight = metrics.gauge(
+    'wildguard_http_requests_in_flight', 'HTTP requests currently being served', ('endpoint',))
@@ -0,0 +1,311 @@
+"""
+Compact in-memory storage for collar fixes.
+
+A list of JSON dicts costs several hundred bytes per fix. TrackStore keeps
+each animal's fixes as typed array columns (epoch-second timestamps,
+coordinates, speed, heading) with the animal id interned once, and exposes
+every fix through FixView, a read-only Mapping with the original keys, so
+callers written against the list-of-dicts layout keep working. Mapping
+access costs a method call per field: loops over many fixes should read
+column() arrays, or materialize plain dicts once with to_list().
+
+Columns are stored exactly: ints mixed with floats share a float64 column
+that remembers which values were ints, a column falls back to a plain list
+when it holds anything else (e.g. None or missing keys), and
+timestamps stay strings when they would not round-trip through epoch
+seconds. Keys outside the standard fields are kept per fix.
+"""
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+
+from utils.timestamps import parse_timestamp, epoch_or_none, format_timestamp
+
+FIELDS = ('rhino_id', 'timestamp_utc', 'latitude', 'longitude', 'speed_kmh', 'heading')
+COLUMNS = FIELDS[2:]
+_COLUMN_NAMES = frozenset(COLUMNS)
+
+
+class _Missing:
+    """Marks a key absent from a fix; pickles as the module singleton"""
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return '_MISSING'
+
+    def __repr__(self):
+        return '<missing>'
+
+
+_MISSING = _Missing()
+
+
+def _to_epoch(value):
+    """Epoch seconds if value is a canonical UTC timestamp string, else None"""
+    if not isinstance(value, str):
+        return None
+    try:
+        seconds = int(parse_timestamp(value))
+    except ValueError:
+        return None
+    return seconds if format_timestamp(seconds) == value else None
+
+
+class NumberColumn(Sequence):
+    """
+    float64 column for a mix of ints and floats (e.g. speed 0 and 2.3);
+    a byte per fix flags the ints so every value reads back with its type
+    """
+
+    __slots__ = ('values', 'ints')
+
+    def __init__(self, values):
+        self.values = array('d', values)
+        self.ints = bytearray(type(v) is int for v in values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        value = self.values[i]
+        return int(value) if self.ints[i] else value
+
+    def __iter__(self):
+        for value, is_int in zip(self.values, self.ints):
+            yield int(value) if is_int else value
+
+
+def _pack(values):
+    """
+    Typed array when every value is an int or every value is a float, a
+    NumberColumn when they mix, else a list
+    """
+    if not values:
+        return values
+    types = {type(v) for v in values}
+    if types == {int}:
+        try:
+            return array('q', values)
+        except OverflowError:
+            return values
+    if types == {float}:
+        return array('d', values)
+    if types == {int, float} and all(abs(v) <= 2 ** 53 for v in values if type(v) is int):
+        return NumberColumn(values)
+    return values
+
+
+class Track(Sequence):
+    """One animal's fixes, in load order, as columns"""
+
+    __slots__ = ('rhino_id', 'epochs', 'timestamps', 'latitude', 'longitude', 'speed_kmh', 'heading', 'extras')
+
+    def __init__(self, rhino_id, records):
+        self.rhino_id = sys.intern(rhino_id) if isinstance(rhino_id, str) else rhino_id
+        stamps = [r.get('timestamp_utc', _MISSING) for r in records]
+        epochs = [_to_epoch(s) for s in stamps]
+        if all(e is not None for e in epochs):
+            self.epochs = array('q', epochs)
+            self.timestamps = None
+        else:
+            self.epochs = None
+            self.timestamps = stamps
+        for name in COLUMNS:
+            setattr(self, name, _pack([r.get(name, _MISSING) for r in records]))
+        extras = {}
+        for i, record in enumerate(records):
+            if len(record) > len(FIELDS) or any(k not in FIELDS for k in record):
+                extra = {k: v for k, v in record.items() if k not in FIELDS}
+                if extra:
+                    extras[i] = extra
+        self.extras = extras or None
+
+    def __len__(self):
+        return len(self.latitude)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [FixView(self, j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return FixView(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield FixView(self, i)
+
+    def column(self, name, default=None):
+        """Raw column values (missing entries replaced by default)"""
+        if name == 'timestamp_utc':
+            if self.epochs is not None:
+                return [format_timestamp(s) for s in self.epochs]
+            return [default if v is _MISSING else v for v in self.timestamps]
+        values = getattr(self, name)
+        if isinstance(values, array):
+            return values
+        if isinstance(values, NumberColumn):
+            return values.values
+        return [default if v is _MISSING else v for v in values]
+
+    def records(self):
+        """Every fix as a plain dict (keys as FixView yields them), built column-wise"""
+        stamps = self.column('timestamp_utc', _MISSING)
+        columns = [stamps] + [getattr(self, name) for name in COLUMNS]
+        sparse = self.rhino_id is _MISSING or any(
+            isinstance(values, list) and any(v is _MISSING for v in values) for values in columns)
+        if sparse:
+            fields = FIELDS[1:]
+            records = []
+            for row in zip(*columns):
+                record = {} if self.rhino_id is _MISSING else {'rhino_id': self.rhino_id}
+                for name, value in zip(fields, row):
+                    if value is not _MISSING:
+                        record[name] = value
+                records.append(record)
+        else:
+            rid = self.rhino_id
+            records = [dict(zip(FIELDS, (rid,) + row)) for row in zip(*columns)]
+        if self.extras:
+            for i, extra in self.extras.items():
+                records[i].update(extra)
+        return records
+
+    def value(self, i, name):
+        """Field value of fix i, or _MISSING"""
+        if name == 'rhino_id':
+            return self.rhino_id
+        if name == 'timestamp_utc':
+            return format_timestamp(self.epochs[i]) if self.epochs is not None else self.timestamps[i]
+        if name in COLUMNS:
+            return getattr(self, name)[i]
+        if self.extras and i in self.extras:
+            return self.extras[i].get(name, _MISSING)
+        return _MISSING
+
+
+class FixView(Mapping):
+    """Read-only dict-like view of one fix"""
+
+    __slots__ = ('_track', '_i')
+
+    def __init__(self, track, i):
+        self._track = track
+        self._i = i
+
+    def __getitem__(self, key):
+        if key in _COLUMN_NAMES:
+            value = getattr(self._track, key)[self._i]
+        else:
+            value = self._track.value(self._i, key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        if key in _COLUMN_NAMES:
+            value = getattr(self._track, key)[self._i]
+        else:
+            value = self._track.value(self._i, key)
+        return default if value is _MISSING else value
+
+    def __iter__(self):
+        for name in FIELDS:
+            if self._track.value(self._i, name) is not _MISSING:
+                yield name
+        if self._track.extras and self._i in self._track.extras:
+            yield from self._track.extras[self._i]
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    @property
+    def epoch(self):
+        """Timestamp as epoch seconds (parsed once at load)"""
+        track = self._track
+        if track.epochs is not None:
+            return track.epochs[self._i]
+        value = track.timestamps[self._i]
+        return epoch_or_none(value) if isinstance(value, str) else None
+
+    def __repr__(self):
+        return f'FixView({dict(self)!r})'
+
+
+class TrackStore(Sequence):
+    """
+    All fixes of a dataset, grouped into per-animal Tracks.
+
+    Indexing and iteration follow the original record order and yield
+    FixViews; by_animal maps each animal id to its Track.
+    """
+
+    __slots__ = ('by_animal', '_tracks', '_animal', '_pos')
+
+    def __init__(self, records):
+        grouped = {}
+        animal = array('I')
+        pos = array('I')
+        for record in records:
+            rid = record.get('rhino_id', _MISSING)
+            group = grouped.get(rid)
+            if group is None:
+                group = grouped[rid] = (len(grouped), [])
+            animal.append(group[0])
+            pos.append(len(group[1]))
+            group[1].append(record)
+        self._tracks = [Track(rid, members) for rid, (_, members) in grouped.items()]
+        self.by_animal = {None if t.rhino_id is _MISSING else t.rhino_id: t for t in self._tracks}
+        self._animal = animal
+        self._pos = pos
+
+    def __len__(self):
+        return len(self._animal)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return FixView(self._tracks[self._animal[i]], self._pos[i])
+
+    def __iter__(self):
+        tracks = self._tracks
+        for a, p in zip(self._animal, self._pos):
+            yield FixView(tracks[a], p)
+
+    def to_list(self):
+        """Materialize plain dicts in the original order (e.g. for JSON responses or per-fix loops)"""
+        per_track = [track.records() for track in self._tracks]
+        return [per_track[a][p] for a, p in zip(self._animal, self._pos)]
+
+
+def group_by_animal(records):
+    """rhino_id -> fixes, using the prebuilt index when records is a TrackStore"""
+    if isinstance(records, TrackStore):
+        return records.by_animal
+    grouped = {}
+    for record in records:
+        grouped.setdefault(record.get('rhino_id'), []).append(record)
+    return grouped
+
+
+def column(track, name, default=None):
+    """One field across a track's fixes, from the array column when available"""
+    if isinstance(track, Track):
+        return track.column(name, default)
+    return [record.get(name, default) for record in track]
+
+
+def epoch_column(track):
+    """Epoch seconds of each fix in a track (None where unreadable), parsed once at load for a Track"""
+    if isinstance(track, Track) and track.epochs is not None:
+        return track.epochs
+    return [epoch_or_none(value) for value in column(track, 'timestamp_utc')]
+
+
+def plain_records(records):
+    """Plain dicts for loops that touch every field of every fix: one to_list() for a TrackStore"""
+    return records.to_list() if isinstance(records, TrackStore) else records
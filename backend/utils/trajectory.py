@@ -0,0 +1,429 @@
+"""
+Trajectory simplification and compact archive encoding for collar tracks.
+
+Simplification works per animal on column arrays (projected x/y in metres
+and epoch seconds, read from the TrackStore columns when available) with a time-aware error bound: a fix may be dropped only
+if its position is within tolerance of where the animal would be, at the
+same instant, moving linearly between the kept neighbours (synchronized
+Euclidean distance). Fixes flagged as anomalies are always kept exactly.
+
+The archive format is lossless: numeric columns are stored as
+delta-encoded, zigzag varint fixed-point integers and the result is zlib
+compressed, falling back to raw values for any column that would not
+round-trip exactly.
+"""
+import heapq
+import json
+import math
+import struct
+import zlib
+from array import array
+
+from utils.geo import KM_PER_DEGREE
+from utils.timestamps import parse_timestamp, epoch_or_none, format_timestamp
+from utils.tracks import FixView, group_by_animal, column, epoch_column, plain_records
+
+EARTH_METRES_PER_DEGREE = KM_PER_DEGREE * 1000
+# Web-mercator ground resolution at zoom 0 on the equator (metres per pixel)
+MERCATOR_METRES_PER_PIXEL = 156543.03392
+
+ARCHIVE_MAGIC = b'WGT3'
+STANDARD_FIELDS = ('rhino_id', 'timestamp_utc', 'latitude', 'longitude', 'speed_kmh', 'heading')
+
+
+def tolerance_for_zoom(zoom, latitude=0.0, pixels=1.0):
+    """Ground distance (metres) covered by `pixels` screen pixels at a map zoom"""
+    return pixels * MERCATOR_METRES_PER_PIXEL * math.cos(math.radians(latitude)) / (2 ** zoom)
+
+
+def _time_key(record):
+    """Sort key putting fixes in time order whatever the timestamp type; unreadable timestamps last"""
+    epoch = record.epoch if isinstance(record, FixView) else epoch_or_none(record.get('timestamp_utc'))
+    return (epoch is None, epoch or 0.0)
+
+
+def group_tracks(records):
+    """Group fixes by animal, each track sorted by timestamp"""
+    tracks = {}
+    for record in records:
+        tracks.setdefault(record.get('rhino_id'), []).append(record)
+    for track in tracks.values():
+        track.sort(key=_time_key)
+    return tracks
+
+
+def _track_columns(track):
+    """Latitude, longitude and epoch-second columns of one animal's fixes (array columns when available)"""
+    return column(track, 'latitude'), column(track, 'longitude'), epoch_column(track)
+
+
+def _project(lats, lons, epochs, indices):
+    """Metre-based x/y arrays and epoch-second times of the fixes at indices"""
+    scale_x = EARTH_METRES_PER_DEGREE * math.cos(math.radians(lats[indices[0]]))
+    xs = array('d', (lons[i] * scale_x for i in indices))
+    ys = array('d', (lats[i] * EARTH_METRES_PER_DEGREE for i in indices))
+    ts = array('d', (epochs[i] for i in indices))
+    return xs, ys, ts
+
+
+def _sed(xs, ys, ts, i, a, b):
+    """Distance from fix i to the time-synchronized point between fixes a and b"""
+    span = ts[b] - ts[a]
+    ratio = (ts[i] - ts[a]) / span if span > 0 else 0.0
+    px = xs[a] + (xs[b] - xs[a]) * ratio
+    py = ys[a] + (ys[b] - ys[a]) * ratio
+    return math.hypot(xs[i] - px, ys[i] - py)
+
+
+def douglas_peucker(xs, ys, ts, tolerance, keep=()):
+    """
+    Indices retained by a time-aware (SED) Douglas-Peucker pass.
+
+    Iterative to avoid recursion limits on long tracks. Indices in keep split
+    the track into independently simplified segments.
+    """
+    n = len(xs)
+    if n <= 2:
+        return list(range(n))
+    anchors = sorted(set(keep) | {0, n - 1})
+    retained = set(anchors)
+    stack = list(zip(anchors, anchors[1:]))
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        worst, worst_dist = None, tolerance
+        for i in range(a + 1, b):
+            dist = _sed(xs, ys, ts, i, a, b)
+            if dist > worst_dist:
+                worst, worst_dist = i, dist
+        if worst is not None:
+            retained.add(worst)
+            stack.append((a, worst))
+            stack.append((worst, b))
+    return sorted(retained)
+
+
+def visvalingam(xs, ys, ts, tolerance, keep=()):
+    """
+    Indices retained by Visvalingam-Whyatt with a time-aware guard.
+
+    Points are removed smallest effective area first while their area is
+    below tolerance**2 / 2 and their SED to the current neighbours stays
+    within tolerance.
+    """
+    n = len(xs)
+    if n <= 2:
+        return list(range(n))
+    pinned = set(keep) | {0, n - 1}
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    removed = [False] * n
+    max_area = tolerance * tolerance / 2
+
+    def area(i):
+        a, b = prev[i], nxt[i]
+        return abs((xs[a] - xs[i]) * (ys[b] - ys[i]) - (xs[b] - xs[i]) * (ys[a] - ys[i])) / 2
+
+    heap = [(area(i), i) for i in range(1, n - 1) if i not in pinned]
+    heapq.heapify(heap)
+    while heap:
+        current, i = heapq.heappop(heap)
+        if removed[i] or current != area(i):
+            continue  # stale entry
+        if current > max_area:
+            break
+        if _sed(xs, ys, ts, i, prev[i], nxt[i]) > tolerance:
+            continue
+        removed[i] = True
+        a, b = prev[i], nxt[i]
+        nxt[a], prev[b] = b, a
+        for j in (a, b):
+            if j not in pinned and not removed[j]:
+                heapq.heappush(heap, (area(j), j))
+    return [i for i in range(n) if not removed[i]]
+
+
+def _viewport_runs(lats, lons, order, bbox):
+    """
+    (start, end) slices of order covering each run of fixes inside bbox plus
+    one neighbour on either side, so lines still leave the screen; runs
+    that touch are merged
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    runs = []
+    start = None
+    for k, i in enumerate(order):
+        inside = min_lon <= lons[i] <= max_lon and min_lat <= lats[i] <= max_lat
+        if inside and start is None:
+            start = max(k - 1, 0)
+        elif not inside and start is not None:
+            runs.append([start, k + 1])
+            start = None
+    if start is not None:
+        runs.append([start, len(order)])
+    merged = []
+    for run in runs:
+        if merged and run[0] <= merged[-1][1]:
+            merged[-1][1] = run[1]
+        else:
+            merged.append(run)
+    return merged
+
+
+def simplify_tracks(records, tolerance, method='dp', anomalies=(), bbox=None):
+    """
+    Simplify every animal's track and return the retained original fixes.
+
+    tolerance is in metres (see tolerance_for_zoom). anomalies is an iterable
+    of (rhino_id, timestamp) pairs that must survive unchanged. With bbox
+    (min_lon, min_lat, max_lon, max_lat), only the runs of fixes inside the
+    viewport and one neighbour on either side of each run (so lines still
+    leave the screen) are returned. Fixes without a numeric position or a
+    readable timestamp cannot be placed on the map and are left out.
+    Fixes are returned as plain dicts in time order per animal.
+    """
+    simplify = visvalingam if method == 'visvalingam' else douglas_peucker
+    pinned = {(rid, epoch_or_none(timestamp)) for rid, timestamp in anomalies}
+    result = []
+    for rid, track in group_by_animal(records).items():
+        lats, lons, epochs = _track_columns(track)
+        order = [i for i in range(len(lats))
+                 if _is_number(lats[i]) and _is_number(lons[i]) and epochs[i] is not None]
+        order.sort(key=epochs.__getitem__)
+        runs = _viewport_runs(lats, lons, order, bbox) if bbox is not None else [(0, len(order))]
+        for start, end in runs:
+            indices = order[start:end]
+            if tolerance > 0 and len(indices) > 2:
+                keep = [k for k, i in enumerate(indices) if (rid, epochs[i]) in pinned]
+                xs, ys, ts = _project(lats, lons, epochs, indices)
+                indices = [indices[k] for k in simplify(xs, ys, ts, tolerance, keep)]
+            result.extend(dict(track[i]) for i in indices)
+    return result
+
+
+# ==================== COMPACT ARCHIVE FORMAT ====================
+
+MODE_FIXED = 0   # delta + zigzag varint of round(value * 10**decimals)
+MODE_FLOAT = 1   # raw little-endian float64
+MODE_JSON = 2    # JSON list (strings, None, mixed types)
+
+# Timestamp columns: ISO strings stored as epoch seconds, or the values as given
+TS_EPOCH = 0
+TS_RAW = 1
+
+# Numeric columns record whether values were ints or floats (0 vs 0.0)
+NUM_FLOAT = 0
+NUM_INT = 1
+NUM_MIXED = 2    # followed by a bitmap, bit set where the value is an int
+
+
+def _write_varint(out, value):
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return value // 2 if not value & 1 else -(value + 1) // 2
+
+
+def _decimals_needed(values, limit=9):
+    """Smallest decimal count that reproduces every value exactly, or None"""
+    for decimals in range(limit + 1):
+        factor = 10 ** decimals
+        if all(round(v * factor) / factor == v for v in values):
+            return decimals
+    return None
+
+
+def _is_number(value):
+    """Numbers the fixed-point and float64 modes reproduce exactly"""
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return abs(value) <= 2 ** 53
+    return isinstance(value, float) and math.isfinite(value)
+
+
+def _encode_kinds(out, values):
+    ints = [isinstance(v, int) for v in values]
+    if all(ints):
+        out.append(NUM_INT)
+    elif not any(ints):
+        out.append(NUM_FLOAT)
+    else:
+        out.append(NUM_MIXED)
+        bitmap = bytearray((len(values) + 7) // 8)
+        for i, is_int in enumerate(ints):
+            if is_int:
+                bitmap[i // 8] |= 1 << (i % 8)
+        out.extend(bitmap)
+
+
+def _decode_kinds(data, pos, count):
+    """Per-value int flags written by _encode_kinds"""
+    kind = data[pos]
+    pos += 1
+    if kind != NUM_MIXED:
+        return [kind == NUM_INT] * count, pos
+    size = (count + 7) // 8
+    bitmap = data[pos:pos + size]
+    return [bool(bitmap[i // 8] >> (i % 8) & 1) for i in range(count)], pos + size
+
+
+def _encode_column(out, values):
+    numeric = all(_is_number(v) for v in values)
+    decimals = _decimals_needed(values) if numeric else None
+    if decimals is not None:
+        out.append(MODE_FIXED)
+        out.append(decimals)
+        _encode_kinds(out, values)
+        factor = 10 ** decimals
+        previous = 0
+        for value in values:
+            scaled = round(value * factor)
+            _write_varint(out, _zigzag(scaled - previous))
+            previous = scaled
+    elif numeric:
+        out.append(MODE_FLOAT)
+        _encode_kinds(out, values)
+        out.extend(struct.pack(f'<{len(values)}d', *values))
+    else:
+        out.append(MODE_JSON)
+        blob = json.dumps(values, separators=(',', ':')).encode('utf-8')
+        _write_varint(out, len(blob))
+        out.extend(blob)
+
+
+def _decode_column(data, pos, count):
+    mode = data[pos]
+    pos += 1
+    if mode == MODE_FIXED:
+        decimals = data[pos]
+        ints, pos = _decode_kinds(data, pos + 1, count)
+        factor = 10 ** decimals
+        values, current = [], 0
+        for is_int in ints:
+            delta, pos = _read_varint(data, pos)
+            current += _unzigzag(delta)
+            values.append(current // factor if is_int else current / factor)
+        return values, pos
+    if mode == MODE_FLOAT:
+        ints, pos = _decode_kinds(data, pos, count)
+        size = 8 * count
+        values = struct.unpack(f'<{count}d', bytes(data[pos:pos + size]))
+        return [int(v) if is_int else v for v, is_int in zip(values, ints)], pos + size
+    length, pos = _read_varint(data, pos)
+    return json.loads(bytes(data[pos:pos + length]).decode('utf-8')), pos + length
+
+
+def _timestamp_column(track):
+    """
+    (TS_EPOCH, epoch seconds) when every timestamp is an ISO string that
+    formats back exactly, else (TS_RAW, the values as given)
+    """
+    values = [r.get('timestamp_utc') for r in track]
+    if not all(isinstance(v, str) for v in values):
+        return TS_RAW, values
+    try:
+        seconds = [int(parse_timestamp(v)) for v in values]
+    except ValueError:
+        return TS_RAW, values
+    if all(format_timestamp(s) == v for s, v in zip(seconds, values)):
+        return TS_EPOCH, seconds
+    return TS_RAW, values
+
+
+def encode_fixes(records):
+    """
+    Encode fixes into the compact, lossless archive format.
+
+    Decoding returns the same fixes grouped by animal in timestamp order,
+    with every value of its original type (an epoch-number timestamp stays
+    a number). Non-standard keys are preserved in a per-record side table.
+    """
+    out = bytearray()
+    tracks = group_tracks(plain_records(records))
+    _write_varint(out, len(tracks))
+    for rid, track in tracks.items():
+        rid_blob = json.dumps(rid).encode('utf-8')
+        _write_varint(out, len(rid_blob))
+        out.extend(rid_blob)
+        _write_varint(out, len(track))
+        ts_kind, timestamps = _timestamp_column(track)
+        out.append(ts_kind)
+        _encode_column(out, timestamps)
+        for field in STANDARD_FIELDS[2:]:
+            _encode_column(out, [r.get(field) for r in track])
+        extras = {
+            i: {k: v for k, v in r.items() if k not in STANDARD_FIELDS}
+            for i, r in enumerate(track)
+        }
+        extras = {i: e for i, e in extras.items() if e}
+        missing = {
+            field: [i for i, r in enumerate(track) if field not in r]
+            for field in STANDARD_FIELDS
+        }
+        missing = {field: idx for field, idx in missing.items() if idx}
+        side = json.dumps({'extras': extras, 'missing': missing}, separators=(',', ':')).encode('utf-8') \
+            if extras or missing else b''
+        _write_varint(out, len(side))
+        out.extend(side)
+    return ARCHIVE_MAGIC + zlib.compress(bytes(out), 9)
+
+
+def decode_fixes(blob):
+    """Inverse of encode_fixes"""
+    if not blob.startswith(ARCHIVE_MAGIC):
+        raise ValueError('Not a WildGuard track archive')
+    data = memoryview(zlib.decompress(blob[len(ARCHIVE_MAGIC):]))
+    pos = 0
+    n_tracks, pos = _read_varint(data, pos)
+    records = []
+    for _ in range(n_tracks):
+        length, pos = _read_varint(data, pos)
+        rid = json.loads(bytes(data[pos:pos + length]).decode('utf-8'))
+        pos += length
+        count, pos = _read_varint(data, pos)
+        ts_kind = data[pos]
+        pos += 1
+        columns = []
+        for _ in STANDARD_FIELDS[1:]:
+            values, pos = _decode_column(data, pos, count)
+            columns.append(values)
+        length, pos = _read_varint(data, pos)
+        side = json.loads(bytes(data[pos:pos + length]).decode('utf-8')) if length else {}
+        pos += length
+        if ts_kind == TS_EPOCH:
+            columns[0] = [format_timestamp(s) for s in columns[0]]
+        missing = {field: set(idx) for field, idx in side.get('missing', {}).items()}
+        extras = side.get('extras', {})
+        for i in range(count):
+            record = {} if i in missing.get('rhino_id', ()) else {'rhino_id': rid}
+            for field, values in zip(STANDARD_FIELDS[1:], columns):
+                if i not in missing.get(field, ()):
+                    record[field] = values[i]
+            record.update(extras.get(str(i), {}))
+            records.append(record)
+    return records